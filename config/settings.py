@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'pos.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,15 +56,23 @@ ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # The Django backend, with every render timed for the request metrics.
+        'BACKEND': 'pos.metrics.TimedDjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Compile each template once per process; the development server
+            # still reloads them when a file changes.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -76,10 +86,135 @@ WSGI_APPLICATION = 'config.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('POS_DB_NAME', BASE_DIR / 'db.sqlite3'),
     }
 }
 
+# POS_DB_PROFILE=production tunes SQLite for several gunicorn workers:
+# WAL so readers never block the writer, IMMEDIATE transactions so writers
+# queue on the busy timeout instead of failing on lock upgrade, and
+# persistent connections so the pragmas are paid once per connection.
+
+POS_DB_PROFILE = os.environ.get('POS_DB_PROFILE', 'default')
+
+SQLITE_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=20000',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA cache_size=-65536',
+    'PRAGMA temp_store=MEMORY',
+]
+
+if POS_DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': '; '.join(SQLITE_PRAGMAS),
+        },
+    })
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# POS_CACHE selects the backend: file (default), redis for a local
+# Redis-compatible server (needs the redis package), or locmem. The web
+# processes and run_pos_worker must share the cache, or they never see
+# each other's invalidations; locmem is for a single process and both the
+# worker and the production profile refuse it (pos.checks).
+
+POS_CACHE = os.environ.get('POS_CACHE', 'file')
+
+if POS_CACHE == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('POS_CACHE_LOCATION', 'redis://127.0.0.1:6379'),
+        }
+    }
+elif POS_CACHE == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('POS_CACHE_LOCATION', str(BASE_DIR / 'cache')),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Rendered table rows (pos.fragments) live in their own cache so that row
+# churn never evicts the analytics keys; a 10k-row page needs room for
+# every row.
+CACHES['fragments'] = {**CACHES['default'], 'KEY_PREFIX': 'fragments'}
+if POS_CACHE == 'locmem':
+    CACHES['fragments'].update({'LOCATION': 'fragments', 'OPTIONS': {'MAX_ENTRIES': 100_000}})
+elif POS_CACHE == 'file':
+    CACHES['fragments'].update({
+        'LOCATION': os.path.join(CACHES['default']['LOCATION'], 'fragments'),
+        'OPTIONS': {'MAX_ENTRIES': 100_000},
+    })
+
+
+# Request metrics
+# The per-view histogram is always kept in memory; set POS_METRICS_PROMETHEUS=1
+# to also serve it as Prometheus text at /metrics/prometheus/. Staff users
+# may read it; a scraper sends "Authorization: Bearer <POS_METRICS_TOKEN>".
+
+POS_METRICS_PROMETHEUS = os.environ.get('POS_METRICS_PROMETHEUS') == '1'
+POS_METRICS_TOKEN = os.environ.get('POS_METRICS_TOKEN', '')
+
+
+# API keys
+# Tills syncing offline sales post to /api/sync/sales/ with the header
+# "Authorization: Bearer <POS_SYNC_KEY>" instead of a CSRF token. While the
+# key is empty the endpoint refuses every request. Change feed consumers
+# read /api/events/ the same way with POS_FEED_KEY.
+
+POS_SYNC_KEY = os.environ.get('POS_SYNC_KEY', '')
+POS_FEED_KEY = os.environ.get('POS_FEED_KEY', '')
+
+
+# Inventory costing
+# FIFO prices each sale from the oldest deliveries still on the shelf;
+# AVERAGE uses the weighted-average cost of the stock on hand. Changing it
+# only affects new sales until `manage.py revalue` replays history.
+
+POS_COSTING_METHOD = os.environ.get('POS_COSTING_METHOD', 'FIFO')
+
+
+# Background jobs
+# Reports, exports and imports are queued in the Job table and run by
+# `manage.py run_pos_worker`. Uploaded imports and finished exports are
+# kept under POS_JOB_DIR.
+
+POS_JOB_DIR = os.environ.get('POS_JOB_DIR', str(BASE_DIR / 'jobs'))
+
+
+# Printed documents
+# Receipts, invoices and statements are rendered by the job worker and
+# kept under POS_DOCUMENT_DIR, named by a hash of their content.
+
+POS_DOCUMENT_DIR = os.environ.get('POS_DOCUMENT_DIR', str(BASE_DIR / 'documents'))
+POS_SHOP_NAME = os.environ.get('POS_SHOP_NAME', 'Maks Hardware')
+
+
+# Reorder suggestions
+# Sales velocity is measured over the last POS_REORDER_WINDOW_DAYS. A product
+# is reordered once its stock would not last the supplier lead time plus
+# safety stock, and the suggestion tops it up to cover POS_REORDER_COVER_DAYS
+# more.
+
+POS_REORDER_WINDOW_DAYS = int(os.environ.get('POS_REORDER_WINDOW_DAYS', 90))
+POS_REORDER_LEAD_DAYS = int(os.environ.get('POS_REORDER_LEAD_DAYS', 7))
+POS_REORDER_COVER_DAYS = int(os.environ.get('POS_REORDER_COVER_DAYS', 14))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
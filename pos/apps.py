@@ -1,6 +1,33 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
 
 
 class PosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pos'
+
+    def ready(self):
+        from .search import ensure_search_triggers
+        post_migrate.connect(ensure_search_triggers, sender=self)
+        from . import tasks  # noqa: F401 -- registers the background job tasks
+        from . import checks  # noqa: F401 -- registers the system checks
+        from .metrics import watch
+        connection_created.connect(watch)
+
+        from . import fragments
+        for model, receiver in (('Product', fragments.product_saved), ('Sale', fragments.sale_saved),
+                                ('Customer', fragments.customer_saved)):
+            post_save.connect(receiver, sender=f'pos.{model}')
+            post_delete.connect(receiver, sender=f'pos.{model}')
+
+        from . import catalog
+        post_save.connect(catalog.product_saved, sender='pos.Product')
+        post_delete.connect(catalog.product_saved, sender='pos.Product')
+
+        from . import branches
+        post_save.connect(branches.opening_stock, sender='pos.Product')
+
+        from . import events
+        post_save.connect(events.product_saved, sender='pos.Product')
+        post_delete.connect(events.product_saved, sender='pos.Product')
@@ -0,0 +1,72 @@
+from django.db import connection, transaction
+
+from . import periods
+from .models import ArchivedPayment, ArchivedSale, ArchivedStockIn, Payment, Sale, StockIn
+from .services import retry_on_lock
+
+# Moves the settled rows of closed months (see pos.periods) out of the live
+# Sale, Payment and StockIn tables into their Archived* copies, so the hot
+# tables only hold the open period. Each chunk is its own short transaction
+# and rows keep their ids. Unpaid credit and cost layers with units left
+# stay live however old they are.
+
+ARCHIVE_CHUNK_SIZE = 2000
+
+
+def _move(model, archive_model, column, ids):
+    """Copy the ``model`` rows whose ``column`` is in ``ids`` to ``archive_model``, then delete them."""
+    quote = connection.ops.quote_name
+    source, target = quote(model._meta.db_table), quote(archive_model._meta.db_table)
+    columns = ', '.join(quote(field.column) for field in archive_model._meta.concrete_fields)
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {target} ({columns}) SELECT {columns} FROM {source} WHERE {column} IN ({placeholders})",
+            ids
+        )
+        cursor.execute(f"DELETE FROM {source} WHERE {column} IN ({placeholders})", ids)
+
+
+def _move_sales(ids):
+    # Their payments first: Payment.sale is enforced on the live table.
+    _move(Payment, ArchivedPayment, 'sale_id', ids)
+    _move(Sale, ArchivedSale, 'id', ids)
+
+
+def _plans(before):
+    """``(label, rows to move, mover)``, each queryset served by a date index."""
+    return [
+        ('sales', Sale.objects.filter(status='COMPLETED', date__lt=before).order_by('date'), _move_sales),
+        ('receipt payments',
+         Payment.objects.filter(sale__isnull=True, receipt__status='COMPLETED', date__lt=before).order_by('date'),
+         lambda ids: _move(Payment, ArchivedPayment, 'id', ids)),
+        ('stock deliveries', StockIn.objects.filter(remaining_quantity=0, date__lt=before).order_by('date'),
+         lambda ids: _move(StockIn, ArchivedStockIn, 'id', ids)),
+    ]
+
+
+@retry_on_lock
+def _chunk(rows, mover, chunk_size):
+    with transaction.atomic():
+        ids = list(rows.values_list('id', flat=True)[:chunk_size])
+        if ids:
+            mover(ids)
+    return len(ids)
+
+
+def archive(chunk_size=ARCHIVE_CHUNK_SIZE, stdout=None):
+    """Archive every settled row dated before ``periods.boundary()``; return ``{label: rows moved}``."""
+    before = periods.boundary_start()
+    if before is None:
+        return {}
+    moved = {}
+    for label, rows, mover in _plans(before):
+        moved[label] = 0
+        while True:
+            count = _chunk(rows, mover, chunk_size)
+            moved[label] += count
+            if count and stdout:
+                stdout.write(f"  {moved[label]} {label} archived")
+            if count < chunk_size:
+                break
+    return moved
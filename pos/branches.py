@@ -0,0 +1,69 @@
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from . import movements
+from .models import MAIN_BRANCH, Branch, BranchStock, StockMovement
+
+# Branches (shops). Each holds its own stock in BranchStock, and
+# Product.stock_quantity is the total over all of them, moved by the same
+# write, so the catalogue, low-stock and reorder views keep reading one
+# number. Sales, receipts, deliveries, movements and the daily rollups carry
+# their branch and have indexes leading on it, so a report for one branch
+# never reads another's rows. Cost layers stay shared: deliveries to every
+# branch feed one FIFO per product.
+
+NAMES_KEY = 'branches:names'
+
+
+def names():
+    """``{id: name}`` of every branch, cached until a branch is added."""
+    found = cache.get(NAMES_KEY)
+    if found is None:
+        found = dict(Branch.objects.order_by('pk').values_list('pk', 'name'))
+        cache.set(NAMES_KEY, found, timeout=None)
+    return found
+
+
+async def anames():
+    """``names`` for async views."""
+    found = await cache.aget(NAMES_KEY)
+    if found is None:
+        found = {pk: name async for pk, name in Branch.objects.order_by('pk').values_list('pk', 'name')}
+        await cache.aset(NAMES_KEY, found, timeout=None)
+    return found
+
+
+def create(name, code):
+    with transaction.atomic():
+        branch = Branch.objects.create(name=name, code=code)
+        transaction.on_commit(lambda: cache.delete(NAMES_KEY))
+    return branch
+
+
+def add_stock(branch_id, quantities):
+    """Add ``{product id: units}`` to the branch's stock with one ``INSERT ... ON CONFLICT``."""
+    quantities = {pk: qty for pk, qty in quantities.items() if qty}
+    if not quantities:
+        return
+    table = connection.ops.quote_name(BranchStock._meta.db_table)
+    placeholders = ', '.join(['(%s, %s, %s)'] * len(quantities))
+    params = []
+    for pk, qty in quantities.items():
+        params += [branch_id, pk, qty]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (branch_id, product_id, quantity) VALUES {placeholders} "
+            f"ON CONFLICT (branch_id, product_id) DO UPDATE SET quantity = {table}.quantity + excluded.quantity",
+            params
+        )
+
+
+def opening_stock(sender, instance, created, raw=False, **kwargs):
+    # A product created with units on hand holds them at the main branch,
+    # and the ledger opens with them so it reconciles from the start.
+    if created and not raw and instance.stock_quantity:
+        add_stock(MAIN_BRANCH, {instance.pk: instance.stock_quantity})
+        movements.record([StockMovement(
+            product_id=instance.pk, branch_id=MAIN_BRANCH, kind='OPENING',
+            quantity=instance.stock_quantity, note='Opening balance',
+        )])
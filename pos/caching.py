@@ -0,0 +1,219 @@
+import asyncio
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import branches, fragments, rollup
+from .models import Product
+
+# Cached analytics. Sales totals are cached per period (the day, the week
+# ending on a day, the month, the year), with each branch's share, and
+# dropped by the writes that can change them; the low-stock count is dropped
+# by any stock or product write.
+
+PERIODS = ['daily', 'weekly', 'monthly', 'yearly']
+TIMEOUT = 60 * 60
+LOCK_TIMEOUT = 10   # seconds a worker may hold the recompute lock
+LOCK_WAIT = 2       # seconds other workers wait for it before computing anyway
+LOCK_POLL = 0.05
+
+LOW_STOCK_KEY = 'analytics:low_stock'
+HITS_KEY = 'analytics:stats:hits'
+MISSES_KEY = 'analytics:stats:misses'
+
+
+def period_key(period, day):
+    if period == 'monthly':
+        return f'analytics:monthly:{day:%Y-%m}'
+    if period == 'yearly':
+        return f'analytics:yearly:{day:%Y}'
+    return f'analytics:{period}:{day.isoformat()}'
+
+
+def _count(key, amount=1):
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        # Evicted between add() and incr(); losing one count is fine.
+        pass
+
+
+async def _acount(key, amount=1):
+    await cache.aadd(key, 0, timeout=None)
+    try:
+        await cache.aincr(key, amount)
+    except ValueError:
+        pass
+
+
+def low_stock_products():
+    return Product.objects.filter(stock_quantity__lte=F('reorder_level'))
+
+
+def stats():
+    return _stats(cache.get_many([HITS_KEY, MISSES_KEY]))
+
+
+async def astats():
+    return _stats(await cache.aget_many([HITS_KEY, MISSES_KEY]))
+
+
+def _stats(counts):
+    hits = counts.get(HITS_KEY, 0)
+    misses = counts.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 3) if total else None,
+    }
+
+
+def _get_or_compute(keys, compute):
+    """Return cached values for ``keys``, filling the misses with ``compute()``.
+
+    Only the worker that wins the lock recomputes; the others wait for it to
+    publish the result so an expired entry does not send every worker to the
+    database at once.
+    """
+    found = cache.get_many(keys)
+    if len(found) == len(keys):
+        _count(HITS_KEY, len(keys))
+        return found
+    if found:
+        _count(HITS_KEY, len(found))
+    _count(MISSES_KEY, len(keys) - len(found))
+
+    lock = f'{keys[0]}:lock'
+    if not cache.add(lock, 1, timeout=LOCK_TIMEOUT):
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL)
+            found = cache.get_many(keys)
+            if len(found) == len(keys):
+                return found
+        return compute()
+    try:
+        values = compute()
+        cache.set_many(values, timeout=TIMEOUT)
+        return values
+    finally:
+        cache.delete(lock)
+
+
+async def _aget_or_compute(keys, compute):
+    """``_get_or_compute`` for async views; ``compute`` is a coroutine function."""
+    found = await cache.aget_many(keys)
+    if len(found) == len(keys):
+        await _acount(HITS_KEY, len(keys))
+        return found
+    if found:
+        await _acount(HITS_KEY, len(found))
+    await _acount(MISSES_KEY, len(keys) - len(found))
+
+    lock = f'{keys[0]}:lock'
+    if not await cache.aadd(lock, 1, timeout=LOCK_TIMEOUT):
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL)
+            found = await cache.aget_many(keys)
+            if len(found) == len(keys):
+                return found
+        return await compute()
+    try:
+        values = await compute()
+        await cache.aset_many(values, timeout=TIMEOUT)
+        return values
+    finally:
+        await cache.adelete(lock)
+
+
+def _by_period(keys, totals, by_branch, names):
+    """Cache values: each period's totals with the branches' own under ``branches``."""
+    return {
+        keys[period]: {
+            **totals[period],
+            'branches': [{'name': names[pk], **by_branch[pk][period]} for pk in by_branch],
+        }
+        for period in PERIODS
+    }
+
+
+def _branch_rows(context):
+    """One row per branch with its totals for every period, for the dashboard table."""
+    return [
+        {'name': branch['name'], **{period: context[period]['branches'][i] for period in PERIODS}}
+        for i, branch in enumerate(context['daily']['branches'])
+    ]
+
+
+def dashboard(today=None):
+    """Sales totals per period and branch plus the low-stock count, from cache when possible."""
+    today = today or timezone.localdate()
+    keys = {period: period_key(period, today) for period in PERIODS}
+
+    def compute_totals():
+        names = branches.names()
+        return _by_period(keys, *rollup.branch_totals(list(names), today), names)
+
+    def compute_low_stock():
+        return {LOW_STOCK_KEY: low_stock_products().count()}
+
+    totals = _get_or_compute(list(keys.values()), compute_totals)
+    low_stock = _get_or_compute([LOW_STOCK_KEY], compute_low_stock)
+    context = {period: totals[keys[period]] for period in PERIODS}
+    context['branches'] = _branch_rows(context)
+    context['low_stock'] = low_stock[LOW_STOCK_KEY]
+    return context
+
+
+async def adashboard(today=None):
+    """``dashboard`` for async views.
+
+    The two lookups are gathered, but the async ORM and cache calls run one
+    at a time on Django's shared sync thread, so this does the same work as
+    ``dashboard`` in sequence; it only keeps the event loop free meanwhile.
+    """
+    today = today or timezone.localdate()
+    keys = {period: period_key(period, today) for period in PERIODS}
+
+    async def compute_totals():
+        names = await branches.anames()
+        return _by_period(keys, *await rollup.abranch_totals(list(names), today), names)
+
+    async def compute_low_stock():
+        return {LOW_STOCK_KEY: await low_stock_products().acount()}
+
+    totals, low_stock = await asyncio.gather(
+        _aget_or_compute(list(keys.values()), compute_totals),
+        _aget_or_compute([LOW_STOCK_KEY], compute_low_stock),
+    )
+    context = {period: totals[keys[period]] for period in PERIODS}
+    context['branches'] = _branch_rows(context)
+    context['low_stock'] = low_stock[LOW_STOCK_KEY]
+    return context
+
+
+def invalidate_sales(day=None):
+    """Drop every cached period containing ``day`` once the write commits."""
+    day = day or timezone.localdate()
+    keys = [
+        period_key('daily', day),
+        period_key('monthly', day),
+        period_key('yearly', day),
+    ]
+    # The weekly window reaches back seven days, so it covers ``day`` for
+    # the dashboards of ``day`` and the following week.
+    keys += [period_key('weekly', day + timedelta(days=n)) for n in range(8)]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_stock(product_ids=None):
+    """Drop the low-stock count and the cached rows of ``product_ids`` (every product for ``None``)."""
+    transaction.on_commit(lambda: cache.delete(LOW_STOCK_KEY))
+    fragments.touch('product', product_ids)
@@ -0,0 +1,108 @@
+import threading
+
+from django.db.models import F
+
+from .models import CatalogGeneration, Product
+
+# In-process product catalog for the sale paths: name, prices, average cost
+# and reorder level per product id, so validating and pricing a sale needs
+# no Product read. Stock is never cached; the sale's conditional UPDATE
+# stays the authority on it.
+#
+# Each entry remembers the catalog generation it was loaded under. The
+# generation is one database row that every product write bumps inside its
+# own transaction, so every web and worker process sees it the moment the
+# write commits, whatever the cache backend. A read costs one primary-key
+# lookup instead of a Product query. The generation is read before the
+# rows, so a write landing in between only causes one extra reload.
+
+FIELDS = ['id', 'name', 'selling_price', 'buying_price', 'average_cost', 'reorder_level']
+GENERATION = 1  # primary key of the CatalogGeneration row, created by migration 0022
+
+_entries = {}
+_lock = threading.Lock()
+_counts = {'hits': 0, 'misses': 0}
+
+
+class Entry:
+    """One product's catalog fields; duck-types the Product attributes the sale paths read."""
+    __slots__ = ('pk', 'name', 'selling_price', 'buying_price', 'average_cost', 'reorder_level', 'version')
+
+    def __init__(self, pk, name, selling_price, buying_price, average_cost, reorder_level, version):
+        self.pk = pk
+        self.name = name
+        self.selling_price = selling_price
+        self.buying_price = buying_price
+        self.average_cost = average_cost
+        self.reorder_level = reorder_level
+        self.version = version
+
+    def __repr__(self):
+        return f"<Entry {self.pk}: {self.name}>"
+
+
+def touch(ids=None):
+    """Retire the cached entries once the calling write commits.
+
+    Call it inside the write's transaction. Any product write retires every
+    entry; ``ids`` is accepted for the callers' sake, and product writes
+    are rare next to sales.
+    """
+    CatalogGeneration.objects.filter(pk=GENERATION).update(value=F('value') + 1)
+
+
+def product_saved(sender, instance, **kwargs):
+    touch([instance.pk])
+
+
+def _generation():
+    """The current generation, or ``None`` if its row is gone (a flushed database): then nothing is cached."""
+    return CatalogGeneration.objects.filter(pk=GENERATION).values_list('value', flat=True).first()
+
+
+def get_many(ids):
+    """``{pk: Entry}`` for the products in ``ids`` that exist; one generation read, and a query only for misses."""
+    ids = {int(pk) for pk in ids}
+    if not ids:
+        return {}
+    generation = _generation()
+    entries = {}
+    missing = []
+    for pk in ids:
+        entry = _entries.get(pk)
+        if entry is not None and generation is not None and entry.version == generation:
+            entries[pk] = entry
+        else:
+            missing.append(pk)
+    if missing:
+        for row in Product.objects.filter(pk__in=missing).values_list(*FIELDS):
+            entry = Entry(*row, generation)
+            if generation is not None:
+                _entries[entry.pk] = entry
+            entries[entry.pk] = entry
+    with _lock:
+        _counts['hits'] += len(ids) - len(missing)
+        _counts['misses'] += len(missing)
+    return entries
+
+
+def get(pk):
+    """The ``Entry`` for product ``pk``, or ``None`` if there is no such product."""
+    return get_many([pk]).get(int(pk))
+
+
+def stats():
+    with _lock:
+        hits, misses = _counts['hits'], _counts['misses']
+    total = hits + misses
+    return {
+        'entries': len(_entries),
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 3) if total else None,
+    }
+
+
+def clear():
+    """Forget every entry in this process."""
+    _entries.clear()
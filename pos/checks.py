@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+from django.core.management.base import CommandError
+
+# System checks for deployments. Fragment rows are keyed by version tokens
+# that writers replace in the cache, and writers drop the cached analytics
+# keys; a process-local (locmem) cache keeps both per process, so one
+# gunicorn worker's write, or a background job run by run_pos_worker, never
+# reaches what another process serves.
+
+SHARED_CACHES = ['default', 'fragments']
+LOCAL_BACKENDS = {'django.core.cache.backends.locmem.LocMemCache'}
+
+
+def local_caches(aliases=SHARED_CACHES):
+    """The cache aliases in ``aliases`` whose backend lives inside one process."""
+    return [alias for alias in aliases if settings.CACHES.get(alias, {}).get('BACKEND') in LOCAL_BACKENDS]
+
+
+def require_shared_caches(who):
+    """Raise ``CommandError`` for a command (``who``) whose cache writes other processes would never see."""
+    local = local_caches()
+    if local:
+        raise CommandError(
+            f"Process-local caches ({', '.join(local)}): the web processes would never see {who}'s "
+            "invalidations. Set POS_CACHE=file or POS_CACHE=redis."
+        )
+
+
+@register(Tags.caches)
+def shared_caches(app_configs, **kwargs):
+    """Under POS_DB_PROFILE=production (several workers) the analytics and fragment caches must be shared."""
+    if settings.POS_DB_PROFILE != 'production':
+        return []
+    return [
+        Error(
+            f"The {alias!r} cache is process-local, so workers would serve each other's stale rows.",
+            hint="Set POS_CACHE=file or POS_CACHE=redis for the production profile.",
+            id='pos.E001',
+        )
+        for alias in local_caches()
+    ]
@@ -0,0 +1,262 @@
+import heapq
+from collections import defaultdict, deque
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.db.models import F, FloatField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from . import catalog, periods
+from .models import ArchivedSale, ArchivedStockIn, Product, Receipt, Sale, StockIn, StockMovement
+
+# Inventory valuation. Every StockIn is a cost layer whose
+# remaining_quantity is still on the shelf, and Product.average_cost is the
+# weighted-average cost of the stock on hand. Sale writers call consume()
+# inside their transaction to price the units sold; replay() rebuilds all of
+# it from the movement history for `manage.py revalue`.
+
+FIFO = 'FIFO'
+AVERAGE = 'AVERAGE'
+METHODS = [FIFO, AVERAGE]
+REPLAY_BATCH_SIZE = 5000
+
+CENT = Decimal('0.01')
+AVERAGE_PLACES = Decimal('0.0001')
+
+
+def costing_method():
+    method = str(getattr(settings, 'POS_COSTING_METHOD', FIFO)).upper()
+    if method not in METHODS:
+        raise ImproperlyConfigured(f"POS_COSTING_METHOD must be one of {', '.join(METHODS)}, not {method!r}.")
+    return method
+
+
+def fallback_cost(product):
+    """Unit cost for units no layer covers: the average, or the list buying price before any delivery."""
+    return product.average_cost or product.buying_price
+
+
+def average_after_delivery(quantity, cost):
+    """``Product.average_cost`` once ``quantity`` units costing ``cost`` in total arrive.
+
+    Meant for ``update()``: SQL evaluates it against the stock on hand before
+    the same statement adds the delivery. Cast to float so SQLite does not
+    divide two integers.
+    """
+    current = Coalesce(NullIf(F('average_cost'), Value(0)), F('buying_price'))
+    return (
+        Cast(F('stock_quantity') * current + Value(cost), FloatField())
+        / Cast(F('stock_quantity') + Value(quantity), FloatField())
+    )
+
+
+def _write_rows(model, columns, rows):
+    """Set ``columns`` on many rows in one ``UPDATE ... FROM (VALUES ...)``; rows are ``(id, *values)``."""
+    if not rows:
+        return
+    table = connection.ops.quote_name(model._meta.db_table)
+    row = '(' + ', '.join(['%s'] * (len(columns) + 1)) + ')'
+    values = ', '.join([row] * len(rows))
+    assignments = ', '.join(f"{column} = v.{column}" for column in columns)
+    params = [value for values_row in rows for value in values_row]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"WITH v(id, {', '.join(columns)}) AS (VALUES {values}) "
+            f"UPDATE {table} SET {assignments} FROM v WHERE {table}.id = v.id",
+            params
+        )
+
+
+def _open_layers(wanted):
+    """Yield ``[id, product_id, remaining, unit_cost]`` for the open layers ``{product_id: qty}`` reaches.
+
+    Layers come oldest first per product, stopping at the last one needed.
+    Written as SQL because compiling the equivalent filtered window
+    queryset costs more than running it.
+    """
+    table = connection.ops.quote_name(StockIn._meta.db_table)
+    values = ', '.join(['(%s, %s)'] * len(wanted))
+    params = [value for item in wanted.items() for value in item]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"WITH wanted(product_id, qty) AS (VALUES {values}) "
+            f"SELECT id, product_id, remaining_quantity, buying_price FROM ("
+            f"  SELECT layer.id, layer.product_id, layer.remaining_quantity, layer.buying_price, layer.date, "
+            f"    wanted.qty, SUM(layer.remaining_quantity) OVER ("
+            f"      PARTITION BY layer.product_id ORDER BY layer.date, layer.id"
+            f"    ) - layer.remaining_quantity AS before "
+            f"  FROM wanted JOIN {table} layer ON layer.product_id = wanted.product_id "
+            f"  WHERE layer.remaining_quantity > 0"
+            f") WHERE before < qty ORDER BY product_id, date, id",
+            params
+        )
+        for pk, product_id, remaining, price in cursor.fetchall():
+            yield [pk, product_id, remaining, Decimal(str(price))]
+
+
+def consume(lines, method=None):
+    """Take ``[(product, qty)]`` off the cost layers; return each line's cost of goods.
+
+    Only the layers the lines reach are read, and the ones they touch are
+    written back with one ``UPDATE``, so a sale costs O(layers touched)
+    however long the delivery history is. Units no layer covers (stock that
+    predates layer tracking, or a PIN sale below zero) are costed at the
+    product's average. Call inside the transaction that decrements stock.
+    """
+    method = method or costing_method()
+    wanted = defaultdict(int)
+    for product, qty in lines:
+        wanted[product.pk] += qty
+    queues = defaultdict(deque)
+    for layer in _open_layers(wanted):
+        queues[layer[1]].append(layer)
+
+    costs = []
+    touched = {}
+    for product, qty in lines:
+        queue = queues[product.pk]
+        left = qty
+        fifo_cost = Decimal('0')
+        while left and queue:
+            layer = queue[0]
+            take = min(left, layer[2])
+            layer[2] -= take
+            left -= take
+            fifo_cost += take * layer[3]
+            touched[layer[0]] = layer[2]
+            if not layer[2]:
+                queue.popleft()
+        if method == FIFO:
+            cost = fifo_cost + left * fallback_cost(product)
+        else:
+            cost = qty * fallback_cost(product)
+        costs.append(cost.quantize(CENT))
+
+    _write_rows(StockIn, ['remaining_quantity'], list(touched.items()))
+    return costs
+
+
+# ---------- Replay ----------
+def _pages(queryset, fields, batch_size):
+    """Yield ``values_list(*fields)`` rows in (date, id) order, one keyset page per query."""
+    after = None
+    while True:
+        page = queryset
+        if after:
+            page = page.filter(Q(date__gt=after[0]) | Q(date=after[0], id__gt=after[1]))
+        rows = list(page.order_by('date', 'id').values_list(*fields)[:batch_size])
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        after = rows[-1][:2]
+
+
+def replay(method=None, batch_size=REPLAY_BATCH_SIZE, stdout=None):
+    """Recompute every sale's cost of goods, the open layers and the averages from history.
+
+    Deliveries, write-off adjustments and sales are read a keyset page at a
+    time and merged in date order (a delivery first when timestamps tie). Layer
+    queues and averages are kept per product in memory; sales whose cost
+    changed are written back a page at a time. Archived deliveries and sales
+    are replayed with the live ones, but sales in closed months are never
+    revalued. Returns ``(sales, changed)``.
+    """
+    method = method or costing_method()
+    list_prices = dict(Product.objects.values_list('id', 'buying_price'))
+    queues = defaultdict(deque)
+    on_hand = defaultdict(int)
+    averages = {}
+    closed = periods.boundary_start()
+
+    deliveries = heapq.merge(*[
+        (
+            (date, 0, pk, product_id, quantity, price)
+            for date, pk, product_id, quantity, price in _pages(
+                model.objects.all(), ['date', 'id', 'product_id', 'quantity', 'buying_price'], batch_size)
+        )
+        for model in (ArchivedStockIn, StockIn)
+    ])
+    # Stock written off by an adjustment leaves the layers like a sale.
+    write_offs = (
+        (date, 1, pk, product_id, -quantity, None)
+        for date, pk, product_id, quantity in _pages(
+            StockMovement.objects.filter(kind='ADJUSTMENT', quantity__lt=0),
+            ['date', 'id', 'product_id', 'quantity'], batch_size)
+    )
+    sales = heapq.merge(*[
+        (
+            (date, 2, pk, product_id, quantity, (total, stored))
+            for date, pk, product_id, quantity, total, stored in _pages(
+                model.objects.all(),
+                ['date', 'id', 'product_id', 'quantity', 'total_price', 'cost_of_goods'], batch_size)
+        )
+        for model in (ArchivedSale, Sale)
+    ])
+
+    seen = 0
+    changed = []
+    changed_count = 0
+    with transaction.atomic():
+        for date, kind, pk, product_id, quantity, extra in heapq.merge(deliveries, write_offs, sales):
+            if kind == 0:
+                stock = on_hand[product_id]
+                current = averages.get(product_id) or list_prices[product_id]
+                averages[product_id] = (
+                    (stock * current + quantity * extra) / (stock + quantity)
+                ).quantize(AVERAGE_PLACES)
+                queues[product_id].append([pk, quantity, extra])
+                on_hand[product_id] = stock + quantity
+                continue
+
+            unit = averages.get(product_id) or list_prices[product_id]
+            queue = queues[product_id]
+            left = quantity
+            fifo_cost = Decimal('0')
+            while left and queue:
+                layer = queue[0]
+                take = min(left, layer[1])
+                layer[1] -= take
+                left -= take
+                fifo_cost += take * layer[2]
+                if not layer[1]:
+                    queue.popleft()
+            on_hand[product_id] = max(on_hand[product_id] - quantity, 0)
+            if kind == 1:
+                continue
+
+            seen += 1
+            total, stored = extra
+            cost = (fifo_cost + left * unit if method == FIFO else quantity * unit).quantize(CENT)
+
+            if cost != stored and (closed is None or date >= closed):
+                changed.append((pk, cost, total - cost))
+            if len(changed) >= batch_size:
+                _write_rows(Sale, ['cost_of_goods', 'profit'], changed)
+                changed_count += len(changed)
+                changed = []
+                if stdout:
+                    stdout.write(f"  {seen} sales replayed, {changed_count} revalued")
+        _write_rows(Sale, ['cost_of_goods', 'profit'], changed)
+        changed_count += len(changed)
+
+        StockIn.objects.filter(remaining_quantity__gt=0).update(remaining_quantity=0)
+        open_layers = [(layer[0], layer[1]) for queue in queues.values() for layer in queue]
+        for start in range(0, len(open_layers), batch_size):
+            _write_rows(StockIn, ['remaining_quantity'], open_layers[start:start + batch_size])
+        average_rows = list(averages.items())
+        for start in range(0, len(average_rows), batch_size):
+            _write_rows(Product, ['average_cost'], average_rows[start:start + batch_size])
+        catalog.touch()
+
+        line_costs = (
+            Sale.objects.filter(receipt=OuterRef('pk'))
+            .values('receipt')
+            .annotate(total=Sum('cost_of_goods'))
+            .values('total')
+        )
+        receipts = Receipt.objects.filter(date__gte=closed) if closed else Receipt.objects.all()
+        receipts.update(profit=F('total_price') - Coalesce(Subquery(line_costs), Value(Decimal('0'))))
+
+    return seen, changed_count
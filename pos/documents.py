@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import ArchivedPayment, ArchivedSale, Customer, Payment, Sale
+
+# Printable receipts, invoices and customer statements. A document's
+# content is first gathered into a plain dict, and its file is named by a
+# hash of that dict, the format and RENDER_VERSION. Unchanged rows always
+# map to the file already on disk, so a document is rendered once and
+# served from POS_DOCUMENT_DIR until a row it shows changes. Rendering runs
+# on the job worker; statement runs for every debtor fan out over a
+# process pool.
+
+RENDER_VERSION = 1  # bump whenever a template or the text layout changes
+STATEMENT_DAYS = 90
+TEXT_WIDTH = 42     # characters per line on an 80mm printer in font A
+STATEMENT_CHUNK_SIZE = 20
+
+# format: (file extension, content type)
+FORMATS = {
+    'html': ('html', 'text/html; charset=utf-8'),
+    'escpos': ('escpos', 'application/octet-stream'),
+}
+ESC_INIT = b'\x1b@'
+ESC_CUT = b'\x1dVB\x03'  # feed three lines and cut
+
+
+class DocumentNotFound(Exception):
+    pass
+
+
+# ---------- Content ----------
+def _money(value):
+    return Decimal(value).quantize(Decimal('0.01'))
+
+
+def _sales(**lookup):
+    """Sales matching ``lookup``, from the archive once their month has been archived."""
+    for model in (Sale, ArchivedSale):
+        rows = list(model.objects.filter(**lookup).select_related('product', 'customer').order_by('id'))
+        if rows:
+            return model, rows
+    return Sale, []
+
+
+def _bill(pk):
+    """The sale ``pk`` with the other lines of its basket, and their payments."""
+    model, found = _sales(pk=pk)
+    if not found:
+        raise DocumentNotFound(f"No sale #{pk}.")
+    sale = found[0]
+    lines = _sales(receipt_id=sale.receipt_id)[1] if sale.receipt_id else found
+    paid = Q(sale_id__in=[line.pk for line in lines])
+    if sale.receipt_id:
+        paid |= Q(receipt_id=sale.receipt_id)
+    payments = (ArchivedPayment if model is ArchivedSale else Payment).objects.filter(paid).order_by('date', 'id')
+    customer = sale.customer
+    return {
+        'shop': settings.POS_SHOP_NAME,
+        'number': f"R{sale.receipt_id}" if sale.receipt_id else f"S{sale.pk}",
+        'date': timezone.localtime(sale.date),
+        'customer': {'name': customer.name, 'phone': customer.phone or ''} if customer else None,
+        'lines': [
+            {'product': line.product.name, 'quantity': line.quantity,
+             'price': line.selling_price, 'total': line.total_price}
+            for line in lines
+        ],
+        # Lines are kept current by later payments; the receipt header is not.
+        'total': _money(sum(line.total_price for line in lines)),
+        'paid': _money(sum(line.paid_amount for line in lines)),
+        'remaining': _money(sum(line.remaining_amount for line in lines)),
+        'payment_mode': sale.get_payment_mode_display(),
+        'payments': [
+            {'date': timezone.localtime(payment.date), 'amount': payment.amount_paid,
+             'mode': payment.get_payment_mode_display()}
+            for payment in payments
+        ],
+    }
+
+
+def _statement(pk):
+    """Customer ``pk``'s open sales and their payments over the last STATEMENT_DAYS."""
+    customer = Customer.objects.filter(pk=pk).first()
+    if customer is None:
+        raise DocumentNotFound(f"No customer #{pk}.")
+    open_sales = Sale.objects.filter(
+        customer_id=pk, status='PENDING_PAYMENT'
+    ).select_related('product').order_by('date', 'id')
+    since = timezone.now() - timedelta(days=STATEMENT_DAYS)
+    # Two lookups, each driven by the customer's own sales or receipts; an
+    # OR of the two would walk every payment in the window instead.
+    payments = sorted(
+        [*Payment.objects.filter(sale__customer_id=pk, date__gte=since),
+         *Payment.objects.filter(receipt__customer_id=pk, date__gte=since)],
+        key=lambda payment: (payment.date, payment.pk)
+    )
+    return {
+        'shop': settings.POS_SHOP_NAME,
+        'customer': {'name': customer.name, 'phone': customer.phone or ''},
+        'balance': customer.balance,
+        'open_sales': [
+            {'number': sale.pk, 'date': timezone.localtime(sale.date), 'product': sale.product.name,
+             'quantity': sale.quantity, 'total': sale.total_price, 'remaining': sale.remaining_amount}
+            for sale in open_sales
+        ],
+        'days': STATEMENT_DAYS,
+        'payments': [
+            {'date': timezone.localtime(payment.date), 'amount': payment.amount_paid,
+             'mode': payment.get_payment_mode_display()}
+            for payment in payments
+        ],
+    }
+
+
+# kind: (gatherer, title, HTML template)
+DOCUMENTS = {
+    'receipt': (_bill, 'Receipt', 'pos/documents/bill.html'),
+    'invoice': (_bill, 'Invoice', 'pos/documents/bill.html'),
+    'statement': (_statement, 'Statement', 'pos/documents/statement.html'),
+}
+
+
+def gather(kind, pk):
+    """The content of document ``kind`` for ``pk``; raises DocumentNotFound."""
+    if kind not in DOCUMENTS:
+        raise DocumentNotFound(f"Unknown document {kind!r}.")
+    return DOCUMENTS[kind][0](pk)
+
+
+def digest(kind, data, file_format):
+    content = {'kind': kind, 'format': file_format, 'version': RENDER_VERSION, 'data': data}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, cls=DjangoJSONEncoder).encode()).hexdigest()
+
+
+def path_for(kind, data, file_format):
+    name = digest(kind, data, file_format)
+    return os.path.join(settings.POS_DOCUMENT_DIR, kind, name[:2], f"{name}.{FORMATS[file_format][0]}")
+
+
+# ---------- Rendering ----------
+def _row(left, right, width=TEXT_WIDTH):
+    left = left[:max(width - len(right) - 1, 0)]
+    return left + ' ' * (width - len(left) - len(right)) + right
+
+
+def _text(kind, data):
+    """Fixed-width lines for a receipt printer."""
+    rule = '-' * TEXT_WIDTH
+    lines = [data['shop'].center(TEXT_WIDTH), DOCUMENTS[kind][1].upper().center(TEXT_WIDTH), rule]
+    if kind == 'statement':
+        lines.append(data['customer']['name'])
+        lines.append(rule)
+        for sale in data['open_sales']:
+            lines.append(_row(f"#{sale['number']} {sale['date']:%d/%m/%y} {sale['product']}", f"{sale['remaining']}"))
+        lines.append(rule)
+        for payment in data['payments']:
+            lines.append(_row(f"{payment['date']:%d/%m/%y} paid ({payment['mode']})", f"{payment['amount']}"))
+        lines += [rule, _row('BALANCE', f"{data['balance']}")]
+        return lines
+
+    lines.append(_row(f"No. {data['number']}", f"{data['date']:%d/%m/%Y %H:%M}"))
+    if data['customer']:
+        lines.append(data['customer']['name'])
+    lines.append(rule)
+    for line in data['lines']:
+        lines.append(line['product'][:TEXT_WIDTH])
+        lines.append(_row(f"  {line['quantity']} x {line['price']}", f"{line['total']}"))
+    lines += [rule, _row('TOTAL', f"{data['total']}"), _row(f"PAID ({data['payment_mode']})", f"{data['paid']}")]
+    if data['remaining']:
+        lines.append(_row('BALANCE DUE', f"{data['remaining']}"))
+    return lines
+
+
+def _render(kind, data, file_format):
+    if file_format == 'html':
+        return render_to_string(DOCUMENTS[kind][2], {
+            'kind': kind, 'title': DOCUMENTS[kind][1], **data,
+        }).encode()
+    text = '\n'.join(_text(kind, data)) + '\n'
+    return ESC_INIT + text.encode('cp437', errors='replace') + ESC_CUT
+
+
+def render(kind, pk, file_format='html'):
+    """Write document ``kind`` for ``pk`` unless an identical one is on disk; return ``(path, created)``."""
+    data = gather(kind, pk)
+    path = path_for(kind, data, file_format)
+    if os.path.exists(path):
+        return path, False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written under a temporary name and renamed, so a reader never sees half a file.
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(handle, 'wb') as out:
+        out.write(_render(kind, data, file_format))
+    os.replace(temporary, path)
+    return path, True
+
+
+# ---------- Statement runs ----------
+def _init_process():
+    # Children must not share the parent's database connections.
+    connections.close_all()
+
+
+def _render_statements(ids, file_format):
+    return sum(render('statement', pk, file_format)[1] for pk in ids)
+
+
+def render_statements(file_format='html', workers=None, stdout=None):
+    """Render a statement for every customer with a balance; return ``(statements, newly written)``.
+
+    Customers are split into chunks rendered on a pool of ``workers``
+    processes (one per CPU by default); with ``workers=1`` they are
+    rendered in this process.
+    """
+    ids = list(Customer.objects.filter(balance__gt=0).order_by('pk').values_list('pk', flat=True))
+    chunks = [ids[start:start + STATEMENT_CHUNK_SIZE] for start in range(0, len(ids), STATEMENT_CHUNK_SIZE)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(chunks) <= 1:
+        created = sum(_render_statements(chunk, file_format) for chunk in chunks)
+        return len(ids), created
+
+    connections.close_all()
+    created = 0
+    with ProcessPoolExecutor(workers, initializer=_init_process) as pool:
+        for count in pool.map(_render_statements, chunks, [file_format] * len(chunks)):
+            created += count
+            if stdout:
+                stdout.write(f"  {created} statements written")
+    return len(ids), created
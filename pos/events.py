@@ -0,0 +1,143 @@
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import ChangeEvent, EventConsumer
+
+# Change feed (a transactional outbox). Every write path appends its
+# ChangeEvents with emit() inside the transaction that makes the change, so
+# an event is visible exactly when its write has committed. Event ids only
+# grow (AUTOINCREMENT) and SQLite commits one writer at a time, so a
+# consumer that remembers the last id it processed never skips or repeats
+# an event. Positions are kept in EventConsumer; compact() deletes the
+# events every consumer has already passed.
+
+BATCH_SIZE = 1000
+COMPACT_CHUNK_SIZE = 50_000
+
+
+class ConsumerConflict(Exception):
+    """Another process moved the consumer's position while this one processed a batch."""
+
+
+# ---------- Writing ----------
+def event(kind, object_id, **payload):
+    """An unsaved ``ChangeEvent``; hand a list of them to ``emit``."""
+    return ChangeEvent(kind=kind, object_id=object_id, payload=payload)
+
+
+def emit(events):
+    """Append ``events`` with one INSERT; call inside the writer's transaction."""
+    if events:
+        ChangeEvent.objects.bulk_create(events)
+
+
+def sale_event(sale):
+    return event(
+        'SALE', sale.pk, product=sale.product_id, customer=sale.customer_id, receipt=sale.receipt_id,
+        branch=sale.branch_id,
+        quantity=sale.quantity, total=sale.total_price, paid=sale.paid_amount,
+        remaining=sale.remaining_amount, profit=sale.profit, payment_mode=sale.payment_mode,
+        status=sale.status, date=sale.date,
+    )
+
+
+def payment_event(payment, customer_id):
+    return event(
+        'PAYMENT', payment.pk, sale=payment.sale_id, receipt=payment.receipt_id, customer=customer_id,
+        amount=payment.amount_paid, payment_mode=payment.payment_mode,
+    )
+
+
+def stock_in_event(stock_in):
+    return event(
+        'STOCK_IN', stock_in.pk, product=stock_in.product_id, branch=stock_in.branch_id, quantity=stock_in.quantity,
+        buying_price=stock_in.buying_price, selling_price=stock_in.selling_price,
+    )
+
+
+def product_event(product, deleted=False):
+    return event(
+        'PRODUCT', product.pk, name=product.name, sku=product.sku, buying_price=product.buying_price,
+        selling_price=product.selling_price, reorder_level=product.reorder_level, deleted=deleted,
+    )
+
+
+def product_saved(sender, instance, **kwargs):
+    # Connected to post_save and post_delete; only the latter passes no ``created``.
+    emit([product_event(instance, deleted='created' not in kwargs)])
+
+
+# ---------- Reading ----------
+def head():
+    """The id of the newest event, or 0."""
+    return ChangeEvent.objects.aggregate(last=Max('id'))['last'] or 0
+
+
+def register(name, from_start=False):
+    """The consumer ``name``; a new one starts at the head of the feed, or with ``from_start`` before it."""
+    return EventConsumer.objects.get_or_create(name=name, defaults={'position': 0 if from_start else head()})[0]
+
+
+def read(position, limit=BATCH_SIZE):
+    """Up to ``limit`` events after ``position``, oldest first."""
+    return list(ChangeEvent.objects.filter(pk__gt=position).order_by('pk')[:limit])
+
+
+def ack(name, position, expected=None):
+    """Move consumer ``name`` forward to ``position``; never backwards.
+
+    With ``expected``, the move only happens from that position and
+    ConsumerConflict is raised otherwise.
+    """
+    consumers = EventConsumer.objects.filter(name=name, position__lt=position)
+    if expected is not None:
+        consumers = consumers.filter(position=expected)
+    moved = consumers.update(position=position, updated_at=timezone.now())
+    if expected is not None and not moved:
+        raise ConsumerConflict(name)
+    return bool(moved)
+
+
+def consume(name, handler, batch_size=BATCH_SIZE, max_batches=None):
+    """Hand the events consumer ``name`` has not seen to ``handler`` a batch at a time; return how many.
+
+    Each batch and its position update share one transaction, so a handler
+    that writes to the database commits its writes and the new position
+    together; if either fails the batch is seen again on the next run.
+    """
+    register(name)
+    processed = batches = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            position = EventConsumer.objects.values_list('position', flat=True).get(name=name)
+            events = read(position, batch_size)
+            if not events:
+                break
+            handler(events)
+            ack(name, events[-1].pk, expected=position)
+        processed += len(events)
+        batches += 1
+        if len(events) < batch_size:
+            break
+    return processed
+
+
+# ---------- Compaction ----------
+def compact(chunk_size=COMPACT_CHUNK_SIZE, stdout=None):
+    """Delete the events every consumer has processed, a chunk of ids per transaction; return how many.
+
+    Without any consumer nothing is deleted.
+    """
+    floor = EventConsumer.objects.aggregate(floor=Min('position'))['floor']
+    first = ChangeEvent.objects.aggregate(first=Min('id'))['first']
+    deleted = 0
+    while floor is not None and first is not None and first <= floor:
+        last = min(first + chunk_size - 1, floor)
+        with transaction.atomic():
+            count, _ = ChangeEvent.objects.filter(pk__gte=first, pk__lte=last).delete()
+        deleted += count
+        first = last + 1
+        if stdout:
+            stdout.write(f"  {deleted} events deleted")
+    return deleted
@@ -0,0 +1,86 @@
+import csv
+import heapq
+import json
+from datetime import date, datetime, time, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from . import periods
+from .models import ArchivedSale, Sale
+
+# Sales filtering and export rows, shared by the streaming export view and
+# the background export job. Exports reaching back into closed months merge
+# in the archived sales.
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FIELDS = [
+    'id', 'date', 'customer__name', 'product__name', 'quantity', 'selling_price',
+    'total_price', 'paid_amount', 'remaining_amount', 'profit', 'payment_mode', 'status',
+]
+FILTER_KEYS = ('start', 'end', 'branch', 'customer', 'payment_mode', 'status')
+
+
+def day_start(value):
+    return timezone.make_aware(datetime.combine(date.fromisoformat(value), time.min))
+
+
+def filter_sales(filters, model=Sale):
+    """Apply the sales list filters to ``model`` as range lookups the indexes can serve.
+
+    Raises ValueError for a malformed date.
+    """
+    sales = model.objects.all()
+    if filters.get('start'):
+        sales = sales.filter(date__gte=day_start(filters['start']))
+    if filters.get('end'):
+        sales = sales.filter(date__lt=day_start(filters['end']) + timedelta(days=1))
+    if filters.get('branch'):
+        sales = sales.filter(branch_id=filters['branch'])
+    if filters.get('customer'):
+        sales = sales.filter(customer_id=filters['customer'])
+    if filters.get('payment_mode'):
+        sales = sales.filter(payment_mode=filters['payment_mode'])
+    if filters.get('status'):
+        sales = sales.filter(status=filters['status'])
+    return sales
+
+
+def reaches_archive(filters):
+    """Whether the ``filters`` date range starts before the period boundary."""
+    closed = periods.boundary()
+    return bool(closed) and not (filters.get('start') and date.fromisoformat(filters['start']) >= closed)
+
+
+def _rows(sales):
+    return sales.order_by('-date', '-id').values_list(*EXPORT_FIELDS).iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    )
+
+
+def export_rows(filters):
+    """The sales matching ``filters`` as ``EXPORT_FIELDS`` tuples, newest first."""
+    rows = _rows(filter_sales(filters))
+    if not reaches_archive(filters):
+        return rows
+    # Both streams are already newest first; merge them on (date, id).
+    archived = _rows(filter_sales(filters, ArchivedSale))
+    return heapq.merge(rows, archived, key=lambda row: (row[1], row[0]), reverse=True)
+
+
+class Echo:
+    """File-like object that hands each written line straight back."""
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row)), cls=DjangoJSONEncoder) + '\n'
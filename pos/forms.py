@@ -0,0 +1,9 @@
+from django import forms
+
+from .models import Product
+
+
+class ProductForm(forms.ModelForm):
+    class Meta:
+        model = Product
+        fields = ['name', 'buying_price', 'selling_price', 'reorder_level']
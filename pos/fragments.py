@@ -0,0 +1,102 @@
+import hashlib
+import uuid
+
+from django.core.cache import caches
+from django.db import transaction
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+# Rendered table rows cached per object. Each row is keyed by its object id
+# plus a version token that writers replace when the row's data changes,
+# and by a table-wide generation token for writes that touch every row
+# (a product rename shows on every sale row). A whole page is also cached
+# under a hash of its row keys, so an unchanged page is one cache read.
+#
+# Bulk writes call touch() themselves; model saves and deletes (forms, the
+# admin) are caught by the signal receivers below. Rows are written after
+# the page query, so a write landing in between can be cached under the new
+# token with the old data; FRAGMENT_TIMEOUT bounds that. Workers see each
+# other's tokens only through a shared backend, which pos.checks requires
+# under the production profile.
+
+FRAGMENT_TIMEOUT = 24 * 60 * 60
+
+
+def _cache():
+    return caches['fragments']
+
+
+def _version_key(kind, pk=None):
+    return f'rows:{kind}:version' if pk is None else f'rows:{kind}:version:{pk}'
+
+
+def _token():
+    return uuid.uuid4().hex[:12]
+
+
+def touch(kind, ids=None):
+    """Retire the cached ``kind`` rows for ``ids`` (every row for ``None``) once the write commits."""
+    keys = [_version_key(kind)] if ids is None else [_version_key(kind, pk) for pk in ids]
+    if keys:
+        transaction.on_commit(lambda: _cache().set_many({key: _token() for key in keys}, timeout=None))
+
+
+def product_saved(sender, instance, created=False, **kwargs):
+    touch('product', [instance.pk])
+    if not created:
+        # Sale rows show the product name.
+        touch('sale')
+
+
+def sale_saved(sender, instance, **kwargs):
+    touch('sale', [instance.pk])
+
+
+def customer_saved(sender, instance, created=False, **kwargs):
+    if not created:
+        touch('sale')
+
+
+def _versions(kind, ids):
+    """The generation token and ``{pk: token}``; missing tokens are created, never reset to a reused value."""
+    keys = {pk: _version_key(kind, pk) for pk in ids}
+    found = _cache().get_many([_version_key(kind), *keys.values()])
+    fresh = {key: _token() for key in [_version_key(kind), *keys.values()] if key not in found}
+    if fresh:
+        _cache().set_many(fresh, timeout=None)
+        found.update(fresh)
+    return found[_version_key(kind)], {pk: found[key] for pk, key in keys.items()}
+
+
+def render_rows(kind, template_name, objects, name, **context):
+    """Render ``template_name`` once per object (passed as ``name``) and join the rows.
+
+    Extra ``context`` must be the same for every row and is part of the
+    cache key. Rows whose version is unchanged come from the cache; only the
+    rest are rendered, and those are stored for next time.
+    """
+    objects = list(objects)
+    if not objects:
+        return ''
+    generation, versions = _versions(kind, [obj.pk for obj in objects])
+    variant = '|'.join(f'{key}={value}' for key, value in sorted(context.items()))
+    keys = [f'row:{kind}:{generation}:{obj.pk}:{versions[obj.pk]}:{variant}' for obj in objects]
+    page_key = f'page:{kind}:' + hashlib.sha1('\n'.join(keys).encode()).hexdigest()
+
+    page = _cache().get(page_key)
+    if page is not None:
+        return mark_safe(page)
+
+    found = _cache().get_many(keys)
+    template = get_template(template_name)
+    rendered = {}
+    rows = []
+    for obj, key in zip(objects, keys):
+        row = found.get(key)
+        if row is None:
+            row = rendered[key] = template.render({name: obj, **context})
+        rows.append(row)
+    page = ''.join(rows)
+    rendered[page_key] = page
+    _cache().set_many(rendered, timeout=FRAGMENT_TIMEOUT)
+    return mark_safe(page)
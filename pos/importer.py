@@ -0,0 +1,187 @@
+import csv
+import io
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from . import branches, caching, catalog, events, movements
+from .models import MAIN_BRANCH, Product, StockIn, StockMovement
+from .services import retry_on_lock
+
+# Bulk stock-in from a supplier file. Rows are streamed, validated and
+# written a chunk at a time: one query resolves the chunk's products, one
+# bulk_create each writes its StockIn and StockMovement rows, one UPDATE
+# adds the stock to the products and one upsert adds it to the branch.
+
+CHUNK_SIZE = 500
+# Product names are not unique; a name-only row matching several products is rejected.
+AMBIGUOUS = object()
+
+
+class ImportFileError(Exception):
+    pass
+
+
+def read_rows(fileobj, filename):
+    """Yield ``(line_number, row_dict)`` from a CSV or XLSX file without loading it whole."""
+    if filename.lower().endswith('.xlsx'):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ImportFileError("XLSX import needs the openpyxl package; upload CSV instead.")
+        sheet = load_workbook(fileobj, read_only=True, data_only=True).active
+        rows = sheet.iter_rows(values_only=True)
+        header = [str(cell or '').strip().lower() for cell in next(rows, [])]
+        for line, values in enumerate(rows, start=2):
+            yield line, dict(zip(header, values))
+        return
+
+    if isinstance(fileobj.read(0), bytes):
+        fileobj = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(fileobj)
+    if reader.fieldnames:
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    for line, row in enumerate(reader, start=2):
+        yield line, row
+
+
+def parse_row(row):
+    """Return ``(sku, name, quantity, buying_price, selling_price)`` or raise ValueError."""
+    sku = str(row.get('sku') or '').strip() or None
+    name = str(row.get('name') or '').strip() or None
+    if not sku and not name:
+        raise ValueError("needs a sku or a name")
+    try:
+        quantity = int(row.get('quantity'))
+        buying_price = Decimal(str(row.get('buying_price')).strip())
+        selling_price = Decimal(str(row.get('selling_price')).strip())
+    except (TypeError, ValueError, InvalidOperation):
+        raise ValueError("quantity and prices must be numbers")
+    if quantity <= 0:
+        raise ValueError("quantity must be positive")
+    if buying_price < 0 or selling_price < 0:
+        raise ValueError("prices cannot be negative")
+    return sku, name, quantity, buying_price, selling_price
+
+
+def _add_stock(added, costs, prices):
+    """Increment stock, move average costs and set prices for many products in one ``UPDATE ... FROM``.
+
+    A CASE expression per product compiles in O(n) Python objects per
+    column; a VALUES list joined on id keeps the chunk to a single cheap
+    statement. The average is the same one ``costing.average_after_delivery``
+    computes for a single delivery.
+    """
+    table = connection.ops.quote_name(Product._meta.db_table)
+    values = ', '.join(['(%s, %s, %s, %s, %s)'] * len(added))
+    params = []
+    for pk, qty in added.items():
+        params.extend([pk, qty, costs[pk], *prices[pk]])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"WITH delivery(id, qty, cost, buying_price, selling_price) AS (VALUES {values}) "
+            f"UPDATE {table} SET stock_quantity = {table}.stock_quantity + delivery.qty, "
+            f"average_cost = CAST({table}.stock_quantity * COALESCE(NULLIF({table}.average_cost, 0), "
+            f"{table}.buying_price) + delivery.cost AS REAL) / ({table}.stock_quantity + delivery.qty), "
+            f"buying_price = delivery.buying_price, selling_price = delivery.selling_price "
+            f"FROM delivery WHERE {table}.id = delivery.id",
+            params
+        )
+
+
+@retry_on_lock
+def write_chunk(parsed, create_missing=False, branch_id=MAIN_BRANCH):
+    """Write one chunk of parsed rows as deliveries to ``branch_id``; return ``(written, errors)``."""
+    skus = {sku for line, (sku, name, *rest) in parsed if sku}
+    names = {name for line, (sku, name, *rest) in parsed if name and not sku}
+    errors = []
+
+    with transaction.atomic():
+        products = Product.objects.filter(Q(sku__in=skus) | Q(name__in=names)).only('id', 'sku', 'name')
+        by_sku, by_name = {}, {}
+        for product in products:
+            if product.sku:
+                by_sku[product.sku] = product.pk
+            by_name[product.name] = AMBIGUOUS if product.name in by_name else product.pk
+
+        changes = []
+        if create_missing:
+            missing = {}
+            for line, (sku, name, quantity, bp, sp) in parsed:
+                key = sku or name
+                if (by_sku.get(sku) if sku else by_name.get(name)) is None and key not in missing:
+                    missing[key] = Product(sku=sku, name=name or sku, buying_price=bp,
+                                           selling_price=sp, stock_quantity=0)
+            for product in Product.objects.bulk_create(missing.values()):
+                # bulk_create sends no post_save, so the feed is written here.
+                changes.append(events.product_event(product))
+                if product.sku:
+                    by_sku[product.sku] = product.pk
+                by_name.setdefault(product.name, product.pk)
+
+        stock_ins = []
+        added = {}
+        costs = {}
+        prices = {}
+        for line, (sku, name, quantity, bp, sp) in parsed:
+            product_id = by_sku.get(sku) if sku else by_name.get(name)
+            if product_id is None:
+                errors.append((line, f"unknown product {sku or name!r}"))
+                continue
+            if product_id is AMBIGUOUS:
+                errors.append((line, f"several products are named {name!r}; give the sku"))
+                continue
+            stock_ins.append(StockIn(product_id=product_id, branch_id=branch_id, quantity=quantity,
+                                     remaining_quantity=quantity, buying_price=bp, selling_price=sp))
+            added[product_id] = added.get(product_id, 0) + quantity
+            costs[product_id] = costs.get(product_id, 0) + quantity * bp
+            prices[product_id] = (bp, sp)  # the last delivery in the file sets the price
+
+        if stock_ins:
+            StockIn.objects.bulk_create(stock_ins)
+            movements.record([
+                StockMovement(product_id=stock_in.product_id, branch_id=branch_id, kind='STOCK_IN',
+                              quantity=stock_in.quantity, note=f"Stock in #{stock_in.pk}")
+                for stock_in in stock_ins
+            ])
+            changes += [events.stock_in_event(stock_in) for stock_in in stock_ins]
+            _add_stock(added, costs, prices)
+            branches.add_stock(branch_id, added)
+            caching.invalidate_stock(list(added))
+            catalog.touch(list(added))
+        events.emit(changes)
+
+    return len(stock_ins), errors
+
+
+def import_stock(rows, chunk_size=CHUNK_SIZE, create_missing=False, report=None, branch_id=MAIN_BRANCH):
+    """Import ``(line, row)`` pairs chunk by chunk; return ``(written, errors)``.
+
+    ``report`` is called after every chunk with ``(chunk_number, rows, seconds)``.
+    """
+    written, errors, chunk, number = 0, [], [], 0
+
+    def flush():
+        nonlocal written, number
+        number += 1
+        start = time.perf_counter()
+        count, chunk_errors = write_chunk(chunk, create_missing, branch_id)
+        written += count
+        errors.extend(chunk_errors)
+        if report:
+            report(number, count, time.perf_counter() - start)
+
+    for line, row in rows:
+        try:
+            chunk.append((line, parse_row(row)))
+        except ValueError as exc:
+            errors.append((line, str(exc)))
+            continue
+        if len(chunk) >= chunk_size:
+            flush()
+            chunk = []
+    if chunk:
+        flush()
+    return written, errors
@@ -0,0 +1,220 @@
+import os
+import signal
+import socket
+import threading
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.db import OperationalError, close_old_connections, connections
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+from .services import is_lock_error, retry_on_lock
+
+# Database-backed job queue. Views enqueue() a registered task and return;
+# `manage.py run_pos_worker` claims due jobs with a conditional UPDATE and
+# runs them on a thread or process pool. A failed attempt is queued again
+# with exponential backoff until max_attempts is reached. Nothing runs
+# until a worker is started, and it refuses a process-local cache: keep
+# POS_CACHE at file (the default) or redis.
+
+RETRY_BACKOFF = 30          # seconds before the second attempt, doubled after that
+STALE_AFTER = 60 * 60       # a RUNNING job this old belonged to a worker that died
+DEFAULT_CONCURRENCY = 2
+POLL_INTERVAL = 1.0
+
+TASKS = {}
+
+
+class UnknownTask(Exception):
+    pass
+
+
+def task(name, max_attempts=3):
+    """Register ``func`` as a job task under ``name``; its payload is passed as keyword arguments."""
+    def register(func):
+        func.max_attempts = max_attempts
+        TASKS[name] = func
+        return func
+    return register
+
+
+def enqueue(name, max_attempts=None, **payload):
+    """Queue task ``name`` with a JSON-serialisable payload; return the ``Job``.
+
+    The job waits for ``manage.py run_pos_worker``, which needs POS_CACHE
+    set to a shared backend (file or redis, not locmem).
+    """
+    if name not in TASKS:
+        raise UnknownTask(name)
+    return Job.objects.create(
+        task=name,
+        payload=payload,
+        max_attempts=max_attempts or TASKS[name].max_attempts
+    )
+
+
+def enqueue_once(name, **payload):
+    """``enqueue`` unless a job for ``name`` with this payload is already queued or running; return either.
+
+    Two requests racing here can still queue the same work twice, so the
+    task must be safe to repeat.
+    """
+    lookups = {f'payload__{key}': value for key, value in payload.items()}
+    pending = Job.objects.filter(task=name, status__in=['QUEUED', 'RUNNING'], **lookups).order_by('pk').first()
+    return pending or enqueue(name, **payload)
+
+
+def status(job):
+    """What a polling client needs to know about ``job``."""
+    return {
+        'id': job.pk,
+        'task': job.task,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'result': job.result,
+        'error': job.error.strip().splitlines()[-1] if job.error else '',
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    }
+
+
+@retry_on_lock
+def claim(limit, worker):
+    """Mark up to ``limit`` due jobs RUNNING for ``worker``; return their ids.
+
+    The UPDATE only takes rows that are still QUEUED, so two workers never
+    claim the same job.
+    """
+    token = f"{worker}:{uuid.uuid4().hex[:12]}"
+    now = timezone.now()
+    due = Job.objects.filter(status='QUEUED', run_after__lte=now).order_by('run_after', 'id')
+    claimed = Job.objects.filter(pk__in=list(due.values_list('pk', flat=True)[:limit]), status='QUEUED').update(
+        status='RUNNING', claimed_by=token, started_at=now, finished_at=None, attempts=F('attempts') + 1
+    )
+    if not claimed:
+        return []
+    return list(Job.objects.filter(status='RUNNING', claimed_by=token).values_list('pk', flat=True))
+
+
+def requeue_stale(older_than=STALE_AFTER):
+    """Recover RUNNING jobs whose worker died; return ``(requeued, failed)``.
+
+    A job with attempts left goes back on the queue. One that has used them
+    all is marked FAILED: its last attempt may have applied part of its
+    writes, and a task with ``max_attempts=1`` must never run twice.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status='RUNNING', started_at__lt=now - timedelta(seconds=older_than))
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='FAILED', finished_at=now, error='The worker running the last attempt stopped.'
+    )
+    requeued = stale.update(status='QUEUED', claimed_by='', run_after=now)
+    return requeued, failed
+
+
+def execute(job_id):
+    """Run one claimed job and record the outcome. Called on a pool thread or process."""
+    close_old_connections()
+    try:
+        job = Job.objects.get(pk=job_id)
+        try:
+            func = TASKS.get(job.task)
+            if func is None:
+                raise UnknownTask(job.task)
+            result = func(**job.payload)
+        except Exception as exc:
+            error = traceback.format_exc()
+            if isinstance(exc, UnknownTask) or job.attempts >= job.max_attempts:
+                _finish(job, status='FAILED', error=error)
+                return 'FAILED'
+            delay = RETRY_BACKOFF * (2 ** (job.attempts - 1))
+            _finish(job, status='QUEUED', error=error, claimed_by='', finished_at=None,
+                    run_after=timezone.now() + timedelta(seconds=delay))
+            return f'failed, retrying in {delay}s'
+        _finish(job, status='SUCCEEDED', result=result, error='')
+        return 'SUCCEEDED'
+    finally:
+        close_old_connections()
+
+
+@retry_on_lock
+def _finish(job, **fields):
+    fields.setdefault('finished_at', timezone.now())
+    # Only the claim that ran the job may record its outcome.
+    Job.objects.filter(pk=job.pk, claimed_by=job.claimed_by).update(**fields)
+
+
+def _init_process():
+    # Children must not share the parent's database connections.
+    connections.close_all()
+
+
+class Worker:
+    """Claim due jobs and run up to ``concurrency`` of them at a time."""
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, processes=False, poll=POLL_INTERVAL, log=None):
+        self.concurrency = concurrency
+        self.processes = processes
+        self.poll = poll
+        self.log = log or (lambda message: None)
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = threading.Event()
+
+    def stop(self, *args):
+        self.stopping.set()
+
+    def run(self, burst=False):
+        """Work until stopped; with ``burst``, exit once the queue is empty."""
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self.stop)
+            signal.signal(signal.SIGTERM, self.stop)
+
+        requeued, failed = requeue_stale()
+        if requeued or failed:
+            self.log(f"Jobs left running by a stopped worker: {requeued} requeued, {failed} out of attempts failed.")
+
+        if self.processes:
+            connections.close_all()
+            pool = ProcessPoolExecutor(self.concurrency, initializer=_init_process)
+        else:
+            pool = ThreadPoolExecutor(self.concurrency, thread_name_prefix='pos-job')
+
+        running = {}
+        try:
+            while not self.stopping.is_set():
+                free = self.concurrency - len(running)
+                if free:
+                    try:
+                        for job_id in claim(free, self.name):
+                            running[pool.submit(execute, job_id)] = job_id
+                            self.log(f"Started job #{job_id}")
+                    except OperationalError as exc:
+                        if not is_lock_error(exc):
+                            raise
+                if not running:
+                    if burst:
+                        break
+                    self.stopping.wait(self.poll)
+                    continue
+                done, _ = wait(running, timeout=self.poll, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.log(f"Job #{running.pop(future)} {_outcome(future)}")
+        finally:
+            # Let running jobs finish; queued ones stay for the next worker.
+            for future, job_id in running.items():
+                self.log(f"Job #{job_id} {_outcome(future)}")
+            pool.shutdown(wait=True)
+
+
+def _outcome(future):
+    try:
+        return future.result()
+    except Exception as exc:
+        # The job's own errors are recorded by execute(); this is the runner failing.
+        return f"could not be recorded: {exc!r}"
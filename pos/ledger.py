@@ -0,0 +1,63 @@
+from datetime import timedelta
+
+from django.db.models import Case, DecimalField, F, Q, Sum, Value, When
+from django.utils import timezone
+
+from .models import Customer, Sale
+
+# Receivables. Customer.balance is the customer's outstanding credit and is
+# moved only by add_debt() (credit sales) and services.allocate_payment()
+# (collections), always inside the writer's transaction.
+
+AGE_BUCKETS = [('current', 0, 30), ('days_31_60', 31, 60), ('over_60', 61, None)]
+
+
+def add_debt(customer_id, amount):
+    if customer_id and amount:
+        Customer.objects.filter(pk=customer_id).update(balance=F('balance') + amount)
+
+
+def add_debts(amounts):
+    """``add_debt`` for many customers at once: ``{customer_id: amount}``, one UPDATE."""
+    amounts = {pk: amount for pk, amount in amounts.items() if pk and amount}
+    if not amounts:
+        return
+    Customer.objects.filter(pk__in=amounts).update(balance=F('balance') + Case(
+        *[When(pk=pk, then=Value(amount)) for pk, amount in amounts.items()],
+        output_field=DecimalField(max_digits=12, decimal_places=2)
+    ))
+
+
+def aged_debtors(now=None):
+    """Debtors with their balance split into 0-30, 31-60 and 60+ day buckets.
+
+    Debtors come from the maintained balances; the split reads only open
+    sales (through the pending-payment partial index), never settled history.
+    """
+    now = now or timezone.now()
+    debtors = list(Customer.objects.filter(balance__gt=0).order_by('name'))
+    if not debtors:
+        return []
+
+    buckets = {}
+    for name, low, high in AGE_BUCKETS:
+        condition = Q(date__lte=now - timedelta(days=low))
+        if high is not None:
+            condition &= Q(date__gt=now - timedelta(days=high + 1))
+        buckets[name] = Sum('remaining_amount', filter=condition)
+    ages = {
+        row['customer_id']: row
+        for row in Sale.objects.filter(
+            status='PENDING_PAYMENT', customer_id__in=[c.pk for c in debtors]
+        ).values('customer_id').annotate(**buckets).order_by()
+    }
+
+    report = []
+    for customer in debtors:
+        row = ages.get(customer.pk, {})
+        report.append({
+            'customer': customer,
+            'balance': customer.balance,
+            **{name: row.get(name) or 0 for name, low, high in AGE_BUCKETS},
+        })
+    return report
@@ -0,0 +1,161 @@
+import re
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from pos.models import MAIN_BRANCH, Branch, Customer, PeriodClose, Product, Sale
+
+# Tables that grow with trading history; a plan that walks one of these
+# without an index is a regression. Catalogue tables may be listed in full.
+LARGE_TABLES = [
+    'pos_sale', 'pos_payment', 'pos_stockin', 'pos_receipt', 'pos_dailysalessummary',
+    'pos_dailytotalsummary', 'pos_stockmovement', 'pos_stocksnapshot', 'pos_job', 'pos_reordersuggestion',
+    'pos_archivedsale', 'pos_archivedpayment', 'pos_archivedstockin', 'pos_changeevent', 'pos_branchstock',
+    'pos_stocktransfer',
+]
+
+FULL_SCAN = re.compile(r'^SCAN (\w+)\b(?! USING (?:COVERING )?INDEX)')
+SKIPPED = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'PRAGMA')
+# Sent to the API endpoints, which turn requests away without a key.
+AUDIT_KEY = 'audit'
+
+
+class Rollback(Exception):
+    pass
+
+
+def view_requests(product, customer, sale, branch):
+    """Every request the POS views serve, with the parameters that reach each branch."""
+    cursor = f"{sale.date.isoformat()}_{sale.id}"
+    sale_post = {
+        'product': product.pk, 'customer': customer.pk, 'quantity': 1,
+        'selling_price': '15.00', 'payment_mode': 'CASH', 'paid_amount': '5.00',
+    }
+    return [
+        ('product_list', 'get', reverse('product_list'), {}),
+        ('product_list', 'get', reverse('product_list'), {'as_of': '2020-01-31'}),
+        ('product_list_async', 'get', reverse('product_list_async'), {'as_of': '2020-01-31'}),
+        ('low_stock_feed', 'get', reverse('low_stock_feed'), {}),
+        ('low_stock_feed_async', 'get', reverse('low_stock_feed_async'), {}),
+        ('product_create', 'post', reverse('product_create'),
+         {'name': 'audit', 'buying_price': '1', 'selling_price': '2', 'reorder_level': '5'}),
+        ('product_edit', 'post', reverse('product_edit', args=[product.pk]),
+         {'name': product.name, 'buying_price': '10', 'selling_price': '15', 'reorder_level': '5'}),
+        ('stock_in', 'get', reverse('stock_in'), {}),
+        ('stock_in', 'post', reverse('stock_in'),
+         {'product': product.pk, 'quantity': 5, 'buying_price': '10', 'selling_price': '15'}),
+        ('stock_adjust', 'post', reverse('stock_adjust'), {'product': product.pk, 'quantity': -1, 'note': 'audit'}),
+        ('stock_transfer', 'post', reverse('stock_transfer'),
+         {'product': product.pk, 'from_branch': MAIN_BRANCH, 'to_branch': branch.pk, 'quantity': 5}),
+        ('branch_list', 'get', reverse('branch_list'), {}),
+        ('branch_stock', 'get', reverse('branch_stock', args=[branch.pk]), {}),
+        ('sale_create', 'get', reverse('sale_create'), {}),
+        ('sale_create', 'post', reverse('sale_create'), sale_post),
+        ('sale_create', 'post', reverse('sale_create'), {**sale_post, 'branch': branch.pk}),
+        ('checkout', 'post', reverse('checkout'),
+         {**sale_post, 'product': [product.pk] * 3, 'quantity': [1] * 3, 'selling_price': [''] * 3}),
+        ('event_feed', 'get', reverse('event_feed', args=['audit']), {'from': 'start'}),
+        ('event_feed', 'get', reverse('event_feed', args=['audit']), {'limit': 10}),
+        ('sales_list', 'get', reverse('sales_list'), {}),
+        ('sales_list', 'get', reverse('sales_list'), {'after': cursor}),
+        ('sales_list', 'get', reverse('sales_list'),
+         {'start': '2020-01-01', 'end': '2020-01-31', 'status': 'PENDING_PAYMENT'}),
+        ('sales_list', 'get', reverse('sales_list'), {'customer': customer.pk}),
+        ('sales_list', 'get', reverse('sales_list'), {'branch': branch.pk}),
+        ('sales_export', 'get', reverse('sales_export'), {'start': '2020-01-01', 'end': '2020-01-31'}),
+        ('sales_export', 'get', reverse('sales_export'), {}),
+        ('sales_export_job', 'post', reverse('sales_export_job'), {'start': '2020-01-01', 'format': 'csv'}),
+        ('sale_receipt', 'get', reverse('sale_receipt', args=[sale.pk]), {}),
+        ('sale_invoice', 'get', reverse('sale_invoice', args=[sale.pk]), {'format': 'escpos'}),
+        ('customer_statement', 'get', reverse('customer_statement', args=[customer.pk]), {}),
+        ('statements_job', 'post', reverse('statements_job'), {}),
+        ('reorder_list', 'get', reverse('reorder_list'), {}),
+        ('reorder_list', 'get', reverse('reorder_list'), {'after': '1.5_10'}),
+        ('reorder_refresh', 'post', reverse('reorder_refresh'), {}),
+        ('analytics', 'get', reverse('analytics'), {}),
+        ('analytics_async', 'get', reverse('analytics_async'), {}),
+        ('analytics_series', 'get', reverse('analytics_series'), {}),
+        ('analytics_series', 'get', reverse('analytics_series'), {'bucket': 'month', 'split': 'product'}),
+        ('analytics_series', 'get', reverse('analytics_series'), {'bucket': 'week', 'split': 'payment_mode'}),
+        ('analytics_series', 'get', reverse('analytics_series'), {'split': 'product', 'branch': branch.pk}),
+        ('analytics_series', 'get', reverse('analytics_series'),
+         {'start': '2020-01-01', 'end': '2020-01-07', 'bucket': 'hour', 'split': 'customer'}),
+        ('analytics_rebuild', 'post', reverse('analytics_rebuild'), {}),
+    ]
+
+
+class Command(BaseCommand):
+    help = ("Run EXPLAIN QUERY PLAN on every query the POS views issue and fail "
+            "if any of them scans a large table without an index.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tables', nargs='+', default=LARGE_TABLES,
+                            help="Tables that must never be scanned in full")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("EXPLAIN QUERY PLAN is SQLite-only.")
+        self.large = set(options['tables'])
+        self.verbosity = options['verbosity']
+        self.failures = []
+        try:
+            dummy = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+            caches = {'default': dummy, 'fragments': dummy}
+            with transaction.atomic(), override_settings(CACHES=caches, POS_FEED_KEY=AUDIT_KEY):
+                self.audit()
+                raise Rollback
+        except Rollback:
+            pass
+
+        if self.failures:
+            for label, sql, detail in self.failures:
+                self.stderr.write(f"{label}: {detail}\n    {sql[:200]}")
+            raise CommandError(f"{len(self.failures)} queries scan a large table.")
+        self.stdout.write(self.style.SUCCESS("No full scans of large tables."))
+
+    def audit(self):
+        product = Product.objects.create(
+            name='audit-product', buying_price=Decimal('10'), selling_price=Decimal('15'),
+            stock_quantity=100,
+        )
+        customer = Customer.objects.create(name='audit-customer')
+        # A second branch, so the analytics pages aggregate per branch.
+        branch = Branch.objects.create(name='audit-branch', code='AUDIT')
+        # January 2020 is closed, so the 2020 filters below also read the archive.
+        PeriodClose.objects.create(month=date(2020, 1, 1))
+        sale = Sale.objects.create(
+            product=product, customer=customer, quantity=1, selling_price=15, total_price=15,
+            paid_amount=0, remaining_amount=15, profit=5, payment_mode='CREDIT',
+            status='PENDING_PAYMENT',
+        )
+        client = Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Bearer {AUDIT_KEY}')
+
+        for label, method, path, data in view_requests(product, customer, sale, branch):
+            with CaptureQueriesContext(connection) as captured:
+                response = getattr(client, method)(path, data)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            if response.status_code >= 400:
+                raise CommandError(f"{label} returned {response.status_code}")
+            for query in captured.captured_queries:
+                self.explain(label, query['sql'])
+
+    def explain(self, label, sql):
+        if sql.lstrip().upper().startswith(SKIPPED):
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            plan = [row[-1] for row in cursor.fetchall()]
+        if self.verbosity > 1:
+            self.stdout.write(f"{label}: {sql[:100]}")
+        for detail in plan:
+            match = FULL_SCAN.match(detail)
+            if match and match.group(1) in self.large:
+                self.failures.append((label, sql, detail))
+            if self.verbosity > 1:
+                self.stdout.write(f"    {detail}")
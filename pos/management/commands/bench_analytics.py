@@ -0,0 +1,104 @@
+import random
+import time
+import warnings
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from pos import rollup
+from pos.models import Product, Sale, PAYMENT_CHOICES
+
+
+class Rollback(Exception):
+    pass
+
+
+def legacy_totals(today):
+    """The four full-table aggregates analytics used to run over ``Sale``."""
+    with warnings.catch_warnings():
+        # The weekly filter compares a date with a DateTimeField, as it always did.
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return [
+            Sale.objects.filter(date__date=today).aggregate(s=Sum('total_price'), p=Sum('profit')),
+            Sale.objects.filter(date__gte=today - timedelta(days=7)).aggregate(s=Sum('total_price'), p=Sum('profit')),
+            Sale.objects.filter(date__month=today.month, date__year=today.year).aggregate(s=Sum('total_price'), p=Sum('profit')),
+            Sale.objects.filter(date__year=today.year).aggregate(s=Sum('total_price'), p=Sum('profit')),
+        ]
+
+
+class Command(BaseCommand):
+    help = ("Compare analytics over raw Sale rows with the DailySalesSummary rollup "
+            "on a synthetic dataset. Everything is rolled back afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--days', type=int, default=730)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def timed(self, func, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            self.stdout.write("Synthetic data rolled back.")
+
+    def run(self, options):
+        rows, days = options['rows'], options['days']
+        products = Product.objects.bulk_create([
+            Product(name=f'bench-{i}', buying_price=10, selling_price=15, stock_quantity=0)
+            for i in range(options['products'])
+        ])
+        product_ids = [p.pk for p in products]
+        modes = [mode for mode, label in PAYMENT_CHOICES]
+        now = timezone.now()
+
+        # Raw inserts so the synthetic dates are not overwritten by auto_now_add.
+        table = connection.ops.quote_name(Sale._meta.db_table)
+        sql = (
+            f"INSERT INTO {table} (product_id, quantity, selling_price, total_price, paid_amount, "
+            f"remaining_amount, cost_of_goods, profit, payment_mode, status, approved_by_pin, date) "
+            f"VALUES (%s, %s, 15, %s, %s, 0, 0, %s, %s, 'COMPLETED', 0, %s)"
+        )
+        start = time.perf_counter()
+        with connection.cursor() as cursor:
+            for offset in range(0, rows, 10000):
+                batch = []
+                for _ in range(min(10000, rows - offset)):
+                    qty = random.randint(1, 5)
+                    when = now - timedelta(seconds=random.randint(0, days * 86400))
+                    batch.append((
+                        random.choice(product_ids), qty, 15 * qty, 15 * qty, 5 * qty,
+                        random.choice(modes), connection.ops.adapt_datetimefield_value(when),
+                    ))
+                cursor.executemany(sql, batch)
+        self.stdout.write(f"Inserted {rows} sales in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        summary_rows = rollup.rebuild()
+        self.stdout.write(f"Built {summary_rows} summary rows in {time.perf_counter() - start:.1f}s")
+
+        today = timezone.localdate()
+        legacy = self.timed(lambda: legacy_totals(today), options['repeat'])
+        rolled = self.timed(lambda: rollup.dashboard_totals(today), options['repeat'])
+        low_stock = self.timed(
+            lambda: Product.objects.filter(stock_quantity__lte=F('reorder_level')).count(),
+            options['repeat']
+        )
+        self.stdout.write(f"Legacy Sale aggregates: {legacy * 1000:9.1f} ms")
+        self.stdout.write(f"Rollup dashboard query: {rolled * 1000:9.1f} ms")
+        self.stdout.write(f"Low-stock count:        {low_stock * 1000:9.1f} ms")
+        self.stdout.write(self.style.SUCCESS(f"Speed-up: {legacy / rolled:.0f}x"))
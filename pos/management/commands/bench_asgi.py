@@ -0,0 +1,187 @@
+import http.client
+import importlib.util
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# The same read pages served by gunicorn (WSGI, sync views) and by uvicorn
+# (ASGI, async views) with the same number of worker processes, against a
+# seeded scratch database in the production SQLite profile.
+
+ROUTES = {
+    'wsgi': ['/products/', '/analytics/', '/api/products/low-stock/'],
+    'asgi': ['/async/products/', '/async/analytics/', '/async/api/products/low-stock/'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f"Server on port {port} did not start within {timeout}s.")
+
+
+def drive(port, paths, threads, duration):
+    """Request ``paths`` round-robin from ``threads`` keep-alive connections; return latencies in ms."""
+    latencies = []
+    errors = [0]
+    stop = time.monotonic() + duration
+
+    def client(offset):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        i = offset
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            try:
+                conn.request('GET', paths[i % len(paths)])
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors[0] += 1
+            except (OSError, http.client.HTTPException):
+                errors[0] += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+            i += 1
+        conn.close()
+
+    pool = [threading.Thread(target=client, args=(n,)) for n in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return latencies, errors[0]
+
+
+class Command(BaseCommand):
+    help = ("Load-test the sync read views under gunicorn (WSGI) against the async "
+            "ones under uvicorn (ASGI) at the same worker count; report requests/s and p99.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Server worker processes")
+        parser.add_argument('--clients', type=int, default=2, help="Client processes")
+        parser.add_argument('--threads', type=int, default=8, help="Connections per client process")
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds of load per server")
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--seed', action='store_true', help="Seed the current database and exit (internal)")
+
+    def seed(self, count):
+        from pos.models import MAIN_BRANCH, BranchStock, Customer, Product
+        from pos.services import record_sale
+
+        products = Product.objects.bulk_create([
+            Product(name=f'Bench Product {i:05d}', sku=f'BENCH-{i:05d}',
+                    buying_price=Decimal('10.00'), selling_price=Decimal('15.00'),
+                    stock_quantity=100 if i % 10 else 3, reorder_level=5)
+            for i in range(count)
+        ], batch_size=1000)
+        BranchStock.objects.bulk_create([
+            BranchStock(branch_id=MAIN_BRANCH, product=product, quantity=product.stock_quantity) for product in products
+        ], batch_size=1000)
+        customer = Customer.objects.create(name='Bench Customer')
+        for product in Product.objects.all()[:200]:
+            record_sale(product, customer, 1, Decimal('15.00'), 'CASH', Decimal('15.00'))
+
+    def serve(self, kind, port, workers, env):
+        bind = f'127.0.0.1:{port}'
+        if kind == 'wsgi':
+            command = [sys.executable, '-m', 'gunicorn', 'config.wsgi:application',
+                       '--bind', bind, '--workers', str(workers), '--log-level', 'warning']
+        else:
+            command = [sys.executable, '-m', 'uvicorn', 'config.asgi:application',
+                       '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers),
+                       '--log-level', 'warning', '--no-access-log']
+        return subprocess.Popen(command, cwd=settings.BASE_DIR, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+    def run_server(self, kind, options, env):
+        port = free_port()
+        server = self.serve(kind, port, options['workers'], env)
+        try:
+            wait_for(port)
+            # Warm every worker's connection, templates and cache.
+            drive(port, ROUTES[kind], options['workers'] * 2, 1.0)
+            with ProcessPoolExecutor(options['clients']) as pool:
+                start = time.perf_counter()
+                results = list(pool.map(
+                    drive,
+                    [port] * options['clients'],
+                    [ROUTES[kind]] * options['clients'],
+                    [options['threads']] * options['clients'],
+                    [options['duration']] * options['clients'],
+                ))
+                elapsed = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        latencies = sorted(latency for result, _ in results for latency in result)
+        errors = sum(errors for _, errors in results)
+        return latencies, errors, elapsed
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['products'])
+            return
+        for module in ('gunicorn', 'uvicorn'):
+            if importlib.util.find_spec(module) is None:
+                raise CommandError(f"bench_asgi needs {module} installed (pip install {module}).")
+
+        manage = [sys.executable, str(Path(settings.BASE_DIR) / 'manage.py')]
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {
+                **os.environ,
+                'POS_DB_PROFILE': 'production',
+                # Several processes: the production profile needs a cache they share.
+                'POS_CACHE': 'file',
+                'POS_CACHE_LOCATION': str(Path(tmp) / 'cache'),
+                'POS_DB_NAME': str(Path(tmp) / 'bench.sqlite3'),
+                'DJANGO_SETTINGS_MODULE': 'config.settings',
+            }
+            subprocess.run(manage + ['migrate', '-v0'], env=env, check=True)
+            subprocess.run(manage + ['bench_asgi', '--seed', '--products', str(options['products'])],
+                           env=env, check=True)
+
+            self.stdout.write(
+                f"{options['workers']} server workers, {options['clients']} clients x "
+                f"{options['threads']} connections, {options['duration']:.0f}s per server"
+            )
+            results = {}
+            for kind in ('wsgi', 'asgi'):
+                latencies, errors, elapsed = self.run_server(kind, options, env)
+                if not latencies:
+                    raise CommandError(f"No {kind} request succeeded ({errors} errors).")
+                rate = len(latencies) / elapsed
+                p99 = latencies[int(len(latencies) * 0.99) - 1] if len(latencies) >= 100 else latencies[-1]
+                results[kind] = (rate, p99)
+                self.stdout.write(
+                    f"{kind:>5}: {len(latencies)} requests in {elapsed:.1f}s ({rate:.1f} req/s), "
+                    f"p50 {statistics.median(latencies):.1f}ms, p99 {p99:.1f}ms, {errors} errors"
+                )
+
+        (wsgi_rate, wsgi_p99), (asgi_rate, asgi_p99) = results['wsgi'], results['asgi']
+        self.stdout.write(self.style.SUCCESS(
+            f"asgi vs wsgi: {asgi_rate / wsgi_rate:.2f}x req/s, p99 {asgi_p99 / wsgi_p99:.2f}x"
+        ))
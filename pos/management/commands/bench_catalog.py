@@ -0,0 +1,77 @@
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.urls import reverse
+
+from pos import catalog
+from pos.models import MAIN_BRANCH, BranchStock, Product
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Post sales and baskets through the test client with the product catalog "
+            "cold and warm, counting Product reads per request. Everything is rolled back afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--sales', type=int, default=200)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            catalog.clear()
+            self.stdout.write("Synthetic data rolled back.")
+
+    def run(self, options):
+        products = Product.objects.bulk_create([
+            Product(name=f'bench-{i}', buying_price=Decimal('10.00'), selling_price=Decimal('15.00'),
+                    stock_quantity=10 ** 6)
+            for i in range(options['products'])
+        ])
+        BranchStock.objects.bulk_create([
+            BranchStock(branch_id=MAIN_BRANCH, product=product, quantity=product.stock_quantity) for product in products
+        ])
+        client = Client()
+
+        def sale(product):
+            return client.post(reverse('sale_create'), {
+                'product': product.pk, 'quantity': 1, 'selling_price': '15.00',
+                'payment_mode': 'CASH', 'paid_amount': '15.00',
+            })
+
+        def basket(start):
+            lines = [products[(start + i) % len(products)] for i in range(5)]
+            return client.post(reverse('checkout'), {
+                'product': [p.pk for p in lines], 'quantity': [1] * 5, 'selling_price': ['15.00'] * 5,
+                'payment_mode': 'CASH', 'paid_amount': '75.00',
+            })
+
+        for label, request in (("sale_create", sale), ("checkout, 5 lines", basket)):
+            for state in ('cold', 'warm'):
+                if state == 'cold':
+                    catalog.clear()
+                reads, queries, latencies = [], [], []
+                for i in range(options['sales']):
+                    with CaptureQueriesContext(connection) as captured:
+                        start = time.perf_counter()
+                        request(products[i % len(products)] if request is sale else i)
+                        latencies.append((time.perf_counter() - start) * 1000)
+                    queries.append(len(captured))
+                    reads.append(sum('FROM "pos_product"' in q['sql'] for q in captured.captured_queries))
+                self.stdout.write(
+                    f"{label:<18} {state}: {statistics.mean(reads):5.2f} Product reads/request, "
+                    f"{statistics.mean(queries):5.1f} queries, p50 {statistics.median(latencies):6.2f} ms"
+                )
+        self.stdout.write(f"Catalog: {catalog.stats()}")
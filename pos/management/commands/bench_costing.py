@@ -0,0 +1,111 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from pos import costing
+from pos.models import Product, Sale, StockIn
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Time the cost-layer engine on a synthetic history of stock movements: "
+            "a full replay, and per-sale consumption against open layers. "
+            "Everything is rolled back afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movements', type=int, default=1_000_000,
+                            help="Deliveries plus sales to generate")
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--days', type=int, default=730)
+        parser.add_argument('--sales', type=int, default=2000,
+                            help="Sales to cost one at a time after the replay")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            self.stdout.write("Synthetic data rolled back.")
+
+    def run(self, options):
+        movements = options['movements']
+        products = Product.objects.bulk_create([
+            Product(name=f'bench-cost-{i}', buying_price=10, selling_price=15, stock_quantity=0)
+            for i in range(options['products'])
+        ])
+        product_ids = [p.pk for p in products]
+        stock = dict.fromkeys(product_ids, 0)
+        start_at = timezone.now() - timedelta(days=options['days'])
+        step = options['days'] * 86400 / movements
+
+        # Raw inserts in date order so the synthetic dates survive auto_now_add.
+        stock_sql = (
+            f"INSERT INTO {connection.ops.quote_name(StockIn._meta.db_table)} "
+            f"(product_id, quantity, remaining_quantity, buying_price, selling_price, date) "
+            f"VALUES (%s, %s, 0, %s, 15, %s)"
+        )
+        sale_sql = (
+            f"INSERT INTO {connection.ops.quote_name(Sale._meta.db_table)} "
+            f"(product_id, quantity, selling_price, total_price, paid_amount, remaining_amount, "
+            f"cost_of_goods, profit, payment_mode, status, approved_by_pin, date) "
+            f"VALUES (%s, %s, 15, %s, %s, 0, 0, %s, 'CASH', 'COMPLETED', 0, %s)"
+        )
+        start = time.perf_counter()
+        deliveries, sales = [], []
+        with connection.cursor() as cursor:
+            for n in range(movements):
+                pk = random.choice(product_ids)
+                when = connection.ops.adapt_datetimefield_value(start_at + timedelta(seconds=n * step))
+                qty = random.randint(1, 5)
+                if stock[pk] < qty or random.random() < 0.1:
+                    received = random.randint(20, 100)
+                    price = Decimal(random.randint(800, 1200)) / 100
+                    deliveries.append((pk, received, price, when))
+                    stock[pk] += received
+                else:
+                    sales.append((pk, qty, 15 * qty, 15 * qty, 15 * qty, when))
+                    stock[pk] -= qty
+                if len(deliveries) + len(sales) >= 10000:
+                    cursor.executemany(stock_sql, deliveries)
+                    cursor.executemany(sale_sql, sales)
+                    deliveries, sales = [], []
+            cursor.executemany(stock_sql, deliveries)
+            cursor.executemany(sale_sql, sales)
+        for pk, quantity in stock.items():
+            Product.objects.filter(pk=pk).update(stock_quantity=quantity)
+        self.stdout.write(f"Inserted {movements} stock movements in {time.perf_counter() - start:.1f}s")
+
+        for method in [costing.AVERAGE, costing.FIFO]:
+            start = time.perf_counter()
+            replayed, changed = costing.replay(method)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"Replay {method:<7}: {replayed} sales, {changed} revalued in {elapsed:.1f}s "
+                f"({movements / elapsed:,.0f} movements/s)"
+            )
+
+        open_layers = StockIn.objects.filter(remaining_quantity__gt=0).count()
+        by_pk = {p.pk: p for p in Product.objects.filter(pk__in=product_ids)}
+        timings = []
+        for _ in range(options['sales']):
+            product = by_pk[random.choice(product_ids)]
+            start = time.perf_counter()
+            with transaction.atomic():
+                costing.consume([(product, random.randint(1, 5))], costing.FIFO)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        self.stdout.write(f"Open layers after replay: {open_layers}")
+        self.stdout.write(
+            f"Per-sale FIFO consume: p50 {timings[len(timings) // 2] * 1000:.2f} ms, "
+            f"p99 {timings[int(len(timings) * 0.99)] * 1000:.2f} ms"
+        )
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,76 @@
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+RECORDED = re.compile(r'(\d+) recorded')
+
+
+class Command(BaseCommand):
+    help = ("Load-test sale writes from several worker processes against a scratch "
+            "SQLite file, once per database profile, and compare sales per second.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Worker processes")
+        parser.add_argument('--sellers', type=int, default=4, help="Threads per worker")
+        parser.add_argument('--sales', type=int, default=50, help="Sales per thread")
+        parser.add_argument('--profiles', nargs='+', default=['default', 'production'])
+
+    def run_profile(self, profile, options):
+        manage = [sys.executable, str(Path(settings.BASE_DIR) / 'manage.py')]
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {
+                **os.environ,
+                'POS_DB_PROFILE': profile,
+                # Several processes: the production profile needs a cache they share.
+                'POS_CACHE': 'file',
+                'POS_CACHE_LOCATION': str(Path(tmp) / 'cache'),
+                'POS_DB_NAME': str(Path(tmp) / 'bench.sqlite3'),
+            }
+            subprocess.run(manage + ['migrate', '-v0'], env=env, check=True)
+
+            start = time.perf_counter()
+            workers = [
+                subprocess.Popen(
+                    manage + ['bench_sales_concurrency',
+                              '--sellers', str(options['sellers']),
+                              '--sales', str(options['sales'])],
+                    env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                )
+                for _ in range(options['workers'])
+            ]
+            outputs = [worker.communicate() for worker in workers]
+            elapsed = time.perf_counter() - start
+
+        recorded = failed = 0
+        for (out, err), worker in zip(outputs, workers):
+            match = RECORDED.search(out)
+            recorded += int(match.group(1)) if match else 0
+            failed += worker.returncode != 0
+        return recorded, failed, elapsed
+
+    def handle(self, *args, **options):
+        wanted = options['workers'] * options['sellers'] * options['sales']
+        self.stdout.write(
+            f"{options['workers']} workers x {options['sellers']} sellers x "
+            f"{options['sales']} sales = {wanted} sales per profile"
+        )
+        results = {}
+        for profile in options['profiles']:
+            recorded, failed, elapsed = self.run_profile(profile, options)
+            results[profile] = recorded / elapsed
+            self.stdout.write(
+                f"{profile:>12}: {recorded}/{wanted} sales in {elapsed:.2f}s "
+                f"({results[profile]:.1f} sales/s), {failed} workers failed"
+            )
+        if len(results) == 2:
+            (base_name, base), (tuned_name, tuned) = results.items()
+            self.stdout.write(self.style.SUCCESS(
+                f"{tuned_name} vs {base_name}: {tuned / base:.2f}x sales/s"
+            ))
@@ -0,0 +1,79 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from pos import events
+from pos.models import ChangeEvent
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Fill the change feed with synthetic events and time appending, consuming and "
+            "compacting them. Everything is rolled back afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=2_000_000)
+        parser.add_argument('--emitted', type=int, default=100_000,
+                            help="Events appended through emit(), one writer transaction per 10")
+        parser.add_argument('--batch-size', type=int, default=events.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            self.stdout.write("Synthetic events rolled back.")
+
+    def rate(self, label, count, seconds):
+        self.stdout.write(f"{label:<34} {count:>9} events in {seconds:6.2f}s, {count / seconds:>9,.0f}/s")
+
+    def run(self, options):
+        now = timezone.now()
+        sample = {'product': 1, 'customer': None, 'quantity': 2, 'total': '30.00', 'paid': '30.00',
+                  'status': 'COMPLETED', 'date': now.isoformat()}
+
+        # The write path: a sale's events go in with the sale, a few per transaction.
+        start = time.perf_counter()
+        for i in range(0, options['emitted'], 10):
+            with transaction.atomic():
+                events.emit([events.event('SALE', i + j, **sample) for j in range(10)])
+        self.rate("emit(), 10 per transaction", options['emitted'], time.perf_counter() - start)
+
+        # Bulk fill to the requested size.
+        table = ChangeEvent._meta.db_table
+        payload = json.dumps(sample)
+        created_at = connection.ops.adapt_datetimefield_value(now)
+        rows = ((['SALE', 'PAYMENT', 'STOCK_IN'][i % 3], i, payload, created_at) for i in range(options['events']))
+        start = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO "{table}" (kind, object_id, payload, created_at) VALUES (%s, %s, %s, %s)', rows
+            )
+        self.rate("bulk fill", options['events'], time.perf_counter() - start)
+        total = options['emitted'] + options['events']
+
+        # A consumer that falls behind catches up a batch at a time.
+        events.register('bench', from_start=True)
+        start = time.perf_counter()
+        consumed = events.consume('bench', lambda batch: None, batch_size=options['batch_size'])
+        self.rate(f"consume, batches of {options['batch_size']}", consumed, time.perf_counter() - start)
+
+        # Reading at the head of a large feed costs the same as at its start.
+        head = events.head()
+        for label, position in (("read at the start", 0), ("read near the head", head - options['batch_size'])):
+            start = time.perf_counter()
+            for _ in range(20):
+                events.read(position, options['batch_size'])
+            self.stdout.write(f"{label:<34} {(time.perf_counter() - start) / 20 * 1000:8.2f} ms per batch")
+
+        start = time.perf_counter()
+        deleted = events.compact()
+        self.rate("compact", deleted, time.perf_counter() - start)
+        self.stdout.write(f"{total} events written, {ChangeEvent.objects.count()} left after compaction.")
@@ -0,0 +1,110 @@
+import time
+from pathlib import Path
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template import Context, Engine
+
+from pos import fragments
+from pos.models import Customer, Product, Sale
+
+
+class Rollback(Exception):
+    pass
+
+
+TEMPLATES = Path(__file__).resolve().parents[2] / 'templates'
+
+
+class Command(BaseCommand):
+    help = ("Time rendering 10k-row product and sales tables inline, through the row "
+            "fragment cache cold and warm, and template loading with and without the "
+            "cached loader. Everything is rolled back afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def timed(self, func, repeat, setup=None):
+        best = None
+        for _ in range(repeat):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best * 1000
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            caches['fragments'].clear()
+            self.stdout.write("Synthetic data rolled back.")
+
+    def run(self, options):
+        rows, repeat = options['rows'], options['repeat']
+        products = Product.objects.bulk_create([
+            Product(name=f'bench-{i}', buying_price=10, selling_price=15, stock_quantity=i % 50)
+            for i in range(rows)
+        ], batch_size=2000)
+        customer = Customer.objects.create(name='bench-customer')
+        Sale.objects.bulk_create([
+            Sale(product=products[i], customer=customer, quantity=1, selling_price=15, total_price=15,
+                 paid_amount=15, profit=5, payment_mode='CASH')
+            for i in range(rows)
+        ], batch_size=2000)
+        tables = [
+            ('product', 'pos/rows/product_row.html', list(Product.objects.filter(name__startswith='bench-'))),
+            ('sale', 'pos/rows/sale_row.html',
+             list(Sale.objects.filter(customer=customer).select_related('product', 'customer'))),
+        ]
+        self.stdout.write(f"{rows} rows per table, best of {repeat}")
+
+        for kind, template_name, objects in tables:
+            # What the page did before: one {% for %} loop over the row markup.
+            source = (TEMPLATES / template_name).read_text()
+            inline = Engine.get_default().from_string(
+                f"{{% for {kind} in objects %}}{source}{{% endfor %}}"
+            )
+            inline_ms = self.timed(lambda: inline.render(Context({'objects': objects})), repeat)
+            cold_ms = self.timed(
+                lambda: fragments.render_rows(kind, template_name, objects, kind),
+                repeat, setup=caches['fragments'].clear,
+            )
+
+            def touch_one():
+                caches['fragments'].set(fragments._version_key(kind, objects[0].pk), fragments._token())
+            fragments.render_rows(kind, template_name, objects, kind)
+            one_changed_ms = self.timed(
+                lambda: fragments.render_rows(kind, template_name, objects, kind), repeat, setup=touch_one,
+            )
+            fragments.render_rows(kind, template_name, objects, kind)
+            warm_ms = self.timed(lambda: fragments.render_rows(kind, template_name, objects, kind), repeat)
+
+            self.stdout.write(f"{kind} table:")
+            self.stdout.write(f"  inline loop, no fragment cache: {inline_ms:8.1f} ms")
+            self.stdout.write(f"  fragments, cold cache:          {cold_ms:8.1f} ms")
+            self.stdout.write(f"  fragments, one row changed:     {one_changed_ms:8.1f} ms")
+            self.stdout.write(f"  fragments, unchanged page:      {warm_ms:8.1f} ms")
+            self.stdout.write(self.style.SUCCESS(
+                f"  one row changed {inline_ms / one_changed_ms:.0f}x, unchanged page "
+                f"{inline_ms / warm_ms:.0f}x faster than inline"
+            ))
+
+        dirs = [str(TEMPLATES)]
+        plain = Engine(dirs=dirs, loaders=['django.template.loaders.filesystem.Loader'])
+        cached = Engine(dirs=dirs, loaders=[
+            ('django.template.loaders.cached.Loader', ['django.template.loaders.filesystem.Loader']),
+        ])
+        names = ['pos/product_list.html', 'pos/sales_list.html', 'pos/rows/product_row.html']
+        plain_ms = self.timed(lambda: [plain.get_template(name) for name in names], repeat)
+        cached.get_template(names[0])
+        cached_ms = self.timed(lambda: [cached.get_template(name) for name in names], repeat)
+        self.stdout.write(
+            f"Loading {len(names)} templates: {plain_ms:.2f} ms uncached, {cached_ms:.3f} ms cached loader"
+        )
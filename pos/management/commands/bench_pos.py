@@ -0,0 +1,172 @@
+import json
+import statistics
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.urls import reverse
+
+from pos import seeding
+from pos.models import Customer, Product
+
+# End-to-end benchmark: seed a dataset of each size, drive the main views
+# through the test client and compare with a stored baseline. Query counts
+# must not grow at all; latency and throughput may drift by --tolerance
+# before a result counts as a regression. Run it against an empty scratch
+# database; latency baselines are only meaningful on the machine that
+# recorded them.
+
+BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'pos_baseline.json'
+SCENARIOS = ['sale_create', 'stock_in', 'sales_list', 'analytics', 'product_list']
+WARMUP = 3
+
+
+class Rollback(Exception):
+    pass
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = ("Seed datasets of several sizes, time the main POS views through the test "
+            "client and fail if results regress against the stored baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000], help="Sales per dataset")
+        parser.add_argument('--requests', type=int, default=30, help="Timed requests per view")
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+        parser.add_argument('--baseline', default=str(BASELINE))
+        parser.add_argument('--save-baseline', action='store_true', help="Store these results as the baseline")
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help="Allowed latency/throughput drift as a fraction (0.5 = 50%%)")
+
+    def handle(self, *args, **options):
+        if Product.objects.exists() or Customer.objects.exists():
+            raise CommandError(
+                "bench_pos needs an empty database so results compare with the baseline: "
+                "point POS_DB_NAME at a scratch file and migrate it first."
+            )
+        setup_test_environment()
+        results = {}
+        for size in options['sizes']:
+            self.stdout.write(f"Dataset of {size} sales:")
+            try:
+                with transaction.atomic():
+                    results[str(size)] = self.run_size(size, options)
+                    raise Rollback
+            except Rollback:
+                pass
+            for cache in ('default', 'fragments'):
+                caches[cache].clear()
+
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {baseline_path}"))
+            return
+        if not baseline_path.exists():
+            self.stdout.write(self.style.WARNING(f"No baseline at {baseline_path}; run with --save-baseline."))
+            return
+
+        regressions = self.compare(json.loads(baseline_path.read_text()), results, options['tolerance'])
+        if regressions:
+            raise CommandError("Regressions against the baseline:\n" + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+
+    def run_size(self, size, options):
+        seeding.seed(products=max(size // 20, 50), customers=max(size // 100, 10), sales=size, seed=size)
+        for cache in ('default', 'fragments'):
+            caches[cache].clear()
+
+        client = Client()
+        customer = Customer.objects.order_by('pk').first()
+        in_stock = list(Product.objects.filter(stock_quantity__gte=20).order_by('pk')[:20])
+        if not in_stock:
+            raise CommandError("The seeded dataset has no product in stock.")
+        counter = iter(range(10 ** 9))
+
+        def sale_create():
+            product = in_stock[next(counter) % len(in_stock)]
+            return client.post(reverse('sale_create'), {
+                'product': product.pk, 'customer': customer.pk, 'quantity': 1,
+                'selling_price': product.selling_price, 'payment_mode': 'CASH',
+                'paid_amount': product.selling_price,
+            })
+
+        def stock_in():
+            product = in_stock[next(counter) % len(in_stock)]
+            return client.post(reverse('stock_in'), {
+                'product': product.pk, 'quantity': 5,
+                'buying_price': product.buying_price, 'selling_price': product.selling_price,
+            })
+
+        def analytics():
+            # Measure the dashboard queries, not a cache hit.
+            caches['default'].clear()
+            return client.get(reverse('analytics'))
+
+        requests = {
+            'sale_create': sale_create,
+            'stock_in': stock_in,
+            'sales_list': lambda: client.get(reverse('sales_list')),
+            'analytics': analytics,
+            'product_list': lambda: client.get(reverse('product_list')),
+        }
+
+        report = {}
+        for name in options['scenarios']:
+            report[name] = self.measure(requests[name], options['requests'])
+            row = report[name]
+            self.stdout.write(
+                f"  {name:<13} {row['rps']:8.1f} req/s  p50 {row['p50_ms']:7.1f}ms  "
+                f"p95 {row['p95_ms']:7.1f}ms  p99 {row['p99_ms']:7.1f}ms  {row['queries']:3d} queries"
+            )
+        return report
+
+    def measure(self, request, count):
+        for _ in range(WARMUP):
+            request()
+        latencies = []
+        queries = 0
+        start = time.perf_counter()
+        for _ in range(count):
+            began = time.perf_counter()
+            with CaptureQueriesContext(connection) as captured:
+                response = request()
+            latencies.append((time.perf_counter() - began) * 1000)
+            if response.status_code >= 400:
+                raise CommandError(f"{response.request['PATH_INFO']} returned {response.status_code}")
+            queries = max(queries, len(captured))
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        return {
+            'rps': round(count / elapsed, 1),
+            'p50_ms': round(statistics.median(latencies), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'queries': queries,
+        }
+
+    def compare(self, baseline, results, tolerance):
+        regressions = []
+        for size, scenarios in results.items():
+            for name, row in scenarios.items():
+                base = baseline.get(size, {}).get(name)
+                if base is None:
+                    continue
+                label = f"{name} @ {size} sales"
+                if row['queries'] > base['queries']:
+                    regressions.append(f"{label}: {row['queries']} queries, baseline {base['queries']}")
+                if row['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+                    regressions.append(f"{label}: p95 {row['p95_ms']}ms, baseline {base['p95_ms']}ms")
+                if row['rps'] < base['rps'] / (1 + tolerance):
+                    regressions.append(f"{label}: {row['rps']} req/s, baseline {base['rps']} req/s")
+        return regressions
@@ -0,0 +1,87 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from pos import reorder
+from pos.models import DailySalesSummary, Product, StockMovement, PAYMENT_CHOICES
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Time a full and an incremental reorder refresh and the reorder list "
+            "over synthetic daily sales. Everything is rolled back afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50_000)
+        parser.add_argument('--days', type=int, default=730)
+        parser.add_argument('--rows', type=int, default=3_000_000, help="Daily summary rows")
+        parser.add_argument('--changed', type=int, default=500, help="Products touched before the incremental refresh")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            self.stdout.write("Synthetic data rolled back.")
+
+    def run(self, options):
+        products = Product.objects.bulk_create([
+            Product(name=f'bench-{i}', buying_price=10, selling_price=15,
+                    stock_quantity=random.randint(0, 200), reorder_level=5)
+            for i in range(options['products'])
+        ], batch_size=2000)
+        product_ids = [p.pk for p in products]
+        modes = [mode for mode, label in PAYMENT_CHOICES]
+        today = timezone.localdate()
+
+        table = connection.ops.quote_name(DailySalesSummary._meta.db_table)
+        sql = (
+            f"INSERT OR IGNORE INTO {table} (day, product_id, payment_mode, sale_count, quantity, "
+            f"total_sales, total_profit, paid_amount) VALUES (%s, %s, %s, 1, %s, 0, 0, 0)"
+        )
+        start = time.perf_counter()
+        with connection.cursor() as cursor:
+            for offset in range(0, options['rows'], 10000):
+                cursor.executemany(sql, [
+                    (today - timedelta(days=random.randint(0, options['days'] - 1)),
+                     random.choice(product_ids), random.choice(modes), random.randint(1, 10))
+                    for _ in range(min(10000, options['rows'] - offset))
+                ])
+        self.stdout.write(
+            f"{options['products']} products, {options['rows']} daily summary rows over "
+            f"{options['days']} days, inserted in {time.perf_counter() - start:.1f}s"
+        )
+
+        start = time.perf_counter()
+        written = reorder.refresh(full=True)
+        self.stdout.write(f"Full refresh:        {written:6d} products in {time.perf_counter() - start:6.2f}s")
+
+        StockMovement.objects.bulk_create([
+            StockMovement(product_id=pk, kind='ADJUSTMENT', quantity=-1, note='bench')
+            for pk in random.sample(product_ids, min(options['changed'], len(product_ids)))
+        ])
+        start = time.perf_counter()
+        written = reorder.refresh()
+        self.stdout.write(f"Incremental refresh: {written:6d} products in {time.perf_counter() - start:6.2f}s")
+
+        setup_test_environment()
+        client = Client()
+        client.get(reverse('reorder_list'))
+        start = time.perf_counter()
+        response = client.get(reverse('reorder_list'))
+        self.stdout.write(
+            f"Reorder list page:   {len(response.context['suggestions']):6d} rows in "
+            f"{(time.perf_counter() - start) * 1000:6.1f}ms "
+            f"({reorder.needed().count()} products to reorder)"
+        )
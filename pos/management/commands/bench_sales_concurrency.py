@@ -0,0 +1,76 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from pos.models import Product, Sale
+
+
+class Command(BaseCommand):
+    help = "Run N parallel sellers against one product and check throughput and final stock."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sellers', type=int, default=8)
+        parser.add_argument('--sales', type=int, default=50, help="Sales per seller")
+        parser.add_argument('--extra-stock', type=int, default=0,
+                            help="Stock above what the sellers need (0 = sell out exactly)")
+
+    def handle(self, *args, **options):
+        sellers, per_seller = options['sellers'], options['sales']
+        wanted = sellers * per_seller
+        product = Product.objects.create(
+            name='bench-concurrency',
+            buying_price=Decimal('10.00'),
+            selling_price=Decimal('15.00'),
+            stock_quantity=wanted + options['extra_stock'],
+        )
+        url = reverse('sale_create')
+        errors = []
+
+        def seller():
+            client = Client(HTTP_HOST='localhost')
+            try:
+                for _ in range(per_seller):
+                    response = client.post(url, {
+                        'product': product.pk,
+                        'quantity': 1,
+                        'selling_price': '15.00',
+                        'payment_mode': 'CASH',
+                        'paid_amount': '15.00',
+                    })
+                    if response.status_code != 302:
+                        errors.append(response.status_code)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=seller) for _ in range(sellers)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        try:
+            product.refresh_from_db()
+            sold = Sale.objects.filter(product=product).count()
+            self.stdout.write(
+                f"{sellers} sellers x {per_seller} sales: {sold} recorded in {elapsed:.2f}s "
+                f"({sold / elapsed:.1f} sales/s), final stock {product.stock_quantity}"
+            )
+            if errors:
+                raise CommandError(f"{len(errors)} sellers failed: {errors[:3]}")
+            if sold != wanted or product.stock_quantity != options['extra_stock']:
+                raise CommandError(
+                    f"Stock mismatch: expected {wanted} sales and stock "
+                    f"{options['extra_stock']}, got {sold} and {product.stock_quantity}"
+                )
+            self.stdout.write(self.style.SUCCESS("Final stock is consistent."))
+        finally:
+            product.delete()
@@ -0,0 +1,62 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from pos.models import Product
+from pos.search import search_products
+
+WORDS = [
+    'cement', 'nails', 'paint', 'bolt', 'hinge', 'pipe', 'wire', 'tile', 'brush', 'valve',
+    'sheet', 'timber', 'screw', 'padlock', 'hammer', 'elbow', 'socket', 'switch', 'glue', 'sand',
+]
+SIZES = ['2 inch', '4 inch', '1/2', '3/4', '10mm', '20mm', '50kg', '25kg', '1L', '4L', '20L']
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Time product typeahead lookups against a synthetic catalogue (rolled back afterwards)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50_000)
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--max-ms', type=float, default=10.0, help="Fail if p99 exceeds this")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                timings = self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+        timings.sort()
+        p50 = timings[len(timings) // 2]
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        self.stdout.write(f"{len(timings)} lookups over {options['products']} products: "
+                          f"p50 {p50:.2f} ms, p99 {p99:.2f} ms, max {timings[-1]:.2f} ms")
+        if p99 > options['max_ms']:
+            raise CommandError(f"p99 {p99:.2f} ms is over the {options['max_ms']} ms budget.")
+        self.stdout.write(self.style.SUCCESS("Within budget."))
+
+    def run(self, options):
+        Product.objects.bulk_create([
+            Product(
+                name=f"{random.choice(WORDS).title()} {random.choice(WORDS)} {random.choice(SIZES)} #{i}",
+                buying_price=10, selling_price=15, stock_quantity=random.randint(0, 200),
+            )
+            for i in range(options['products'])
+        ], batch_size=5000)
+
+        terms = [random.choice(WORDS)[:random.randint(2, 6)] for _ in range(options['queries'])]
+        terms += [random.choice(SIZES) for _ in range(options['queries'] // 5)]
+        timings = []
+        for term in terms:
+            start = time.perf_counter()
+            search_products(term)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
@@ -0,0 +1,64 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from pos import seeding, timeseries
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Time the sales time-series API for a year of daily buckets and the other "
+            "bucket and split combinations on a seeded history. Everything is rolled back afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sales', type=int, default=1_000_000)
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def timed(self, func, repeat):
+        best = None
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                func()
+                elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best * 1000, len(captured)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            self.stdout.write("Synthetic data rolled back.")
+
+    def run(self, options):
+        start = time.perf_counter()
+        seeding.seed(products=options['products'], customers=options['products'],
+                     sales=options['sales'], days=730, seed=1)
+        self.stdout.write(f"Seeded {options['sales']} sales in {time.perf_counter() - start:.1f}s")
+
+        end = timezone.localdate()
+        year, month, days = end - timedelta(days=364), end - timedelta(days=29), end - timedelta(days=6)
+        cases = [
+            ("year, daily", year, 'day', None, 0),
+            ("year, daily, top 10 products", year, 'day', None, 10),
+            ("year, weekly by payment mode", year, 'week', 'payment_mode', 0),
+            ("year, monthly by top 5 products", year, 'month', 'product', 5),
+            ("30 days, daily, top 10 products", month, 'day', None, 10),
+            ("30 days, daily by top 5 customers", month, 'day', 'customer', 5),
+            ("7 days, hourly", days, 'hour', None, 0),
+        ]
+        for label, first, bucket, split, top in cases:
+            ms, queries = self.timed(
+                lambda: timeseries.series(first, end, bucket=bucket, split=split, top=top), options['repeat'],
+            )
+            self.stdout.write(f"  {label:<36} {ms:8.1f} ms  {queries} queries")
@@ -0,0 +1,35 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pos import archive, checks, periods
+
+
+class Command(BaseCommand):
+    help = ("Close every open month up to --month, recording its totals, then move the "
+            "settled sales, payments and spent deliveries of closed months to the archive tables.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', required=True, help="Last month to close (YYYY-MM)")
+        parser.add_argument('--chunk-size', type=int, default=archive.ARCHIVE_CHUNK_SIZE,
+                            help="Rows moved per transaction")
+        parser.add_argument('--no-archive', action='store_true', help="Close without moving any rows")
+
+    def handle(self, *args, **options):
+        # Like run_pos_worker it runs beside the web processes, which must see what it changes.
+        checks.require_shared_caches('close_period')
+        try:
+            closes = periods.close(date.fromisoformat(f"{options['month']}-01"))
+        except ValueError as exc:
+            raise CommandError(exc)
+        for close in closes:
+            self.stdout.write(f"Closed {close.month:%Y-%m}: {close.sale_count} sales, {close.total_sales} total.")
+        if options['no_archive']:
+            return
+        moved = archive.archive(
+            chunk_size=options['chunk_size'],
+            stdout=self.stdout if options['verbosity'] > 1 else None
+        )
+        for label, count in moved.items():
+            self.stdout.write(f"Archived {count} {label}.")
+        self.stdout.write(self.style.SUCCESS(f"Periods closed up to {periods.boundary():%Y-%m-%d} (exclusive)."))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pos import events
+from pos.models import ChangeEvent, EventConsumer
+
+
+class Command(BaseCommand):
+    help = ("Delete the change events every consumer has processed. A consumer that stopped "
+            "reading holds every later event back; --retire removes it first.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=events.COMPACT_CHUNK_SIZE,
+                            help="Event ids deleted per transaction")
+        parser.add_argument('--retire', action='append', default=[], metavar='CONSUMER',
+                            help="Forget this consumer before compacting; may be repeated")
+
+    def handle(self, *args, **options):
+        for name in options['retire']:
+            if not EventConsumer.objects.filter(name=name).delete()[0]:
+                raise CommandError(f"No consumer {name!r}.")
+            self.stdout.write(f"Retired consumer {name}.")
+        deleted = events.compact(
+            chunk_size=options['chunk_size'],
+            stdout=self.stdout if options['verbosity'] > 1 else None
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{deleted} events deleted; {ChangeEvent.objects.count()} kept."
+        ))
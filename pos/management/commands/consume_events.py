@@ -0,0 +1,40 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from pos import events
+
+
+class Command(BaseCommand):
+    help = ("Append the change events a consumer has not seen yet to an NDJSON file and "
+            "advance its position. A batch interrupted before its position is saved is "
+            "written again on the next run, so readers of the file should skip ids they have seen.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumer', required=True, help="Consumer name; created on first use")
+        parser.add_argument('--output', required=True, help="NDJSON file to append to")
+        parser.add_argument('--from-start', action='store_true',
+                            help="A new consumer starts at the oldest event instead of the newest")
+        parser.add_argument('--batch-size', type=int, default=events.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        events.register(options['consumer'], from_start=options['from_start'])
+        start = time.perf_counter()
+        with open(options['output'], 'a', encoding='utf-8') as out:
+            def write(batch):
+                for e in batch:
+                    out.write(json.dumps({
+                        'id': e.pk, 'kind': e.kind, 'object_id': e.object_id,
+                        'payload': e.payload, 'created_at': e.created_at,
+                    }, cls=DjangoJSONEncoder) + '\n')
+                # On disk before the position moves past the batch.
+                out.flush()
+                os.fsync(out.fileno())
+
+            count = events.consume(options['consumer'], write, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} events appended to {options['output']} in {time.perf_counter() - start:.1f}s."
+        ))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pos.importer import CHUNK_SIZE, ImportFileError, import_stock, read_rows
+from pos.models import MAIN_BRANCH, Branch
+
+
+class Command(BaseCommand):
+    help = ("Import a supplier delivery (CSV or XLSX with sku, name, quantity, "
+            "buying_price, selling_price columns) as StockIn rows.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--create-missing', action='store_true',
+                            help="Create products that do not exist yet instead of rejecting their rows")
+        parser.add_argument('--branch', type=int, default=MAIN_BRANCH, help="Branch receiving the delivery")
+
+    def report(self, number, rows, seconds):
+        rate = rows / seconds if seconds else float('inf')
+        self.stdout.write(f"chunk {number}: {rows} rows in {seconds * 1000:.0f} ms ({rate:.0f} rows/s)")
+
+    def handle(self, *args, **options):
+        if not Branch.objects.filter(pk=options['branch']).exists():
+            raise CommandError(f"No branch with id {options['branch']}.")
+        start = time.perf_counter()
+        try:
+            with open(options['path'], 'rb') as fileobj:
+                written, errors = import_stock(
+                    read_rows(fileobj, options['path']),
+                    chunk_size=options['chunk_size'],
+                    create_missing=options['create_missing'],
+                    report=self.report,
+                    branch_id=options['branch'],
+                )
+        except (OSError, ImportFileError) as exc:
+            raise CommandError(exc)
+        elapsed = time.perf_counter() - start
+
+        for line, message in errors:
+            self.stderr.write(f"line {line}: {message}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {written} rows in {elapsed:.2f}s "
+            f"({written / elapsed:.0f} rows/s), {len(errors)} rejected."
+        ))
@@ -0,0 +1,23 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pos import rollup
+
+
+class Command(BaseCommand):
+    help = "Rebuild or backfill the DailySalesSummary rollup from Sale history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="First day to rebuild (YYYY-MM-DD); default all history")
+        parser.add_argument('--end', help="Last day to rebuild (YYYY-MM-DD); default all history")
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else None
+            end = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        written = rollup.rebuild(start, end, stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} daily summary rows."))
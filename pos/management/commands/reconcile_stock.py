@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from pos import branches, movements
+from pos.models import MAIN_BRANCH, Branch, BranchStock, StockMovement
+
+NOTE = "Reconciliation with stock_quantity"
+
+
+class Command(BaseCommand):
+    help = "Compare the stock movement ledger with Product.stock_quantity, or with one branch's stock."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help="Append adjustments so every branch's ledger matches its stock, "
+                                 "and the branches' total matches stock_quantity")
+        parser.add_argument('--branch', type=int, help="Check this branch's stock against its own movements")
+
+    def report(self, mismatches, where=''):
+        for pk, name, stock, ledger in mismatches:
+            self.stdout.write(f"{name} (#{pk}){where}: stock {stock}, ledger {ledger}, difference {stock - ledger:+d}")
+
+    def handle(self, *args, **options):
+        if options['branch'] and options['fix']:
+            raise CommandError("--fix reconciles every branch; run it without --branch.")
+        if options['fix']:
+            return self.fix()
+
+        if options['branch']:
+            mismatches = movements.reconcile_branch(options['branch'])
+        else:
+            mismatches = movements.reconcile()
+        self.report(mismatches)
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} products disagree with the ledger.")
+        self.stdout.write(self.style.SUCCESS("Ledger matches stock for every product."))
+
+    def fix(self):
+        unfixed = []
+        with transaction.atomic():
+            # First each branch's movements are brought to its BranchStock rows.
+            adjustments = []
+            for branch_id in Branch.objects.order_by('pk').values_list('pk', flat=True):
+                mismatches = movements.reconcile_branch(branch_id)
+                self.report(mismatches, f" at branch #{branch_id}")
+                adjustments += [
+                    StockMovement(product_id=pk, branch_id=branch_id, kind='ADJUSTMENT', quantity=stock - ledger,
+                                  note=NOTE)
+                    for pk, name, stock, ledger in mismatches
+                ]
+            movements.record(adjustments)
+
+            # What is left is stock_quantity against the branches' total: the
+            # main branch takes the difference, in its stock and its ledger.
+            totals = []
+            for pk, name, stock, ledger in movements.reconcile():
+                self.report([(pk, name, stock, ledger)])
+                difference = stock - ledger
+                if difference > 0:
+                    branches.add_stock(MAIN_BRANCH, {pk: difference})
+                elif not BranchStock.objects.filter(
+                    branch_id=MAIN_BRANCH, product_id=pk, quantity__gte=-difference
+                ).update(quantity=F('quantity') + difference):
+                    unfixed.append(name)
+                    continue
+                totals.append(StockMovement(product_id=pk, branch_id=MAIN_BRANCH, kind='ADJUSTMENT',
+                                            quantity=difference, note=NOTE))
+            movements.record(totals)
+
+        self.stdout.write(self.style.SUCCESS(f"Recorded {len(adjustments) + len(totals)} reconciling adjustments."))
+        if unfixed:
+            raise CommandError(
+                f"The main branch holds too few units to take the difference for: {', '.join(unfixed)}."
+            )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from pos import reorder
+
+
+class Command(BaseCommand):
+    help = ("Recompute reorder suggestions from sales velocity. Without --full only "
+            "products whose stock moved since the last refresh today are revisited.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Recompute every product")
+
+    def handle(self, *args, **options):
+        written = reorder.refresh(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f"Refreshed reorder suggestions for {written} products."))
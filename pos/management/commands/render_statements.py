@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pos import documents
+
+
+class Command(BaseCommand):
+    help = ("Render a statement for every customer with an outstanding balance on a process "
+            "pool. Statements whose content has not changed are left as they are on disk.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(documents.FORMATS), default='html')
+        parser.add_argument('--workers', type=int, help="Processes to render on; default one per CPU")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        statements, created = documents.render_statements(
+            options['format'], workers=options['workers'],
+            stdout=self.stdout if options['verbosity'] > 1 else None
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{statements} statements ready in {time.perf_counter() - start:.1f}s; {created} newly written."
+        ))
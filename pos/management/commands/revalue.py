@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pos import caching, costing, fragments, rollup
+
+
+class Command(BaseCommand):
+    help = ("Replay every delivery and sale in date order to recompute cost of goods, "
+            "profit, open cost layers and average costs, then rebuild the daily summary.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--method', choices=costing.METHODS,
+                            help="Costing method; default POS_COSTING_METHOD")
+        parser.add_argument('--batch-size', type=int, default=costing.REPLAY_BATCH_SIZE,
+                            help="Rows read and written per query")
+
+    def handle(self, *args, **options):
+        method = options['method'] or costing.costing_method()
+        start = time.perf_counter()
+        sales, changed = costing.replay(
+            method, batch_size=options['batch_size'],
+            stdout=self.stdout if options['verbosity'] > 1 else None
+        )
+        self.stdout.write(f"Replayed {sales} sales ({method}) in {time.perf_counter() - start:.1f}s; "
+                          f"{changed} changed cost.")
+        if changed:
+            written = rollup.rebuild()
+            caching.invalidate_sales()
+            fragments.touch('sale')
+            self.stdout.write(f"Rebuilt {written} daily summary rows.")
+        self.stdout.write(self.style.SUCCESS("Revaluation complete."))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from pos import checks, jobs
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (reports, exports, imports) until stopped."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=jobs.DEFAULT_CONCURRENCY,
+                            help="Jobs run at the same time")
+        parser.add_argument('--processes', action='store_true',
+                            help="Run jobs in a process pool instead of threads")
+        parser.add_argument('--poll', type=float, default=jobs.POLL_INTERVAL,
+                            help="Seconds between queue checks when idle")
+        parser.add_argument('--burst', action='store_true',
+                            help="Exit once no job is due instead of waiting for more")
+
+    def handle(self, *args, **options):
+        # The worker is always a process of its own: the cache invalidations
+        # its tasks make must land in a cache the web processes read.
+        checks.require_shared_caches('this worker')
+        worker = jobs.Worker(
+            concurrency=options['concurrency'],
+            processes=options['processes'],
+            poll=options['poll'],
+            log=self.stdout.write,
+        )
+        kind = 'processes' if options['processes'] else 'threads'
+        self.stdout.write(f"Worker {worker.name} running {options['concurrency']} {kind}.")
+        worker.run(burst=options['burst'])
+        self.stdout.write(self.style.SUCCESS("Worker stopped."))
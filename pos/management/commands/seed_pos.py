@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pos import seeding
+
+
+class Command(BaseCommand):
+    help = ("Generate a synthetic shop history: products, customers, deliveries, "
+            "sales with mixed payment modes and credit, and payments.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--customers', type=int, default=200)
+        parser.add_argument('--sales', type=int, default=20000)
+        parser.add_argument('--days', type=int, default=365, help="Days of history")
+        parser.add_argument('--chunk-size', type=int, default=seeding.CHUNK_SIZE, help="Rows per INSERT")
+        parser.add_argument('--seed', type=int, help="Random seed, for a repeatable dataset")
+
+    def handle(self, *args, **options):
+        if options['products'] < 1 or options['days'] < 1:
+            raise CommandError("--products and --days must be at least 1.")
+        start = time.perf_counter()
+        counts = seeding.seed(
+            products=options['products'], customers=options['customers'], sales=options['sales'],
+            days=options['days'], chunk_size=options['chunk_size'], seed=options['seed'],
+            stdout=self.stdout if options['verbosity'] > 0 else None,
+        )
+        summary = ', '.join(f"{count} {name.replace('_', '-')}" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Seeded {summary} in {time.perf_counter() - start:.1f}s."))
@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from pos import movements
+
+
+class Command(BaseCommand):
+    help = ("Snapshot stock from the movement ledger for products that moved since their "
+            "last snapshot. Run it daily (e.g. from cron) so point-in-time stock queries read a short tail.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--at', help="Snapshot time, ISO date or date-time; default the start of today")
+
+    def handle(self, *args, **options):
+        at = None
+        if options['at']:
+            try:
+                at = datetime.fromisoformat(options['at'])
+            except ValueError as exc:
+                raise CommandError(exc)
+            if timezone.is_naive(at):
+                at = timezone.make_aware(at)
+
+        written = movements.take_snapshots(at)
+        self.stdout.write(self.style.SUCCESS(f"Snapshotted {written} products."))
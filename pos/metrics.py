@@ -0,0 +1,164 @@
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+# In-process request metrics. RequestMetricsMiddleware fills a RequestStats
+# per request; finished requests go into a rolling window per view from
+# which the percentiles are read. Each worker process keeps its own window.
+# Template time comes from TimedDjangoTemplates, the template backend
+# configured in settings.
+
+WINDOW = 1000
+QUANTILES = [0.5, 0.95, 0.99]
+FIELDS = ['total_ms', 'db_ms', 'template_ms', 'queries']
+
+current = ContextVar('pos_request_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = ['queries', 'db_ms', 'template_ms']
+
+    def __init__(self):
+        self.queries = 0
+        self.db_ms = 0.0
+        self.template_ms = 0.0
+
+
+def observe(execute, sql, params, many, context):
+    """Execute wrapper: count and time the query against the request in ``current``.
+
+    Reading the request from the context variable rather than the
+    connection means queries an async view runs on an executor thread are
+    still counted.
+    """
+    stats = current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_ms += (time.perf_counter() - start) * 1000
+
+
+def watch(connection, **kwargs):
+    """Install ``observe`` on a connection once; also a ``connection_created`` receiver."""
+    if observe not in connection.execute_wrappers:
+        connection.execute_wrappers.append(observe)
+
+
+class Registry:
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: {field: deque(maxlen=self.window) for field in FIELDS})
+        self.counts = defaultdict(int)
+        self.sums = defaultdict(float)
+
+    def record(self, view, stats, total_ms):
+        values = {
+            'total_ms': total_ms,
+            'db_ms': stats.db_ms,
+            'template_ms': stats.template_ms,
+            'queries': stats.queries,
+        }
+        with self.lock:
+            for field, value in values.items():
+                self.samples[view][field].append(value)
+            self.counts[view] += 1
+            self.sums[view] += total_ms
+
+    def summary(self):
+        """Per view: request count and p50/p95/p99 of every field over the window."""
+        with self.lock:
+            snapshot = {
+                view: {field: sorted(values) for field, values in fields.items()}
+                for view, fields in self.samples.items()
+            }
+            counts = dict(self.counts)
+            sums = dict(self.sums)
+        result = {}
+        for view, fields in sorted(snapshot.items()):
+            result[view] = {
+                'count': counts[view],
+                'total_ms_sum': sums[view],
+                **{
+                    field: {f'p{int(q * 100)}': percentile(values, q) for q in QUANTILES}
+                    for field, values in fields.items()
+                },
+            }
+        return result
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.counts.clear()
+            self.sums.clear()
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+registry = Registry()
+
+
+def prometheus_text(summary=None):
+    summary = registry.summary() if summary is None else summary
+    lines = [
+        '# HELP pos_request_latency_seconds Request latency per view.',
+        '# TYPE pos_request_latency_seconds summary',
+    ]
+    for view, data in summary.items():
+        for q in QUANTILES:
+            value = data['total_ms'][f'p{int(q * 100)}']
+            lines.append(f'pos_request_latency_seconds{{view="{view}",quantile="{q}"}} {value / 1000:.6f}')
+        lines.append(f'pos_request_latency_seconds_sum{{view="{view}"}} {data["total_ms_sum"] / 1000:.6f}')
+        lines.append(f'pos_request_latency_seconds_count{{view="{view}"}} {data["count"]}')
+    for field, name, scale in [
+        ('db_ms', 'pos_request_db_seconds', 1000),
+        ('template_ms', 'pos_request_template_seconds', 1000),
+        ('queries', 'pos_request_queries', 1),
+    ]:
+        lines.append(f'# TYPE {name} summary')
+        for view, data in summary.items():
+            for q in QUANTILES:
+                value = data[field][f'p{int(q * 100)}'] / scale
+                lines.append(f'{name}{{view="{view}",quantile="{q}"}} {value:g}')
+    return '\n'.join(lines) + '\n'
+
+
+class TimedTemplate(Template):
+    """A backend template whose renders are timed into the current request."""
+
+    def render(self, context=None, request=None):
+        stats = current.get()
+        if stats is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_ms += (time.perf_counter() - start) * 1000
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, handing out ``TimedTemplate``s."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0005_alter_sale_payment_mode_payment'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='sale',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='pos.sale'),
+        ),
+        migrations.CreateModel(
+            name='Receipt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('paid_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('remaining_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('profit', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('payment_mode', models.CharField(choices=[('CASH', 'Cash'), ('MPESA', 'M-Pesa'), ('BANK', 'Bank Transfer'), ('LOOP', 'Loop'), ('CREDIT', 'Credit')], max_length=50)),
+                ('status', models.CharField(choices=[('COMPLETED', 'Completed'), ('PENDING_PAYMENT', 'Pending Payment')], default='COMPLETED', max_length=20)),
+                ('approved_by_pin', models.BooleanField(default=False)),
+                ('date', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='pos.customer')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='receipt',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='pos.receipt'),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='receipt',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='pos.receipt'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0008_dailysalessummary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['date'], name='payment_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock_quantity__lte', models.F('reorder_level'))), fields=['name'], name='product_low_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['status', 'date'], name='sale_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(condition=models.Q(('status', 'PENDING_PAYMENT')), fields=['customer', 'date'], name='sale_pending_customer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockin',
+            index=models.Index(fields=['date'], name='stockin_date_idx'),
+        ),
+    ]
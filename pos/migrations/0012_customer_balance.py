@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:04
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+
+
+def backfill_balances(apps, schema_editor):
+    Customer = apps.get_model('pos', 'Customer')
+    Sale = apps.get_model('pos', 'Sale')
+    outstanding = (
+        Sale.objects.filter(customer=OuterRef('pk'), status='PENDING_PAYMENT')
+        .values('customer')
+        .annotate(total=Sum('remaining_amount'))
+        .values('total')
+    )
+    Customer.objects.filter(
+        pk__in=Sale.objects.filter(status='PENDING_PAYMENT').values('customer')
+    ).update(balance=Subquery(outstanding))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0011_product_sku'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='balance',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(condition=models.Q(('balance__gt', 0)), fields=['name'], name='customer_debtor_idx'),
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:08
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_costs(apps, schema_editor):
+    # Existing sales keep the cost their profit was computed from; run
+    # ``manage.py revalue`` to rebuild the cost layers from history.
+    Product = apps.get_model('pos', 'Product')
+    Sale = apps.get_model('pos', 'Sale')
+    Product.objects.update(average_cost=F('buying_price'))
+    Sale.objects.update(cost_of_goods=F('total_price') - F('profit'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0013_sale_client_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='average_cost',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='cost_of_goods',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='stockin',
+            name='remaining_quantity',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='stockin',
+            index=models.Index(condition=models.Q(('remaining_quantity__gt', 0)), fields=['product', 'date', 'id'], name='stockin_open_layer_idx'),
+        ),
+        migrations.RunPython(backfill_costs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:17
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def opening_balances(apps, schema_editor):
+    # Start the ledger from the stock on hand today so it sums to stock_quantity.
+    Product = apps.get_model('pos', 'Product')
+    StockMovement = apps.get_model('pos', 'StockMovement')
+    StockMovement.objects.bulk_create([
+        StockMovement(product_id=pk, kind='OPENING', quantity=quantity, note='Opening balance')
+        for pk, quantity in Product.objects.filter(stock_quantity__gt=0).values_list('id', 'stock_quantity')
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0014_inventory_costing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('OPENING', 'Opening Balance'), ('STOCK_IN', 'Stock In'), ('SALE', 'Sale'), ('ADJUSTMENT', 'Adjustment')], max_length=20)),
+                ('quantity', models.IntegerField()),
+                ('date', models.DateTimeField(default=django.utils.timezone.now)),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pos.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'date'], name='movement_product_date_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField()),
+                ('quantity', models.IntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pos.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'date'), name='stock_snapshot_unique')],
+            },
+        ),
+        migrations.RunPython(opening_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:47
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_totals(apps, schema_editor):
+    DailySalesSummary = apps.get_model('pos', 'DailySalesSummary')
+    DailyTotalSummary = apps.get_model('pos', 'DailyTotalSummary')
+    DailyTotalSummary.objects.bulk_create([
+        DailyTotalSummary(**row)
+        for row in DailySalesSummary.objects.values('day', 'payment_mode').annotate(
+            sale_count=Sum('sale_count'),
+            quantity=Sum('quantity'),
+            total_sales=Sum('total_sales'),
+            total_profit=Sum('total_profit'),
+            paid_amount=Sum('paid_amount'),
+        ).order_by()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0017_reorder_suggestion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyTotalSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('payment_mode', models.CharField(choices=[('CASH', 'Cash'), ('MPESA', 'M-Pesa'), ('BANK', 'Bank Transfer'), ('LOOP', 'Loop'), ('CREDIT', 'Credit')], max_length=50)),
+                ('sale_count', models.PositiveIntegerField(default=0)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('total_sales', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_profit', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('paid_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='dailysalessummary',
+            index=models.Index(fields=['day', 'product', 'quantity', 'total_sales', 'total_profit'], name='daily_summary_product_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailytotalsummary',
+            constraint=models.UniqueConstraint(fields=('day', 'payment_mode'), name='daily_total_unique'),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
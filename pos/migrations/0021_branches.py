@@ -0,0 +1,186 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:14
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def main_branch(apps, schema_editor):
+    # Every existing row belongs to the one shop there was, created first so
+    # the new columns' default has something to point at.
+    Branch = apps.get_model('pos', 'Branch')
+    Branch.objects.create(id=1, name='Main', code='MAIN')
+
+
+def opening_stock(apps, schema_editor):
+    Product = apps.get_model('pos', 'Product')
+    BranchStock = apps.get_model('pos', 'BranchStock')
+    BranchStock.objects.bulk_create([
+        BranchStock(branch_id=1, product_id=pk, quantity=quantity)
+        for pk, quantity in Product.objects.filter(stock_quantity__gt=0).values_list('id', 'stock_quantity')
+    ], batch_size=1000)
+    for name in ('ArchivedSale', 'ArchivedStockIn'):
+        apps.get_model('pos', name).objects.update(branch_id=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0020_change_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Branch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('code', models.CharField(max_length=10, unique=True)),
+            ],
+        ),
+        migrations.RunPython(main_branch, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='BranchStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockTransfer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('date', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RemoveConstraint(
+            model_name='dailysalessummary',
+            name='daily_summary_unique',
+        ),
+        migrations.RemoveConstraint(
+            model_name='dailytotalsummary',
+            name='daily_total_unique',
+        ),
+        migrations.AlterField(
+            model_name='changeevent',
+            name='kind',
+            field=models.CharField(choices=[('SALE', 'Sale'), ('PAYMENT', 'Payment'), ('STOCK_IN', 'Stock In'), ('ADJUSTMENT', 'Adjustment'), ('PRODUCT', 'Product'), ('TRANSFER', 'Transfer')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='kind',
+            field=models.CharField(choices=[('OPENING', 'Opening Balance'), ('STOCK_IN', 'Stock In'), ('SALE', 'Sale'), ('ADJUSTMENT', 'Adjustment'), ('TRANSFER', 'Transfer')], max_length=20),
+        ),
+        migrations.AddField(
+            model_name='archivedsale',
+            name='branch',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='pos.branch'),
+        ),
+        migrations.AddField(
+            model_name='archivedstockin',
+            name='branch',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='pos.branch'),
+        ),
+        migrations.AddField(
+            model_name='dailysalessummary',
+            name='branch',
+            field=models.ForeignKey(db_default=1, default=1, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='pos.branch'),
+        ),
+        migrations.AddField(
+            model_name='dailytotalsummary',
+            name='branch',
+            field=models.ForeignKey(db_default=1, default=1, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='pos.branch'),
+        ),
+        migrations.AddField(
+            model_name='receipt',
+            name='branch',
+            field=models.ForeignKey(db_default=1, default=1, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='pos.branch'),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='branch',
+            field=models.ForeignKey(db_default=1, default=1, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='pos.branch'),
+        ),
+        migrations.AddField(
+            model_name='stockin',
+            name='branch',
+            field=models.ForeignKey(db_default=1, default=1, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='pos.branch'),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='branch',
+            field=models.ForeignKey(db_default=1, default=1, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='pos.branch'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedsale',
+            index=models.Index(fields=['branch', 'date', 'id'], name='archived_sale_branch_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailysalessummary',
+            index=models.Index(fields=['branch', 'day', 'product'], name='daily_summary_branch_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailytotalsummary',
+            index=models.Index(fields=['branch', 'day'], name='daily_total_branch_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['branch', 'date', 'id'], name='sale_branch_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockin',
+            index=models.Index(fields=['branch', 'date'], name='stockin_branch_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['branch', 'product'], name='movement_branch_product_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailysalessummary',
+            constraint=models.UniqueConstraint(fields=('day', 'product', 'payment_mode', 'branch'), name='daily_summary_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailytotalsummary',
+            constraint=models.UniqueConstraint(fields=('day', 'payment_mode', 'branch'), name='daily_total_unique'),
+        ),
+        migrations.AddField(
+            model_name='branchstock',
+            name='branch',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='pos.branch'),
+        ),
+        migrations.AddField(
+            model_name='branchstock',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pos.product'),
+        ),
+        migrations.AddField(
+            model_name='stocktransfer',
+            name='from_branch',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='transfers_out', to='pos.branch'),
+        ),
+        migrations.AddField(
+            model_name='stocktransfer',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pos.product'),
+        ),
+        migrations.AddField(
+            model_name='stocktransfer',
+            name='to_branch',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='transfers_in', to='pos.branch'),
+        ),
+        migrations.AddConstraint(
+            model_name='branchstock',
+            constraint=models.UniqueConstraint(fields=('branch', 'product'), name='branch_stock_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='stocktransfer',
+            index=models.Index(fields=['from_branch', 'date'], name='transfer_from_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stocktransfer',
+            index=models.Index(fields=['to_branch', 'date'], name='transfer_to_date_idx'),
+        ),
+        migrations.RunPython(opening_stock, migrations.RunPython.noop),
+    ]
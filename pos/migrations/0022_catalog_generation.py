@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:33
+
+from django.db import migrations, models
+
+
+def first_generation(apps, schema_editor):
+    # pos.catalog reads and bumps this one row; without it nothing is cached.
+    apps.get_model('pos', 'CatalogGeneration').objects.create(id=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0021_branches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(first_generation, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0022_catalog_generation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(
+                condition=models.Q(('status__in', ['QUEUED', 'RUNNING'])), fields=['task'], name='job_pending_idx'
+            ),
+        ),
+    ]
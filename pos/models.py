@@ -1,4 +1,7 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models.functions import Collate
+from django.utils import timezone
 
 # Create your models here.
 
@@ -16,57 +19,475 @@ STATUS_CHOICES = [
     ('PENDING_PAYMENT', 'Pending Payment'),
 ]
 
+JOB_STATUS_CHOICES = [
+    ('QUEUED', 'Queued'),
+    ('RUNNING', 'Running'),
+    ('SUCCEEDED', 'Succeeded'),
+    ('FAILED', 'Failed'),
+]
+
+MOVEMENT_CHOICES = [
+    ('OPENING', 'Opening Balance'),
+    ('STOCK_IN', 'Stock In'),
+    ('SALE', 'Sale'),
+    ('ADJUSTMENT', 'Adjustment'),
+    ('TRANSFER', 'Transfer'),
+]
+
+EVENT_CHOICES = [
+    ('SALE', 'Sale'),
+    ('PAYMENT', 'Payment'),
+    ('STOCK_IN', 'Stock In'),
+    ('ADJUSTMENT', 'Adjustment'),
+    ('PRODUCT', 'Product'),
+    ('TRANSFER', 'Transfer'),
+]
+
+# The branch created by the migrations; writers that are not told otherwise use it.
+MAIN_BRANCH = 1
+
+# ---------- Branch ----------
+class Branch(models.Model):
+    """A shop. Stock, sales and deliveries each belong to one branch."""
+    name = models.CharField(max_length=100, unique=True)
+    code = models.CharField(max_length=10, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+def _branch_fk():
+    # The database default keeps bulk loaders that predate branches writing to the main branch.
+    return models.ForeignKey(Branch, on_delete=models.PROTECT, default=MAIN_BRANCH, db_default=MAIN_BRANCH,
+                             related_name='+')
+
 # ---------- Product ----------
 class Product(models.Model):
     name = models.CharField(max_length=255)
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     buying_price = models.DecimalField(max_digits=10, decimal_places=2)
     selling_price = models.DecimalField(max_digits=10, decimal_places=2)
     stock_quantity = models.PositiveIntegerField(default=0)
     reorder_level = models.PositiveIntegerField(default=5)
+    # Weighted-average unit cost of the stock on hand, moved by every delivery.
+    average_cost = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+
+    class Meta:
+        indexes = [
+            # Only products at or below their reorder level; serves the
+            # low-stock count without touching the rest of the catalogue.
+            models.Index(
+                fields=['name'],
+                condition=models.Q(stock_quantity__lte=models.F('reorder_level')),
+                name='product_low_stock_idx',
+            ),
+            # Case-insensitive prefix lookups (name LIKE 'ab%') for short search terms.
+            models.Index(Collate('name', 'NOCASE'), name='product_name_nocase_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+
+class BranchStock(models.Model):
+    """Units of a product on hand at one branch; ``Product.stock_quantity`` is the sum over branches."""
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Leads on branch, so one branch's stock is read without touching the others'.
+            models.UniqueConstraint(fields=['branch', 'product'], name='branch_stock_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.branch_id}/{self.product_id}: {self.quantity}"
+
+
+class StockTransfer(models.Model):
+    """Units moved from one branch's stock to another's."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    from_branch = models.ForeignKey(Branch, on_delete=models.PROTECT, related_name='transfers_out')
+    to_branch = models.ForeignKey(Branch, on_delete=models.PROTECT, related_name='transfers_in')
+    quantity = models.PositiveIntegerField()
+    note = models.CharField(max_length=255, blank=True)
+    date = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['from_branch', 'date'], name='transfer_from_date_idx'),
+            models.Index(fields=['to_branch', 'date'], name='transfer_to_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.from_branch_id}->{self.to_branch_id}: {self.quantity}"
+
 # ---------- Stock In ----------
 class StockIn(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    branch = _branch_fk()
     quantity = models.PositiveIntegerField()
     buying_price = models.DecimalField(max_digits=10, decimal_places=2)
     selling_price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Units of this delivery not yet sold; each delivery is a FIFO cost layer.
+    remaining_quantity = models.PositiveIntegerField(default=0)
     date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['date'], name='stockin_date_idx'),
+            models.Index(fields=['branch', 'date'], name='stockin_branch_date_idx'),
+            # Open layers only, oldest first, so a sale reads just the layers it consumes.
+            models.Index(
+                fields=['product', 'date', 'id'],
+                condition=models.Q(remaining_quantity__gt=0),
+                name='stockin_open_layer_idx',
+            ),
+        ]
+
 # ---------- Customer ----------
 class Customer(models.Model):
     name = models.CharField(max_length=255)
     phone = models.CharField(max_length=20, blank=True, null=True)
+    # Outstanding credit, maintained with every credit sale and payment.
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(Collate('name', 'NOCASE'), name='customer_name_nocase_idx'),
+            models.Index(fields=['name'], condition=models.Q(balance__gt=0), name='customer_debtor_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+# ---------- Receipt ----------
+class Receipt(models.Model):
+    """A multi-line basket; each line is recorded as a ``Sale``."""
+    customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, blank=True)
+    branch = _branch_fk()
+    total_price = models.DecimalField(max_digits=12, decimal_places=2)
+    paid_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    remaining_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    profit = models.DecimalField(max_digits=12, decimal_places=2)
+    payment_mode = models.CharField(max_length=50, choices=PAYMENT_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='COMPLETED')
+    approved_by_pin = models.BooleanField(default=False)
+    date = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Receipt #{self.pk} - {self.total_price}"
+
 # ---------- Sale ----------
 class Sale(models.Model):
+    receipt = models.ForeignKey(Receipt, on_delete=models.CASCADE, null=True, blank=True, related_name='lines')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, blank=True)
+    branch = _branch_fk()
     quantity = models.PositiveIntegerField()
     selling_price = models.DecimalField(max_digits=10, decimal_places=2)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     paid_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     remaining_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Cost of the units sold, from the cost layers they were taken from.
+    cost_of_goods = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     profit = models.DecimalField(max_digits=10, decimal_places=2)
     payment_mode = models.CharField(max_length=50, choices=PAYMENT_CHOICES)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='COMPLETED')
     approved_by_pin = models.BooleanField(default=False)
-    date = models.DateTimeField(auto_now_add=True)
+    # Defaults to now; the offline sync sets it to when the till recorded the sale.
+    date = models.DateTimeField(default=timezone.now)
+    # Idempotency key generated by an offline till, so a resent batch is not applied twice.
+    client_key = models.CharField(max_length=64, unique=True, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'id'], name='sale_date_id_idx'),
+            models.Index(fields=['branch', 'date', 'id'], name='sale_branch_date_id_idx'),
+            models.Index(fields=['status', 'date'], name='sale_status_date_idx'),
+            # Open credit only: a customer's unpaid sales without scanning history.
+            models.Index(
+                fields=['customer', 'date'],
+                condition=models.Q(status='PENDING_PAYMENT'),
+                name='sale_pending_customer_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.quantity}"
 
 # ---------- Payment ----------
 class Payment(models.Model):
-    sale = models.ForeignKey(Sale, on_delete=models.CASCADE, related_name='payments')
+    sale = models.ForeignKey(Sale, on_delete=models.CASCADE, null=True, blank=True, related_name='payments')
+    receipt = models.ForeignKey(Receipt, on_delete=models.CASCADE, null=True, blank=True, related_name='payments')
     amount_paid = models.DecimalField(max_digits=10, decimal_places=2)
     payment_mode = models.CharField(max_length=20, choices=PAYMENT_CHOICES, default='CASH')
     date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['date'], name='payment_date_idx'),
+        ]
+
     def __str__(self):
+        if self.receipt_id:
+            return f"Receipt #{self.receipt_id} - {self.amount_paid}"
         return f"{self.sale.product.name} - {self.amount_paid}"
+
+
+# ---------- Daily Sales Summary ----------
+class DailySalesSummary(models.Model):
+    """Per day x payment mode x product x branch rollup of ``Sale``, kept current on write."""
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    payment_mode = models.CharField(max_length=50, choices=PAYMENT_CHOICES)
+    branch = _branch_fk()
+    sale_count = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    total_sales = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_profit = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    paid_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product', 'payment_mode', 'branch'], name='daily_summary_unique'),
+        ]
+        indexes = [
+            # Covers per-product totals over a day range (top sellers,
+            # demand) without visiting the table.
+            models.Index(
+                fields=['day', 'product', 'quantity', 'total_sales', 'total_profit'],
+                name='daily_summary_product_idx',
+            ),
+            models.Index(fields=['branch', 'day', 'product'], name='daily_summary_branch_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.product_id} {self.payment_mode}: {self.total_sales}"
+
+
+class DailyTotalSummary(models.Model):
+    """Per day x payment mode x branch totals over all products, for series and dashboards without a product split."""
+    day = models.DateField()
+    payment_mode = models.CharField(max_length=50, choices=PAYMENT_CHOICES)
+    branch = _branch_fk()
+    sale_count = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    total_sales = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_profit = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    paid_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'payment_mode', 'branch'], name='daily_total_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['branch', 'day'], name='daily_total_branch_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.payment_mode}: {self.total_sales}"
+
+# ---------- Stock Movement ----------
+class StockMovement(models.Model):
+    """Append-only record of every change to a branch's stock, and so to ``Product.stock_quantity``."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    branch = _branch_fk()
+    kind = models.CharField(max_length=20, choices=MOVEMENT_CHOICES)
+    # Signed: deliveries are positive, sales negative.
+    quantity = models.IntegerField()
+    # When the stock changed on the server, not when an offline till recorded the sale.
+    date = models.DateTimeField(default=timezone.now)
+    note = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'date'], name='movement_product_date_idx'),
+            models.Index(fields=['branch', 'product'], name='movement_branch_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.kind} {self.quantity:+d}"
+
+# ---------- Stock Snapshot ----------
+class StockSnapshot(models.Model):
+    """Stock on hand per product at a point in time, summed from the movement ledger."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    date = models.DateTimeField()
+    quantity = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'date'], name='stock_snapshot_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} @ {self.date}: {self.quantity}"
+
+# ---------- Background Job ----------
+class Job(models.Model):
+    """Work queued by a view and run by ``manage.py run_pos_worker``."""
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=JOB_STATUS_CHOICES, default='QUEUED')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    # Worker and claim token of the current attempt.
+    claimed_by = models.CharField(max_length=100, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The queue itself: waiting jobs only, in the order they fall due.
+            models.Index(fields=['run_after', 'id'], condition=models.Q(status='QUEUED'), name='job_queued_idx'),
+            models.Index(fields=['started_at'], condition=models.Q(status='RUNNING'), name='job_running_idx'),
+            # Unfinished jobs by task, to join a job already queued for the same work.
+            models.Index(fields=['task'], condition=models.Q(status__in=['QUEUED', 'RUNNING']), name='job_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.task} ({self.status})"
+
+# ---------- Reorder Suggestion ----------
+class ReorderSuggestion(models.Model):
+    """Precomputed reorder point and order quantity per product, refreshed by ``pos.reorder``."""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True)
+    # Mean units sold per day over the velocity window.
+    velocity = models.FloatField(default=0)
+    reorder_point = models.PositiveIntegerField(default=0)
+    suggested_quantity = models.PositiveIntegerField(default=0)
+    # Days the stock on hand lasts at the current velocity; products with no
+    # recent sales get NO_DEMAND_COVER so they sort after every selling one.
+    days_of_cover = models.FloatField(default=0)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # The reorder list: products to order, most urgent first.
+            models.Index(fields=['days_of_cover', 'product'], condition=models.Q(suggested_quantity__gt=0),
+                         name='reorder_needed_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: order {self.suggested_quantity}"
+
+# ---------- Period Close ----------
+class PeriodClose(models.Model):
+    """A closed month and its totals as they stood when it was closed."""
+    month = models.DateField(unique=True)  # first day of the month
+    sale_count = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    total_sales = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_profit = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    paid_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    closed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.month:%Y-%m}: {self.total_sales}"
+
+
+# Closed-period rows moved out of the live tables by ``pos.periods``. They
+# keep their ids and columns; foreign keys are not enforced so that the
+# live rows they point at can change or go without touching the archive.
+def _archived_fk(to):
+    return models.ForeignKey(to, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+',
+                             null=True, blank=True)
+
+
+class ArchivedSale(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    receipt = _archived_fk(Receipt)
+    product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    customer = _archived_fk(Customer)
+    branch = _archived_fk(Branch)
+    quantity = models.PositiveIntegerField()
+    selling_price = models.DecimalField(max_digits=10, decimal_places=2)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    paid_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    remaining_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    cost_of_goods = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    profit = models.DecimalField(max_digits=10, decimal_places=2)
+    payment_mode = models.CharField(max_length=50, choices=PAYMENT_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='COMPLETED')
+    approved_by_pin = models.BooleanField(default=False)
+    date = models.DateTimeField()
+    client_key = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'id'], name='archived_sale_date_id_idx'),
+            models.Index(fields=['branch', 'date', 'id'], name='archived_sale_branch_idx'),
+            models.Index(fields=['client_key'], condition=models.Q(client_key__isnull=False),
+                         name='archived_sale_client_key_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} - {self.quantity}"
+
+
+class ArchivedPayment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    sale = _archived_fk(ArchivedSale)
+    receipt = _archived_fk(Receipt)
+    amount_paid = models.DecimalField(max_digits=10, decimal_places=2)
+    payment_mode = models.CharField(max_length=20, choices=PAYMENT_CHOICES, default='CASH')
+    date = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.amount_paid} ({self.payment_mode})"
+
+
+class ArchivedStockIn(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    branch = _archived_fk(Branch)
+    quantity = models.PositiveIntegerField()
+    buying_price = models.DecimalField(max_digits=10, decimal_places=2)
+    selling_price = models.DecimalField(max_digits=10, decimal_places=2)
+    remaining_quantity = models.PositiveIntegerField(default=0)
+    date = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'id'], name='archived_stockin_date_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} +{self.quantity}"
+
+
+# ---------- Change Feed ----------
+class ChangeEvent(models.Model):
+    """One committed write, appended by the writer inside its own transaction (see ``pos.events``)."""
+    kind = models.CharField(max_length=20, choices=EVENT_CHOICES)
+    object_id = models.BigIntegerField()
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind} {self.object_id}"
+
+
+class EventConsumer(models.Model):
+    """A reader of the change feed and the id of the last event it has processed."""
+    name = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+
+
+# ---------- Product Catalog ----------
+class CatalogGeneration(models.Model):
+    """One row; every product write bumps ``value``, and ``pos.catalog`` reloads entries loaded under an older one."""
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"catalog generation {self.value}"
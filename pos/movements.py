@@ -0,0 +1,109 @@
+from datetime import datetime, time, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import BranchStock, Product, StockMovement, StockSnapshot
+
+# Stock movement ledger. Every write that changes Product.stock_quantity
+# appends StockMovement rows in the same transaction. take_snapshots() folds
+# the ledger into per-product StockSnapshot rows, so a point-in-time query
+# reads the nearest snapshot plus only the movements after it.
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def record(movements):
+    """Append ``StockMovement`` objects in one ``INSERT``, skipping zero quantities."""
+    movements = [movement for movement in movements if movement.quantity]
+    if movements:
+        StockMovement.objects.bulk_create(movements)
+
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def stock_as_of(when, products=None):
+    """Annotate ``as_of_stock`` on ``products``: stock on hand at ``when``.
+
+    Each product reads its latest snapshot at or before ``when`` and sums
+    the movements between that snapshot and ``when``; with regular
+    snapshots the tail is at most one snapshot interval long.
+    """
+    products = Product.objects.all() if products is None else products
+    snapshots = StockSnapshot.objects.filter(product=OuterRef('pk'), date__lte=when).order_by('-date')
+    tail = (
+        StockMovement.objects.filter(
+            product=OuterRef('pk'),
+            date__lte=when,
+            date__gt=Coalesce(OuterRef('snapshot_date'), Value(EPOCH)),
+        )
+        .values('product')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+    return products.annotate(
+        snapshot_date=Subquery(snapshots.values('date')[:1]),
+        snapshot_quantity=Subquery(snapshots.values('quantity')[:1]),
+    ).annotate(
+        as_of_stock=Coalesce(F('snapshot_quantity'), 0) + Coalesce(Subquery(tail), 0),
+    )
+
+
+def take_snapshots(at=None):
+    """Snapshot ledger balances at ``at`` (default: the start of today).
+
+    Only products with movements since their latest snapshot get a new row;
+    for the rest that snapshot is still current, and ``stock_as_of`` finds
+    it with an empty tail. Built from the previous snapshot plus the
+    movements since, never from ``stock_quantity``, so snapshots always
+    agree with the ledger. Running it twice for the same ``at`` leaves the
+    first snapshot in place. Returns the number of products snapshotted.
+    """
+    at = at or start_of_day(timezone.localdate())
+    moved = StockMovement.objects.filter(
+        product=OuterRef('pk'),
+        date__lte=at,
+        date__gt=Coalesce(OuterRef('snapshot_date'), Value(EPOCH)),
+    )
+    with transaction.atomic():
+        balances = stock_as_of(at).filter(Exists(moved)).values_list('id', 'as_of_stock')
+        snapshots = [
+            StockSnapshot(product_id=pk, date=at, quantity=quantity)
+            for pk, quantity in balances.iterator(chunk_size=2000)
+        ]
+        StockSnapshot.objects.bulk_create(snapshots, batch_size=1000, ignore_conflicts=True)
+    return len(snapshots)
+
+
+def reconcile():
+    """Products whose ``stock_quantity`` differs from the sum of their movements.
+
+    One grouped query over the ledger; returns ``(id, name, stock_quantity, ledger)`` rows.
+    """
+    return list(
+        Product.objects.annotate(ledger=Coalesce(Sum('stockmovement__quantity'), 0))
+        .exclude(stock_quantity=F('ledger'))
+        .order_by('name')
+        .values_list('id', 'name', 'stock_quantity', 'ledger')
+    )
+
+
+def reconcile_branch(branch_id):
+    """``reconcile`` for one branch: its BranchStock rows against its own movements.
+
+    Both sides are grouped off indexes leading on the branch.
+    """
+    ledger = dict(
+        StockMovement.objects.filter(branch_id=branch_id).values('product_id')
+        .annotate(total=Sum('quantity')).order_by().values_list('product_id', 'total')
+    )
+    stock = dict(BranchStock.objects.filter(branch_id=branch_id).values_list('product_id', 'quantity'))
+    differ = {pk for pk in ledger.keys() | stock.keys() if ledger.get(pk, 0) != stock.get(pk, 0)}
+    return [
+        (pk, name, stock.get(pk, 0), ledger.get(pk, 0))
+        for pk, name in Product.objects.filter(pk__in=differ).order_by('name').values_list('id', 'name')
+    ]
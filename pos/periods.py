@@ -0,0 +1,73 @@
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Max, Min, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import DailyTotalSummary, PeriodClose
+
+# Period close. Closing a month freezes it: its totals are written to
+# PeriodClose, the rollups for it are never rebuilt, the offline sync
+# refuses sales dated in it and pos.archive may move its settled rows out
+# of the live tables. Months close in order, so everything before
+# boundary() is closed. The boundary is read from PeriodClose every time,
+# one row off its unique index, so a close run from the command line
+# reaches every web process at once.
+
+# The rollup columns, totalled per month.
+COLUMNS = ['sale_count', 'quantity', 'total_sales', 'total_profit', 'paid_amount']
+
+
+def next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def boundary():
+    """The first day after the last closed month, or ``None`` if no month is closed."""
+    last = PeriodClose.objects.order_by('-month').values_list('month', flat=True).first()
+    return next_month(last) if last else None
+
+
+def boundary_start():
+    """``boundary()`` as an aware datetime; rows dated before it belong to closed months."""
+    day = boundary()
+    return timezone.make_aware(datetime.combine(day, time.min)) if day else None
+
+
+def close(month):
+    """Close every open month up to and including ``month``; return the new ``PeriodClose`` rows.
+
+    Totals come from the daily rollup, one grouped query for all the months.
+    Raises ValueError for the current month or a later one.
+    """
+    month = month.replace(day=1)
+    if month >= timezone.localdate().replace(day=1):
+        raise ValueError("Only past months can be closed.")
+
+    with transaction.atomic():
+        last = PeriodClose.objects.aggregate(last=Max('month'))['last']
+        if last:
+            first = next_month(last)
+        else:
+            first_day = DailyTotalSummary.objects.aggregate(first=Min('day'))['first']
+            first = min(first_day, month).replace(day=1) if first_day else month
+        if first > month:
+            return []
+
+        totals = {
+            row['month']: row
+            for row in DailyTotalSummary.objects.filter(day__gte=first, day__lt=next_month(month))
+            .annotate(month=TruncMonth('day'))
+            .values('month')
+            .annotate(**{f'{col}_sum': Sum(col) for col in COLUMNS})
+            .order_by()
+        }
+        closes = []
+        while first <= month:
+            row = totals.get(first, {})
+            # SQLite sums decimals as floats; round money back to the cent.
+            closes.append(PeriodClose(month=first, **{col: round(row.get(f'{col}_sum') or 0, 2) for col in COLUMNS}))
+            first = next_month(first)
+        PeriodClose.objects.bulk_create(closes)
+    return closes
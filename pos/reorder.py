@@ -0,0 +1,126 @@
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import DailySalesSummary, Product, ReorderSuggestion, StockMovement
+
+# Reorder engine. Daily demand per product comes from the DailySalesSummary
+# rollup in one grouped query over the velocity window for all products at
+# once; reorder points and order quantities are derived from the per-product
+# mean and spread and upserted into ReorderSuggestion, which the reorder
+# list reads directly.
+
+SERVICE_FACTOR = 1.65       # safety stock in standard deviations (~95% of lead times covered)
+NO_DEMAND_COVER = 1e9       # days_of_cover for products with no sales in the window
+WRITE_BATCH_SIZE = 500
+ID_BATCH_SIZE = 500
+
+
+def _demand(start, end, product_ids=None):
+    """``{product_id: (units, sum of squared daily units)}`` sold on ``start <= day < end``.
+
+    The inner query totals each product's day across payment modes; the
+    outer one folds the days, so the spread costs no extra pass.
+    """
+    table = connection.ops.quote_name(DailySalesSummary._meta.db_table)
+    where = "day >= %s AND day < %s"
+    params = [start, end]
+    if product_ids is not None:
+        where += f" AND product_id IN ({', '.join(['%s'] * len(product_ids))})"
+        params.extend(product_ids)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT product_id, SUM(units), SUM(units * units) FROM ("
+            f"  SELECT product_id, SUM(quantity) AS units FROM {table} "
+            f"  WHERE {where} GROUP BY product_id, day"
+            f") GROUP BY product_id",
+            params
+        )
+        return {product_id: (units, squares) for product_id, units, squares in cursor.fetchall()}
+
+
+def suggest(stock, reorder_level, units, squares, window, lead_days, cover_days):
+    """``(velocity, reorder_point, suggested_quantity, days_of_cover)`` for one product.
+
+    Days without a sale count as zero demand. Without any sales in the
+    window the product falls back to its static ``reorder_level``.
+    """
+    if not units:
+        reorder_point = reorder_level
+        suggested = reorder_level + 1 - stock if stock <= reorder_level else 0
+        return 0.0, reorder_point, suggested, NO_DEMAND_COVER
+
+    velocity = units / window
+    spread = math.sqrt(max(squares / window - velocity * velocity, 0))
+    safety = SERVICE_FACTOR * spread * math.sqrt(lead_days)
+    reorder_point = math.ceil(velocity * lead_days + safety)
+    order_up_to = reorder_point + math.ceil(velocity * cover_days)
+    suggested = order_up_to - stock if stock <= reorder_point else 0
+    return velocity, reorder_point, suggested, stock / velocity
+
+
+def _upsert(rows):
+    if not rows:
+        return
+    table = connection.ops.quote_name(ReorderSuggestion._meta.db_table)
+    fields = ['product_id', 'velocity', 'reorder_point', 'suggested_quantity', 'days_of_cover', 'computed_at']
+    placeholders = ', '.join(['(' + ', '.join(['%s'] * len(fields)) + ')'] * len(rows))
+    updates = ', '.join(f"{field} = excluded.{field}" for field in fields[1:])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(fields)}) VALUES {placeholders} "
+            f"ON CONFLICT (product_id) DO UPDATE SET {updates}",
+            [value for row in rows for value in row]
+        )
+
+
+def _changed_since(since):
+    """Products whose stock moved after ``since``, plus any without a suggestion yet."""
+    moved = set(StockMovement.objects.filter(date__gt=since).values_list('product_id', flat=True).distinct())
+    moved.update(Product.objects.filter(reordersuggestion__isnull=True).values_list('id', flat=True))
+    return sorted(moved)
+
+
+def refresh(full=False, today=None):
+    """Recompute reorder suggestions; return the number of products written.
+
+    The window slides daily, so the first refresh of a day recomputes every
+    product. Later ones only revisit products whose stock moved since the
+    last refresh, or that are new.
+    """
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    today = today or timezone.localdate()
+    window = settings.POS_REORDER_WINDOW_DAYS
+    lead_days = settings.POS_REORDER_LEAD_DAYS
+    cover_days = settings.POS_REORDER_COVER_DAYS
+    start, end = today - timedelta(days=window - 1), today + timedelta(days=1)
+
+    last = ReorderSuggestion.objects.aggregate(last=Max('computed_at'))['last']
+    if full or last is None or timezone.localdate(last) != today:
+        batches = [None]
+    else:
+        ids = _changed_since(last)
+        batches = [ids[i:i + ID_BATCH_SIZE] for i in range(0, len(ids), ID_BATCH_SIZE)]
+
+    written = 0
+    with transaction.atomic():
+        for product_ids in batches:
+            demand = _demand(start, end, product_ids)
+            products = Product.objects.all() if product_ids is None else Product.objects.filter(pk__in=product_ids)
+            rows = [
+                (pk, *suggest(stock, reorder_level, *demand.get(pk, (0, 0)), window, lead_days, cover_days), now)
+                for pk, stock, reorder_level in products.values_list('id', 'stock_quantity', 'reorder_level')
+            ]
+            for i in range(0, len(rows), WRITE_BATCH_SIZE):
+                _upsert(rows[i:i + WRITE_BATCH_SIZE])
+            written += len(rows)
+    return written
+
+
+def needed():
+    """Suggestions with something to order, most urgent first; served by ``reorder_needed_idx``."""
+    return ReorderSuggestion.objects.filter(suggested_quantity__gt=0).order_by('days_of_cover', 'product_id')
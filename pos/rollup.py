@@ -0,0 +1,218 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import periods
+from .models import DailySalesSummary, DailyTotalSummary, Sale
+
+# Keeps DailySalesSummary, and its per-day totals in DailyTotalSummary, in
+# step with Sale. Writers call record_sales() inside their own transaction;
+# rebuild() recomputes a range from scratch, closed months excepted. Both
+# tables are kept per branch, and the dashboard totals are grouped by branch
+# and merged.
+
+COLUMNS = ['sale_count', 'quantity', 'total_sales', 'total_profit', 'paid_amount']
+
+
+def _upsert(model, keys, rows):
+    """Add ``rows`` (``{key tuple: column values}``) onto ``model`` with one ``INSERT ... ON CONFLICT``."""
+    if not rows:
+        return
+    table = connection.ops.quote_name(model._meta.db_table)
+    fields = keys + COLUMNS
+    placeholders = ', '.join(['(' + ', '.join(['%s'] * len(fields)) + ')'] * len(rows))
+    updates = ', '.join(f"{col} = {table}.{col} + excluded.{col}" for col in COLUMNS)
+    sql = (
+        f"INSERT INTO {table} ({', '.join(fields)}) VALUES {placeholders} "
+        f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}"
+    )
+    params = []
+    for key, values in rows.items():
+        params.extend(key)
+        params.extend(values)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def _empty_row():
+    return [0, 0, Decimal('0.00'), Decimal('0.00'), Decimal('0.00')]
+
+
+def _record(rows):
+    """Write per-product ``rows`` and their per-day totals."""
+    totals = defaultdict(_empty_row)
+    for (day, product_id, payment_mode, branch_id), values in rows.items():
+        total = totals[(day, payment_mode, branch_id)]
+        for i, value in enumerate(values):
+            total[i] += value
+    _upsert(DailySalesSummary, ['day', 'product_id', 'payment_mode', 'branch_id'], rows)
+    _upsert(DailyTotalSummary, ['day', 'payment_mode', 'branch_id'], totals)
+
+
+def record_sales(sales):
+    """Fold freshly written ``Sale`` objects into the daily summary."""
+    rows = defaultdict(_empty_row)
+    for sale in sales:
+        day = timezone.localdate(sale.date) if sale.date else timezone.localdate()
+        row = rows[(day, sale.product_id, sale.payment_mode, sale.branch_id)]
+        row[0] += 1
+        row[1] += sale.quantity
+        row[2] += sale.total_price
+        row[3] += sale.profit
+        row[4] += sale.paid_amount
+    _record(rows)
+
+
+def record_collections(collected):
+    """Add later payments against ``(sale, amount)`` pairs to their sale's row."""
+    rows = defaultdict(_empty_row)
+    for sale, amount in collected:
+        rows[(timezone.localdate(sale.date), sale.product_id, sale.payment_mode, sale.branch_id)][4] += amount
+    _record(rows)
+
+
+def _insert_select(model, keys, grouped):
+    select, params = grouped.query.sql_with_params()
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {table} ({', '.join(keys + COLUMNS)}) {select}", params)
+        return cursor.rowcount
+
+
+def rebuild(start=None, end=None, stdout=None):
+    """Recompute the summary for ``start``..``end`` (inclusive) from ``Sale``.
+
+    Closed months are frozen (their rows may be archived), so the range
+    starts at ``periods.boundary()`` at the earliest.
+    """
+    closed = periods.boundary()
+    if closed and (start is None or start < closed):
+        start = closed
+    summaries = DailySalesSummary.objects.all()
+    totals = DailyTotalSummary.objects.all()
+    sales = Sale.objects.all()
+    if start:
+        summaries = summaries.filter(day__gte=start)
+        totals = totals.filter(day__gte=start)
+        sales = sales.filter(date__gte=timezone.make_aware(datetime.combine(start, time.min)))
+    if end:
+        summaries = summaries.filter(day__lte=end)
+        totals = totals.filter(day__lte=end)
+        sales = sales.filter(
+            date__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+        )
+
+    grouped = (
+        sales.annotate(day=TruncDate('date'))
+        .values('day', 'product_id', 'payment_mode', 'branch_id')
+        .annotate(
+            sale_count=Count('id'),
+            total_quantity=Sum('quantity'),
+            sales_total=Sum('total_price'),
+            profit_total=Sum('profit'),
+            paid_total=Sum('paid_amount'),
+        )
+        .order_by()
+    )
+    daily = (
+        summaries.values('day', 'payment_mode', 'branch_id')
+        .annotate(**{f'{col}_sum': Sum(col) for col in COLUMNS})
+        .order_by()
+    )
+
+    with transaction.atomic():
+        summaries.delete()
+        totals.delete()
+        # The grouped SELECTs feed the INSERTs directly, so no row passes through Python.
+        written = _insert_select(DailySalesSummary, ['day', 'product_id', 'payment_mode', 'branch_id'], grouped)
+        _insert_select(DailyTotalSummary, ['day', 'payment_mode', 'branch_id'], daily)
+    if stdout:
+        stdout.write(f"  {written} summary rows written")
+    return written
+
+
+def _dashboard_query(today, branch_id=None):
+    week_start = today - timedelta(days=7)
+    month_start = today.replace(day=1)
+    year_start = today.replace(month=1, day=1)
+
+    periods = {
+        'daily': Q(day=today),
+        'weekly': Q(day__gte=week_start),
+        'monthly': Q(day__gte=month_start),
+        'yearly': Q(day__gte=year_start),
+    }
+    aggregates = {}
+    for name, condition in periods.items():
+        aggregates[f'{name}_sales'] = Sum('total_sales', filter=condition)
+        aggregates[f'{name}_profit'] = Sum('total_profit', filter=condition)
+
+    summaries = DailyTotalSummary.objects.filter(day__gte=min(week_start, year_start), day__lte=today)
+    if branch_id is not None:
+        summaries = summaries.filter(branch_id=branch_id)
+    return summaries, aggregates, periods
+
+
+def _dashboard_result(totals, periods):
+    return {
+        name: {
+            'total_sales': totals[f'{name}_sales'],
+            'total_profit': totals[f'{name}_profit'],
+        }
+        for name in periods
+    }
+
+
+def _merge(results):
+    """Add up per-branch dashboard totals; a period no branch sold in stays ``None``."""
+    merged = {}
+    for result in results:
+        for period, totals in result.items():
+            into = merged.setdefault(period, dict.fromkeys(totals))
+            for name, value in totals.items():
+                if value is not None:
+                    into[name] = (into[name] or 0) + value
+    return merged
+
+
+def dashboard_totals(today=None, branch_id=None):
+    """Daily, weekly, monthly and yearly totals, of one branch or all, in a single query over the rollup."""
+    summaries, aggregates, periods = _dashboard_query(today or timezone.localdate(), branch_id)
+    return _dashboard_result(summaries.aggregate(**aggregates), periods)
+
+
+async def adashboard_totals(today=None, branch_id=None):
+    """``dashboard_totals`` through the async ORM."""
+    summaries, aggregates, periods = _dashboard_query(today or timezone.localdate(), branch_id)
+    return _dashboard_result(await summaries.aaggregate(**aggregates), periods)
+
+
+def _branch_query(today, branch_ids):
+    summaries, aggregates, periods = _dashboard_query(today or timezone.localdate())
+    rows = summaries.filter(branch_id__in=branch_ids).values('branch_id').order_by().annotate(**aggregates)
+    return rows, periods
+
+
+def _by_branch(branch_ids, rows, periods):
+    """``(merged, {branch id: totals})``; a branch with no sales in the window gets ``None`` totals."""
+    empty = dict.fromkeys(f'{name}_{column}' for name in periods for column in ('sales', 'profit'))
+    found = {row['branch_id']: row for row in rows}
+    by_branch = {pk: _dashboard_result(found.get(pk, empty), periods) for pk in branch_ids}
+    return _merge(by_branch.values()), by_branch
+
+
+def branch_totals(branch_ids, today=None):
+    """``(merged, {branch id: totals})``: ``dashboard_totals`` of every branch in one query grouped by branch."""
+    rows, periods = _branch_query(today, branch_ids)
+    return _by_branch(branch_ids, rows, periods)
+
+
+async def abranch_totals(branch_ids, today=None):
+    """``branch_totals`` through the async ORM."""
+    rows, periods = _branch_query(today, branch_ids)
+    return _by_branch(branch_ids, [row async for row in rows], periods)
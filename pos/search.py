@@ -0,0 +1,110 @@
+from decimal import Decimal
+
+from django.db import connection, connections
+from django.db.models import FilteredRelation, Q
+from django.db.models.functions import Coalesce
+
+from .models import MAIN_BRANCH, Customer, Product
+
+# Typeahead lookups for the sale screen. On SQLite, terms of three or more
+# characters go through the trigram FTS5 tables created in migration 0010;
+# shorter terms (and other databases) fall back to a LIMITed prefix match.
+# Products show the units on hand at the till's own branch.
+
+LIMIT = 20
+MIN_TRIGRAM = 3
+CENTS = Decimal('0.01')
+
+SEARCH_TABLES = [
+    ('pos_product_fts', 'pos_product', ['name']),
+    ('pos_customer_fts', 'pos_customer', ['name', 'phone']),
+]
+
+
+def ensure_search_triggers(using='default', **kwargs):
+    """Recreate the FTS sync triggers if a migration dropped them.
+
+    SQLite drops a table's triggers whenever Django rebuilds the table to
+    alter it, so this runs after every ``migrate`` and re-indexes any table
+    whose triggers went missing.
+    """
+    conn = connections[using]
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = {row[0] for row in cursor.fetchall()}
+        for fts, table, columns in SEARCH_TABLES:
+            if fts not in existing:
+                continue
+            cols = ', '.join(columns)
+            new = ', '.join(f'new.{c}' for c in columns)
+            old = ', '.join(f'old.{c}' for c in columns)
+            triggers = {
+                f'{fts}_ai': (f"AFTER INSERT ON {table} BEGIN "
+                              f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END"),
+                f'{fts}_ad': (f"AFTER DELETE ON {table} BEGIN "
+                              f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END"),
+                f'{fts}_au': (f"AFTER UPDATE OF {cols} ON {table} BEGIN "
+                              f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+                              f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END"),
+            }
+            missing = [name for name in triggers if name not in existing]
+            for name in missing:
+                cursor.execute(f"CREATE TRIGGER {name} {triggers[name]}")
+            if missing:
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def _fts_phrase(term):
+    # A quoted phrase is a plain substring match for the trigram tokenizer.
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _use_fts(term):
+    return connection.vendor == 'sqlite' and len(term) >= MIN_TRIGRAM
+
+
+def search_products(term, branch_id=MAIN_BRANCH, limit=LIMIT):
+    term = term.strip()
+    if not term:
+        return []
+    if _use_fts(term):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT p.id, p.name, p.selling_price, COALESCE(s.quantity, 0) "
+                "FROM pos_product_fts f JOIN pos_product p ON p.id = f.rowid "
+                "LEFT JOIN pos_branchstock s ON s.product_id = p.id AND s.branch_id = %s "
+                "WHERE pos_product_fts MATCH %s LIMIT %s",
+                [branch_id, _fts_phrase(term), limit]
+            )
+            rows = cursor.fetchall()
+    else:
+        rows = Product.objects.filter(name__istartswith=term).annotate(
+            here=FilteredRelation('branchstock', condition=Q(branchstock__branch_id=branch_id)),
+            stock=Coalesce('here__quantity', 0),
+        ).values_list('id', 'name', 'selling_price', 'stock')[:limit]
+    return [
+        {'id': pk, 'name': name, 'price': str(Decimal(str(price)).quantize(CENTS)), 'stock': stock}
+        for pk, name, price, stock in rows
+    ]
+
+
+def search_customers(term, limit=LIMIT):
+    term = term.strip()
+    if not term:
+        return []
+    if _use_fts(term):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.id, c.name, c.phone "
+                "FROM pos_customer_fts f JOIN pos_customer c ON c.id = f.rowid "
+                "WHERE pos_customer_fts MATCH %s LIMIT %s",
+                [_fts_phrase(term), limit]
+            )
+            rows = cursor.fetchall()
+    else:
+        rows = Customer.objects.filter(name__istartswith=term).values_list(
+            'id', 'name', 'phone'
+        )[:limit]
+    return [{'id': pk, 'name': name, 'phone': phone} for pk, name, phone in rows]
@@ -0,0 +1,223 @@
+import random
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import DecimalField, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import caching, costing, reorder, rollup
+from .models import (
+    MAIN_BRANCH, ArchivedSale, BranchStock, Customer, Payment, Product, Sale, StockIn, StockMovement
+)
+
+# Synthetic shop history for development and benchmarks. Sales are drawn in
+# date order with a skewed product mix; a delivery is generated whenever a
+# product would run out, so stock never goes negative. Rows are written a
+# chunk at a time, then the derived data (cost of goods, cost layers,
+# averages, the daily rollup, customer balances) is rebuilt through the
+# same code the app uses. All of it happens at the main branch.
+
+CHUNK_SIZE = 5000
+
+ITEMS = [
+    'Claw Hammer', 'Wire Nails 3"', 'Cement 50kg', 'Emulsion Paint 4L', 'PVC Pipe 1/2"', 'Wheelbarrow',
+    'Padlock 50mm', 'Butt Hinge 4"', 'Wood Screws 1"', 'Roofing Sheet 3m', 'Hex Bolt M10', 'Binding Wire',
+    'Tile Adhesive 20kg', 'Paint Brush 2"', 'Garden Spade', 'Hacksaw Blade', 'Masking Tape', 'Gate Valve 1"',
+    'Door Handle Set', 'Steel Rod Y12',
+]
+CASH_MODES = ['CASH', 'MPESA', 'BANK', 'LOOP']
+CASH_WEIGHTS = [40, 45, 10, 5]
+QUANTITIES = [1, 1, 1, 1, 2, 2, 3, 5, 10]
+WALK_IN_SHARE = 0.3
+CREDIT_SHARE = 0.15         # of sales to known customers
+SETTLED_SHARE = 0.6         # of credit sales paid off later
+SALE_FIELDS = [
+    'id', 'product', 'customer', 'quantity', 'selling_price', 'total_price', 'paid_amount', 'remaining_amount',
+    'cost_of_goods', 'profit', 'payment_mode', 'status', 'approved_by_pin', 'date',
+]
+
+
+def _insert(model, fields, rows):
+    """``executemany`` one ``INSERT`` for ``rows``.
+
+    Skips the per-object work of ``bulk_create``, and keeps the historical
+    dates that ``auto_now_add`` would overwrite.
+    """
+    if not rows:
+        return
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(model._meta.get_field(field).column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {table} ({columns}) VALUES ({', '.join(['%s'] * len(fields))})",
+            [
+                [connection.ops.adapt_datetimefield_value(value) if hasattr(value, 'tzinfo') else value
+                 for value in row]
+                for row in rows
+            ]
+        )
+
+
+def _money(value):
+    return Decimal(value).quantize(costing.CENT)
+
+
+class Seeder:
+    """Buffers generated rows and writes them a chunk at a time."""
+
+    def __init__(self, rng, chunk_size):
+        self.rng = rng
+        self.chunk_size = chunk_size
+        self.sales = []
+        self.sale_movements = []
+        self.payments = []
+        self.deliveries = []
+        self.counts = defaultdict(int)
+        # Sale ids are assigned here so payments and movements can refer to
+        # them without reading them back; the transaction's write lock keeps
+        # other writers out until commit. Archived sales keep their ids, so
+        # those are never handed out again either.
+        self.next_sale_id = max(
+            model.objects.aggregate(last=Max('id'))['last'] or 0 for model in (Sale, ArchivedSale)
+        ) + 1
+
+    def deliver(self, product, quantity, when):
+        price = _money(product.buying_price * Decimal(self.rng.uniform(0.9, 1.1)))
+        self.deliveries.append((product.pk, quantity, quantity, price, product.selling_price, when))
+        if len(self.deliveries) >= self.chunk_size:
+            self.flush_deliveries()
+
+    def flush_deliveries(self):
+        _insert(StockIn, ['product', 'quantity', 'remaining_quantity', 'buying_price', 'selling_price', 'date'],
+                self.deliveries)
+        _insert(StockMovement, ['product', 'kind', 'quantity', 'date', 'note'], [
+            (pk, 'STOCK_IN', quantity, when, "Seeded delivery")
+            for pk, quantity, remaining, bp, sp, when in self.deliveries
+        ])
+        self.counts['stock_ins'] += len(self.deliveries)
+        self.deliveries = []
+
+    def sell(self, product, customer, qty, mode, paid, when, settled_at):
+        pk = self.next_sale_id
+        self.next_sale_id += 1
+        total = product.selling_price * qty
+        self.sales.append((
+            pk, product.pk, customer.pk if customer else None, qty, product.selling_price, total, paid,
+            total - paid, Decimal('0.00'), total, mode, 'COMPLETED' if paid == total else 'PENDING_PAYMENT',
+            False, when,
+        ))
+        self.sale_movements.append((product.pk, 'SALE', -qty, when, f"Sale #{pk}"))
+        if mode != 'CREDIT':
+            self.payments.append((pk, paid, mode, when))
+        elif settled_at:
+            self.payments.append((pk, paid, self.rng.choices(CASH_MODES, CASH_WEIGHTS)[0], settled_at))
+        if len(self.sales) >= self.chunk_size:
+            self.flush_sales()
+
+    def flush_sales(self):
+        # Deliveries first, so every sale's stock is in the ledger before it.
+        self.flush_deliveries()
+        _insert(Sale, SALE_FIELDS, self.sales)
+        _insert(StockMovement, ['product', 'kind', 'quantity', 'date', 'note'], self.sale_movements)
+        _insert(Payment, ['sale', 'amount_paid', 'payment_mode', 'date'], self.payments)
+        self.counts['sales'] += len(self.sales)
+        self.counts['payments'] += len(self.payments)
+        self.sales, self.sale_movements, self.payments = [], [], []
+
+
+def seed(products=1000, customers=200, sales=20000, days=365, chunk_size=CHUNK_SIZE, seed=None, stdout=None):
+    """Add a synthetic history of ``sales`` over the last ``days``; return row counts by kind."""
+    rng = random.Random(seed)
+    log = stdout.write if stdout else (lambda message: None)
+    now = timezone.now()
+    start = now - timedelta(days=days)
+    batch = uuid.UUID(int=rng.getrandbits(128)).hex[:6]
+
+    with transaction.atomic():
+        new_products = []
+        for i in range(products):
+            buying = _money(rng.uniform(50, 5000))
+            new_products.append(Product(
+                name=f"{rng.choice(ITEMS)} {batch}-{i}", sku=f"SEED-{batch}-{i:06d}",
+                buying_price=buying, selling_price=_money(buying * Decimal(rng.uniform(1.1, 1.6))),
+                reorder_level=rng.choice([2, 5, 10, 20]),
+            ))
+        new_products = Product.objects.bulk_create(new_products, batch_size=chunk_size)
+        new_customers = Customer.objects.bulk_create([
+            Customer(name=f"Customer {batch}-{i}", phone=f"07{rng.randrange(10 ** 8):08d}")
+            for i in range(customers)
+        ], batch_size=chunk_size)
+        log(f"Created {len(new_products)} products and {len(new_customers)} customers.")
+
+        # A long-tailed mix: a few products make most of the sales.
+        weights = [1 / (rank + 1) ** 0.8 for rank in range(len(new_products))]
+        rng.shuffle(weights)
+
+        seeder = Seeder(rng, chunk_size)
+        on_hand = {}
+        for product in new_products:
+            on_hand[product.pk] = rng.randint(20, 200)
+            seeder.deliver(product, on_hand[product.pk], start)
+
+        seconds = days * 86400
+        offsets = sorted(rng.random() * seconds for _ in range(sales))
+        picks = rng.choices(new_products, weights, k=sales)
+        for offset, product in zip(offsets, picks):
+            when = start + timedelta(seconds=offset)
+            qty = rng.choice(QUANTITIES)
+            if on_hand[product.pk] < qty:
+                restock = max(qty, rng.randint(20, 200))
+                seeder.deliver(product, restock, when - timedelta(minutes=1))
+                on_hand[product.pk] += restock
+            on_hand[product.pk] -= qty
+
+            customer = None if rng.random() < WALK_IN_SHARE or not new_customers else rng.choice(new_customers)
+            paid = product.selling_price * qty
+            settled_at = None
+            if customer and rng.random() < CREDIT_SHARE:
+                mode = 'CREDIT'
+                settled_at = when + timedelta(days=rng.randint(1, 60))
+                if rng.random() >= SETTLED_SHARE or settled_at >= now:
+                    paid, settled_at = Decimal('0.00'), None
+            else:
+                mode = rng.choices(CASH_MODES, CASH_WEIGHTS)[0]
+            seeder.sell(product, customer, qty, mode, paid, when, settled_at)
+        seeder.flush_sales()
+        log(f"Wrote {seeder.counts['sales']} sales, {seeder.counts['stock_ins']} deliveries and "
+            f"{seeder.counts['payments']} payments.")
+
+        for product in new_products:
+            product.stock_quantity = on_hand[product.pk]
+        Product.objects.bulk_update(new_products, ['stock_quantity'], batch_size=1000)
+        BranchStock.objects.bulk_create([
+            BranchStock(branch_id=MAIN_BRANCH, product_id=pk, quantity=quantity) for pk, quantity in on_hand.items()
+        ], batch_size=chunk_size)
+
+        outstanding = (
+            Sale.objects.filter(customer=OuterRef('pk'), status='PENDING_PAYMENT')
+            .values('customer')
+            .annotate(total=Sum('remaining_amount'))
+            .values('total')
+        )
+        Customer.objects.filter(pk__in=[c.pk for c in new_customers]).update(
+            balance=Coalesce(Subquery(outstanding), Value(Decimal('0')), output_field=DecimalField())
+        )
+
+        log("Costing sales and rebuilding the daily summary...")
+        costing.replay()
+        rollup.rebuild()
+        reorder.refresh(full=True)
+        caching.invalidate_sales()
+        caching.invalidate_stock()
+
+    return {
+        'products': len(new_products),
+        'customers': len(new_customers),
+        'sales': seeder.counts['sales'],
+        'stock_ins': seeder.counts['stock_ins'],
+        'payments': seeder.counts['payments'],
+    }
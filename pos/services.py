@@ -0,0 +1,583 @@
+import random
+import time
+from decimal import Decimal
+from functools import wraps
+
+from django.db import OperationalError, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import branches, caching, catalog, costing, events, fragments, ledger, movements, periods, rollup
+from .models import (
+    ArchivedSale, BranchStock, Customer, Product, StockIn, StockMovement, StockTransfer, Sale, Payment, Receipt,
+    MAIN_BRANCH, PAYMENT_CHOICES
+)
+
+# Write-side helpers shared by the views. Every function here runs its
+# writes inside a single transaction and only touches the columns it owns.
+
+LOCK_RETRIES = 5
+LOCK_BACKOFF = 0.05  # seconds, doubled on every attempt
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+class ProductNotFound(Exception):
+    pass
+
+
+class StaleStock(Exception):
+    """Stock changed between reading and writing a sync batch; it is re-run."""
+
+
+def is_lock_error(exc):
+    return 'database is locked' in str(exc) or 'database table is locked' in str(exc)
+
+
+def retry_on_lock(func):
+    """Re-run ``func`` with exponential backoff while SQLite reports a lock.
+
+    The retry wraps the whole transaction, so it must be applied outside
+    ``transaction.atomic`` and never inside an already open transaction.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(LOCK_RETRIES):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if not is_lock_error(exc) or attempt == LOCK_RETRIES - 1:
+                    raise
+                if transaction.get_connection().in_atomic_block:
+                    raise
+                delay = LOCK_BACKOFF * (2 ** attempt)
+                time.sleep(delay + random.uniform(0, delay))
+    return wrapper
+
+
+# ---------- Sale ----------
+@retry_on_lock
+def record_sale(product, customer, qty, sp, payment_mode, paid, approved=False, branch_id=MAIN_BRANCH):
+    """Write a sale, its stock deduction and its payment in one transaction.
+
+    Stock is taken from the branch with a conditional ``UPDATE`` (see
+    ``_take_stock``) so concurrent tills can never oversell. Profit is taken
+    against the cost layers the units come from. ``product`` is a Product or
+    a ``catalog.Entry``; its stock is never read.
+    """
+    total_price = sp * qty
+    remaining = max(total_price - paid, Decimal('0.00'))
+    status = 'COMPLETED' if remaining == 0 else 'PENDING_PAYMENT'
+
+    with transaction.atomic():
+        shortfall = _take_stock(branch_id, {product.pk: qty}, approved, product.name)
+        [cost] = costing.consume([(product, qty)])
+
+        sale = Sale.objects.create(
+            product_id=product.pk,
+            customer=customer,
+            branch_id=branch_id,
+            quantity=qty,
+            selling_price=sp,
+            total_price=total_price,
+            paid_amount=paid,
+            remaining_amount=remaining,
+            cost_of_goods=cost,
+            profit=total_price - cost,
+            payment_mode=payment_mode,
+            status=status,
+            approved_by_pin=approved
+        )
+        movements.record(_override_movements(shortfall, branch_id) + [
+            StockMovement(product_id=product.pk, branch_id=branch_id, kind='SALE', quantity=-qty,
+                          note=f"Sale #{sale.pk}")
+        ])
+        rollup.record_sales([sale])
+        ledger.add_debt(sale.customer_id, remaining)
+        caching.invalidate_sales()
+        caching.invalidate_stock([product.pk])
+
+        changes = [events.sale_event(sale)]
+        if paid > 0:
+            payment = Payment.objects.create(
+                sale=sale,
+                amount_paid=paid,
+                payment_mode=payment_mode
+            )
+            changes.append(events.payment_event(payment, sale.customer_id))
+        events.emit(changes)
+
+    return sale
+
+
+# ---------- Checkout ----------
+@retry_on_lock
+def checkout(customer, lines, payment_mode, paid, approved=False, branch_id=MAIN_BRANCH):
+    """Write a multi-line receipt with a constant number of queries.
+
+    ``lines`` is a list of ``(product, qty, selling_price)``, ``product`` a
+    Product or a ``catalog.Entry``. Stock for every line is checked and
+    taken from the branch by one conditional ``UPDATE``; the lines go in with
+    ``bulk_create`` and the payment is written once for the whole receipt.
+    Raises ``InsufficientStock`` without writing anything if any product
+    cannot cover its quantity.
+    """
+    wanted = {}
+    for product, qty, sp in lines:
+        wanted[product.pk] = wanted.get(product.pk, 0) + qty
+
+    total_price = sum((sp * qty for product, qty, sp in lines), Decimal('0.00'))
+    remaining = max(total_price - paid, Decimal('0.00'))
+    status = 'COMPLETED' if remaining == 0 else 'PENDING_PAYMENT'
+
+    with transaction.atomic():
+        shortfall = _take_stock(branch_id, wanted, approved, f"{len(wanted)} products")
+        costs = costing.consume([(product, qty) for product, qty, sp in lines])
+
+        receipt = Receipt.objects.create(
+            customer=customer,
+            branch_id=branch_id,
+            total_price=total_price,
+            paid_amount=paid,
+            remaining_amount=remaining,
+            profit=total_price - sum(costs, Decimal('0.00')),
+            payment_mode=payment_mode,
+            status=status,
+            approved_by_pin=approved
+        )
+
+        # Spread the payment over the lines in order so per-line totals
+        # still add up to the receipt.
+        unallocated = min(paid, total_price)
+        sales = []
+        for (product, qty, sp), cost in zip(lines, costs):
+            line_total = sp * qty
+            line_paid = min(unallocated, line_total)
+            unallocated -= line_paid
+            sales.append(Sale(
+                receipt=receipt,
+                product_id=product.pk,
+                customer=customer,
+                branch_id=branch_id,
+                quantity=qty,
+                selling_price=sp,
+                total_price=line_total,
+                paid_amount=line_paid,
+                remaining_amount=line_total - line_paid,
+                cost_of_goods=cost,
+                profit=line_total - cost,
+                payment_mode=payment_mode,
+                status='COMPLETED' if line_paid == line_total else 'PENDING_PAYMENT',
+                approved_by_pin=approved
+            ))
+        Sale.objects.bulk_create(sales)
+        movements.record(_override_movements(shortfall, branch_id) + [
+            StockMovement(product_id=pk, branch_id=branch_id, kind='SALE', quantity=-qty,
+                          note=f"Receipt #{receipt.pk}")
+            for pk, qty in wanted.items()
+        ])
+        rollup.record_sales(sales)
+        ledger.add_debt(receipt.customer_id, remaining)
+        caching.invalidate_sales()
+        caching.invalidate_stock(list(wanted))
+
+        changes = [events.sale_event(sale) for sale in sales]
+        if paid > 0:
+            payment = Payment.objects.create(
+                receipt=receipt,
+                amount_paid=paid,
+                payment_mode=payment_mode
+            )
+            changes.append(events.payment_event(payment, receipt.customer_id))
+        events.emit(changes)
+
+    return receipt
+
+
+# ---------- Offline Sync ----------
+SYNC_RETRIES = 3
+PAYMENT_MODES = {mode for mode, label in PAYMENT_CHOICES}
+
+
+def sync_sales(entries, admin_pin, branch_id=MAIN_BRANCH):
+    """Apply a batch of sales recorded offline at ``branch_id``; return ``(results, stock)``.
+
+    Each entry carries a client ``key``; keys already on the server come
+    back as ``duplicate`` and are not applied again. The rest are validated
+    like ``sale_create`` and written together: one read of the products,
+    customers and known keys, one compare-and-set stock ``UPDATE``, and
+    ``bulk_create`` for sales and payments; the new sales are costed from the
+    layers together. If another till moved the stock
+    in between, the whole batch is retried. Sales dated in a closed month
+    are rejected.
+    """
+    for attempt in range(SYNC_RETRIES):
+        try:
+            return _sync_batch(entries, admin_pin, branch_id)
+        except StaleStock:
+            if attempt == SYNC_RETRIES - 1:
+                raise
+
+
+@retry_on_lock
+def _sync_batch(entries, admin_pin, branch_id):
+    keys = [str(entry.get('key') or '') for entry in entries]
+
+    with transaction.atomic():
+        # Keys of archived sales count too: a till may resend a batch from a closed month.
+        known = dict(
+            Sale.objects.filter(client_key__in=[k for k in keys if k]).values_list('client_key', 'id')
+            .union(ArchivedSale.objects.filter(client_key__in=[k for k in keys if k]).values_list('client_key', 'id'))
+        )
+        closed = periods.boundary_start()
+        products = Product.objects.in_bulk({_as_id(e.get('product')) for e in entries} - {None})
+        customers = Customer.objects.in_bulk({_as_id(e.get('customer')) for e in entries} - {None})
+        # The till's own branch: stock it has no row for is zero.
+        read_stock = dict.fromkeys(products, 0)
+        read_stock.update(BranchStock.objects.filter(
+            branch_id=branch_id, product_id__in=products
+        ).values_list('product_id', 'quantity'))
+        stock = dict(read_stock)
+
+        # Results hold the new Sale until it has an id; a key repeated within
+        # the batch points at the sale its first entry created.
+        results = []
+        sales = []
+        seen = {}
+        for key, entry in zip(keys, entries):
+            if key in known or key in seen:
+                results.append({'key': key, 'status': 'duplicate', 'sale': known[key] if key in known else seen[key]})
+                continue
+            try:
+                sale = _sync_entry(key, entry, products, customers, stock, admin_pin, closed)
+            except (ValueError, TypeError, ArithmeticError) as exc:
+                results.append({'key': key, 'status': 'rejected', 'error': str(exc)})
+                continue
+            seen[key] = sale
+            sale.branch_id = branch_id
+            sales.append(sale)
+            results.append({'key': key, 'status': 'created', 'sale': sale})
+
+        # Stock only goes down here, so every changed product had a branch row.
+        changed = {pk: qty for pk, qty in stock.items() if qty != read_stock[pk]}
+        if changed:
+            updated = BranchStock.objects.filter(
+                branch_id=branch_id, product_id__in=changed,
+                quantity=_per_product('product_id', {pk: read_stock[pk] for pk in changed})
+            ).update(quantity=_per_product('product_id', changed))
+            if updated != len(changed):
+                raise StaleStock()
+            Product.objects.filter(pk__in=changed).update(stock_quantity=F('stock_quantity') - _per_product(
+                'pk', {pk: read_stock[pk] - qty for pk, qty in changed.items()}
+            ))
+
+        if sales:
+            costs = costing.consume([(sale.product, sale.quantity) for sale in sales])
+            for sale, cost in zip(sales, costs):
+                sale.cost_of_goods = cost
+                sale.profit = sale.total_price - cost
+            Sale.objects.bulk_create(sales)
+            sold = {}
+            for sale in sales:
+                sold[sale.product_id] = sold.get(sale.product_id, 0) + sale.quantity
+            # PIN sales may sell past the recorded stock, which stops at zero.
+            movements.record(_override_movements({
+                pk: stock[pk] - read_stock[pk] + qty for pk, qty in sold.items()
+            }, branch_id) + [
+                StockMovement(product_id=sale.product_id, branch_id=branch_id, kind='SALE', quantity=-sale.quantity,
+                              note=f"Sale #{sale.pk}")
+                for sale in sales
+            ])
+            payments = Payment.objects.bulk_create([
+                Payment(sale=sale, amount_paid=sale.paid_amount, payment_mode=sale.payment_mode)
+                for sale in sales if sale.paid_amount > 0
+            ])
+            events.emit([events.sale_event(sale) for sale in sales] + [
+                events.payment_event(payment, payment.sale.customer_id) for payment in payments
+            ])
+            rollup.record_sales(sales)
+            debts = {}
+            for sale in sales:
+                debts[sale.customer_id] = debts.get(sale.customer_id, 0) + sale.remaining_amount
+            ledger.add_debts(debts)
+            for day in {timezone.localdate(sale.date) for sale in sales}:
+                caching.invalidate_sales(day)
+            caching.invalidate_stock(list(sold))
+
+        for result in results:
+            if isinstance(result.get('sale'), Sale):
+                result['sale'] = result['sale'].pk
+
+    return results, {pk: stock[pk] for pk in products}
+
+
+def _as_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _sync_entry(key, entry, products, customers, stock, admin_pin, closed=None):
+    """Validate one offline sale against the batch's running stock; ``closed`` is the period boundary."""
+    if not key:
+        raise ValueError("missing idempotency key")
+    product = products.get(_as_id(entry.get('product')))
+    if product is None:
+        raise ValueError("unknown product")
+    customer = None
+    if entry.get('customer'):
+        customer = customers.get(_as_id(entry['customer']))
+        if customer is None:
+            raise ValueError("unknown customer")
+    qty = int(entry['quantity'])
+    if qty <= 0:
+        raise ValueError("quantity must be positive")
+    payment_mode = entry.get('payment_mode', 'CASH')
+    if payment_mode not in PAYMENT_MODES:
+        raise ValueError(f"unknown payment mode {payment_mode!r}")
+    sp = Decimal(str(entry.get('selling_price') or product.selling_price))
+    paid = Decimal(str(entry.get('paid_amount') or 0))
+    if paid < 0:
+        raise ValueError("paid_amount cannot be negative")
+    approved = entry.get('pin') == admin_pin
+    recorded_at = entry.get('recorded_at')
+    date = parse_datetime(recorded_at) if recorded_at else timezone.now()
+    if date is None:
+        raise ValueError("recorded_at is not an ISO date-time")
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    if closed and date < closed:
+        raise ValueError("recorded_at is in a closed period")
+
+    if sp < product.buying_price and not approved:
+        raise ValueError("selling below buying price requires Admin PIN")
+    if qty > stock[product.pk] and not approved:
+        raise ValueError("insufficient stock")
+    stock[product.pk] = max(stock[product.pk] - qty, 0)
+
+    total_price = sp * qty
+    remaining = max(total_price - paid, Decimal('0.00'))
+    return Sale(
+        client_key=key,
+        product=product,
+        customer=customer,
+        quantity=qty,
+        selling_price=sp,
+        total_price=total_price,
+        paid_amount=paid,
+        remaining_amount=remaining,
+        payment_mode=payment_mode,
+        status='COMPLETED' if remaining == 0 else 'PENDING_PAYMENT',
+        approved_by_pin=approved,
+        date=date
+    )
+
+
+# ---------- Customer Payments ----------
+@retry_on_lock
+def allocate_payment(customer, amount, payment_mode):
+    """Apply one customer payment to their open sales, oldest first.
+
+    Touched sales and receipts are written with ``bulk_update``, one
+    ``Payment`` per sale with ``bulk_create``, and the customer balance with
+    an ``F()`` decrement. Returns ``(applied, unapplied)``.
+    """
+    with transaction.atomic():
+        open_sales = Sale.objects.filter(
+            customer=customer, status='PENDING_PAYMENT'
+        ).only('id', 'receipt_id', 'product_id', 'branch_id', 'payment_mode', 'date', 'paid_amount', 'remaining_amount')
+
+        left = amount
+        touched = []
+        payments = []
+        collected = []
+        for sale in open_sales.order_by('date', 'id').iterator(chunk_size=200):
+            if left <= 0:
+                break
+            share = min(left, sale.remaining_amount)
+            left -= share
+            sale.paid_amount += share
+            sale.remaining_amount -= share
+            sale.status = 'COMPLETED' if sale.remaining_amount == 0 else 'PENDING_PAYMENT'
+            touched.append(sale)
+            payments.append(Payment(sale=sale, amount_paid=share, payment_mode=payment_mode))
+            collected.append((sale, share))
+
+        applied = amount - left
+        if not touched:
+            return applied, left
+
+        Sale.objects.bulk_update(touched, ['paid_amount', 'remaining_amount', 'status'])
+        fragments.touch('sale', [sale.pk for sale in touched])
+        Payment.objects.bulk_create(payments)
+        events.emit([events.payment_event(payment, customer.pk) for payment in payments])
+        rollup.record_collections(collected)
+
+        by_receipt = {}
+        for sale, share in collected:
+            if sale.receipt_id:
+                by_receipt[sale.receipt_id] = by_receipt.get(sale.receipt_id, 0) + share
+        if by_receipt:
+            receipts = list(Receipt.objects.filter(pk__in=by_receipt))
+            for receipt in receipts:
+                receipt.paid_amount += by_receipt[receipt.pk]
+                receipt.remaining_amount = max(receipt.remaining_amount - by_receipt[receipt.pk], Decimal('0.00'))
+                receipt.status = 'COMPLETED' if receipt.remaining_amount == 0 else 'PENDING_PAYMENT'
+            Receipt.objects.bulk_update(receipts, ['paid_amount', 'remaining_amount', 'status'])
+
+        Customer.objects.filter(pk=customer.pk).update(balance=F('balance') - applied)
+
+    return applied, left
+
+
+# ---------- Stock In ----------
+@retry_on_lock
+def receive_stock(product_id, quantity, buying_price, selling_price, branch_id=MAIN_BRANCH):
+    """Add a delivery to a branch's stock with increments, not read-modify-write.
+
+    The delivery becomes a new cost layer and moves the product's average cost.
+    """
+    with transaction.atomic():
+        updated = Product.objects.filter(pk=product_id).update(
+            stock_quantity=F('stock_quantity') + quantity,
+            average_cost=costing.average_after_delivery(quantity, buying_price * quantity),
+            buying_price=buying_price,
+            selling_price=selling_price
+        )
+        if not updated:
+            raise ProductNotFound(product_id)
+        branches.add_stock(branch_id, {product_id: quantity})
+        caching.invalidate_stock([product_id])
+        catalog.touch([product_id])
+
+        stock_in = StockIn.objects.create(
+            product_id=product_id,
+            branch_id=branch_id,
+            quantity=quantity,
+            remaining_quantity=quantity,
+            buying_price=buying_price,
+            selling_price=selling_price
+        )
+        movements.record([StockMovement(
+            product_id=product_id, branch_id=branch_id, kind='STOCK_IN', quantity=quantity,
+            note=f"Stock in #{stock_in.pk}"
+        )])
+        events.emit([events.stock_in_event(stock_in)])
+        return stock_in
+
+
+# ---------- Stock Adjustment ----------
+@retry_on_lock
+def adjust_stock(product_id, quantity, note, branch_id=MAIN_BRANCH):
+    """Correct a branch's stock by a signed ``quantity`` (a recount, damage, a return).
+
+    Removed units come off the cost layers like a sale; stock can never go
+    below zero.
+    """
+    with transaction.atomic():
+        product = Product.objects.filter(pk=product_id).first()
+        if product is None:
+            raise ProductNotFound(product_id)
+        if quantity < 0:
+            if not BranchStock.objects.filter(
+                branch_id=branch_id, product_id=product_id, quantity__gte=-quantity
+            ).update(quantity=F('quantity') + quantity):
+                raise InsufficientStock(product.name)
+        else:
+            branches.add_stock(branch_id, {product_id: quantity})
+        Product.objects.filter(pk=product_id).update(stock_quantity=F('stock_quantity') + quantity)
+        if quantity < 0:
+            costing.consume([(product, -quantity)])
+        movements.record([StockMovement(product=product, branch_id=branch_id, kind='ADJUSTMENT', quantity=quantity,
+                                        note=note)])
+        events.emit([events.event('ADJUSTMENT', product_id, branch=branch_id, quantity=quantity, note=note)])
+        caching.invalidate_stock([product_id])
+    return product
+
+
+# ---------- Stock Transfer ----------
+@retry_on_lock
+def transfer_stock(product_id, from_branch, to_branch, quantity, note=''):
+    """Move ``quantity`` units of a product from one branch to another.
+
+    The source is decremented with a conditional ``UPDATE`` like a sale; the
+    product total, its cost layers and its average cost do not change.
+    """
+    if from_branch == to_branch:
+        raise ValueError("A transfer needs two different branches.")
+    with transaction.atomic():
+        if not BranchStock.objects.filter(
+            branch_id=from_branch, product_id=product_id, quantity__gte=quantity
+        ).update(quantity=F('quantity') - quantity):
+            raise InsufficientStock(product_id)
+        branches.add_stock(to_branch, {product_id: quantity})
+        transfer = StockTransfer.objects.create(
+            product_id=product_id, from_branch_id=from_branch, to_branch_id=to_branch, quantity=quantity, note=note
+        )
+        movements.record([
+            StockMovement(product_id=product_id, branch_id=from_branch, kind='TRANSFER', quantity=-quantity,
+                          note=f"Transfer #{transfer.pk}"),
+            StockMovement(product_id=product_id, branch_id=to_branch, kind='TRANSFER', quantity=quantity,
+                          note=f"Transfer #{transfer.pk}"),
+        ])
+        events.emit([events.event(
+            'TRANSFER', transfer.pk, product=product_id, from_branch=from_branch, to_branch=to_branch,
+            quantity=quantity, note=note,
+        )])
+    return transfer
+
+
+# ---------- Branch Stock ----------
+def _per_product(field, values):
+    """A ``CASE`` giving each row the value of its product in ``{product id: value}``; ``field`` names the id."""
+    if len(values) == 1:
+        # A single-line sale; the rows are already filtered to that product.
+        [value] = values.values()
+        return Value(value)
+    return Case(*[When(**{field: pk}, then=Value(value)) for pk, value in values.items()], output_field=IntegerField())
+
+
+def _take_stock(branch_id, wanted, approved, label):
+    """Take ``wanted`` (``{product id: units}``) from a branch and the product totals; return the shortfall.
+
+    The branch rows are decremented by one conditional ``UPDATE``, so
+    concurrent tills can never oversell; InsufficientStock(``label``) is
+    raised if any product cannot cover its units. An approved (PIN) sale
+    may take a branch down to zero instead, and the units it sold beyond
+    that come back as the shortfall.
+    """
+    stock = BranchStock.objects.filter(branch_id=branch_id, product_id__in=wanted)
+    needed = _per_product('product_id', wanted)
+    shortfall = {}
+    if approved:
+        shortfall = _shortfall(stock, wanted)
+        stock.update(quantity=Greatest(F('quantity') - needed, 0))
+    elif stock.filter(quantity__gte=needed).update(quantity=F('quantity') - needed) != len(wanted):
+        # Roll back the lines that did fit before reporting the shortage.
+        raise InsufficientStock(label)
+    taken = {pk: qty - shortfall.get(pk, 0) for pk, qty in wanted.items() if qty > shortfall.get(pk, 0)}
+    if taken:
+        Product.objects.filter(pk__in=taken).update(
+            stock_quantity=F('stock_quantity') - _per_product('pk', taken)
+        )
+    return shortfall
+
+
+def _shortfall(stock, wanted):
+    """Units each product in ``wanted`` lacks at the branch; read before a PIN sale clamps it at zero."""
+    on_hand = dict(stock.select_for_update().values_list('product_id', 'quantity'))
+    return {pk: qty - on_hand.get(pk, 0) for pk, qty in wanted.items() if on_hand.get(pk, 0) < qty}
+
+
+def _override_movements(shortfall, branch_id):
+    """Adjustments booking in the units a PIN sale sold beyond the branch's recorded stock."""
+    return [
+        StockMovement(product_id=pk, branch_id=branch_id, kind='ADJUSTMENT', quantity=qty,
+                      note="PIN sale beyond recorded stock")
+        for pk, qty in shortfall.items() if qty > 0
+    ]
@@ -0,0 +1,108 @@
+import os
+import uuid
+from datetime import date
+
+from django.conf import settings
+from django.urls import reverse
+
+from . import archive, caching, costing, documents, events, fragments, periods, reorder, rollup
+from .exports import csv_lines, export_rows, ndjson_lines
+from .importer import import_stock, read_rows
+from .jobs import task
+from .models import MAIN_BRANCH
+
+# Work the views hand to the background worker. Every task takes its
+# payload as keyword arguments and returns a JSON-serialisable result.
+
+REPORTED_ERRORS = 50
+
+
+def job_path(*parts):
+    path = os.path.join(settings.POS_JOB_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+@task('rebuild_sales_summary')
+def rebuild_sales_summary(start=None, end=None):
+    written = rollup.rebuild(
+        date.fromisoformat(start) if start else None,
+        date.fromisoformat(end) if end else None,
+    )
+    caching.invalidate_sales()
+    caching.dashboard()
+    return {'rows': written}
+
+
+@task('revalue', max_attempts=1)
+def revalue(method=None):
+    sales, changed = costing.replay(method)
+    if changed:
+        rollup.rebuild()
+        caching.invalidate_sales()
+        fragments.touch('sale')
+    return {'sales': sales, 'changed': changed}
+
+
+@task('refresh_reorder')
+def refresh_reorder(full=False):
+    return {'products': reorder.refresh(full=full)}
+
+
+@task('close_period', max_attempts=1)
+def close_period(month):
+    closes = periods.close(date.fromisoformat(f"{month}-01"))
+    moved = archive.archive()
+    return {'closed': [f"{close.month:%Y-%m}" for close in closes], 'archived': moved}
+
+
+@task('compact_events')
+def compact_events():
+    return {'deleted': events.compact()}
+
+
+@task('export_sales')
+def export_sales(filters, file_format='csv'):
+    lines = ndjson_lines if file_format == 'ndjson' else csv_lines
+    name = f"sales-{uuid.uuid4().hex[:12]}.{file_format}"
+    path = job_path('exports', name)
+    rows = 0
+    with open(path, 'w', newline='', encoding='utf-8') as out:
+        for line in lines(export_rows(filters)):
+            out.write(line)
+            rows += 1
+    if file_format == 'csv':
+        rows -= 1  # header
+    return {'file': os.path.join('exports', name), 'rows': rows}
+
+
+DOCUMENT_URLS = {'receipt': 'sale_receipt', 'invoice': 'sale_invoice', 'statement': 'customer_statement'}
+
+
+@task('render_document')
+def render_document(kind, pk, file_format='html'):
+    path, created = documents.render(kind, pk, file_format)
+    return {'document': f"{reverse(DOCUMENT_URLS[kind], args=[pk])}?format={file_format}", 'created': created}
+
+
+@task('render_statements')
+def render_statements(file_format='html'):
+    statements, created = documents.render_statements(file_format)
+    return {'statements': statements, 'created': created}
+
+
+# A failed import may already have written some chunks, so it is not retried.
+@task('import_stock', max_attempts=1)
+def import_stock_file(upload, filename, create_missing=False, branch_id=MAIN_BRANCH):
+    path = os.path.join(settings.POS_JOB_DIR, upload)
+    try:
+        with open(path, 'rb') as fileobj:
+            written, errors = import_stock(read_rows(fileobj, filename), create_missing=create_missing,
+                                           branch_id=branch_id)
+    finally:
+        os.remove(path)
+    return {
+        'written': written,
+        'rejected': len(errors),
+        'errors': [f"Line {line}: {message}" for line, message in errors[:REPORTED_ERRORS]],
+    }
@@ -1,3 +1,907 @@
-from django.test import TestCase
+import json
+import tempfile
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Sum
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    archive, branches, caching, catalog, checks, costing, documents, events, fragments, jobs, movements, periods,
+    reorder, rollup, seeding
+)
+from .exports import EXPORT_FIELDS, export_rows
+from .importer import import_stock
+from .ledger import aged_debtors
+from .models import (
+    MAIN_BRANCH, ArchivedSale, BranchStock, CatalogGeneration, ChangeEvent, Customer, DailySalesSummary,
+    DailyTotalSummary, Job, PeriodClose, Product, Sale, StockIn, StockMovement, StockSnapshot
+)
+from .services import (
+    InsufficientStock, allocate_payment, receive_stock, record_sale, sync_sales, transfer_stock
+)
+from .views import BRANCH_COOKIE
+
+
+class QueryBudgetMixin:
+    """``assertMaxQueries`` fails when a block runs more queries than its budget."""
+
+    @contextmanager
+    def assertMaxQueries(self, budget):
+        with CaptureQueriesContext(connection) as captured:
+            yield captured
+        executed = len(captured)
+        if executed > budget:
+            queries = '\n'.join(
+                f"{i}. {query['sql']}" for i, query in enumerate(captured.captured_queries, start=1)
+            )
+            self.fail(f"{executed} queries executed, budget is {budget}:\n{queries}")
+
+
+# Tests keep their caches in memory, apart from the file cache a dev
+# server or worker may be using.
+TEST_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'tests-{alias}'}
+    for alias in ('default', 'fragments')
+}
+
+
+def clear_caches():
+    for alias in TEST_CACHES:
+        caches[alias].clear()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PosTestCase(TestCase):
+    """Five products with 100 in stock at the main branch, and a customer."""
+
+    def setUp(self):
+        clear_caches()
+        self.customer = Customer.objects.create(name='Budget Customer')
+        self.products = [
+            Product.objects.create(
+                name=f'Product {i}', buying_price=Decimal('10.00'),
+                selling_price=Decimal('15.00'), stock_quantity=100,
+            )
+            for i in range(5)
+        ]
+
+    def add_sales(self, count):
+        for i in range(count):
+            record_sale(
+                self.products[i % len(self.products)], self.customer, 1,
+                Decimal('15.00'), 'CASH', Decimal('15.00'),
+            )
+
+    def checkout(self, products, quantity=1):
+        return self.client.post(reverse('checkout'), {
+            'product': [p.pk for p in products], 'quantity': [quantity] * len(products),
+            'selling_price': ['15.00'] * len(products), 'customer': self.customer.pk,
+            'payment_mode': 'CASH', 'paid_amount': str(15 * quantity * len(products)),
+        })
+
+
+class ViewQueryBudgetTests(QueryBudgetMixin, PosTestCase):
+    """Query counts must not grow with the number of rows shown (no N+1)."""
+
+    def test_sale_create_post(self):
+        receive_stock(self.products[0].pk, 10, Decimal('12.00'), Decimal('15.00'))
+        # Includes the catalog generation, the cost layers the sale consumes,
+        # its stock movement, both daily rollups and its change events; the
+        # branch's stock row and the product's all-branch total are
+        # decremented separately.
+        with self.assertMaxQueries(15):
+            response = self.client.post(reverse('sale_create'), {
+                'product': self.products[0].pk, 'customer': self.customer.pk,
+                'quantity': 1, 'selling_price': '15.00',
+                'payment_mode': 'CASH', 'paid_amount': '15.00',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Sale.objects.get().cost_of_goods, Decimal('12.00'))
+
+    def test_checkout_queries_do_not_grow_with_lines(self):
+        products = self.products + [
+            Product.objects.create(
+                name=f'Extra {i}', buying_price=Decimal('10.00'),
+                selling_price=Decimal('15.00'), stock_quantity=100,
+            )
+            for i in range(10)
+        ]
+        # The same budget for one line and fifteen.
+        for basket in (products[:1], products):
+            with self.assertMaxQueries(15):
+                self.assertEqual(self.checkout(basket).status_code, 302)
+        self.assertEqual(Sale.objects.count(), 16)
+        self.assertEqual(Product.objects.get(pk=products[0].pk).stock_quantity, 98)
+
+    def test_sale_create_get(self):
+        with self.assertMaxQueries(0):
+            self.client.get(reverse('sale_create'))
+
+    def test_sales_list(self):
+        self.add_sales(60)
+        # Plus the branch names, cold in a cleared cache.
+        with self.assertMaxQueries(2):
+            response = self.client.get(reverse('sales_list'))
+        self.assertEqual(len(response.context['sales']), 50)
+
+    def test_analytics(self):
+        self.add_sales(10)
+        # Plus the branch names; with one branch the totals stay one query.
+        with self.assertMaxQueries(3):
+            response = self.client.get(reverse('analytics'))
+        self.assertEqual(response.context['daily']['total_sales'], Decimal('150'))
+
+    def test_analytics_cached(self):
+        self.client.get(reverse('analytics'))
+        with self.assertMaxQueries(0):
+            self.client.get(reverse('analytics'))
+
+    def test_product_list(self):
+        with self.assertMaxQueries(1):
+            self.client.get(reverse('product_list'))
+
+    def test_product_search(self):
+        with self.assertMaxQueries(1):
+            response = self.client.get(reverse('product_search'), {'q': 'duct 3'})
+        self.assertEqual([r['name'] for r in response.json()['results']], ['Product 3'])
+
+    def test_low_stock_feed(self):
+        Product.objects.filter(pk=self.products[1].pk).update(stock_quantity=2)
+        with self.assertMaxQueries(2):
+            response = self.client.get(reverse('low_stock_feed'))
+        self.assertEqual(response.json()['count'], 1)
+        self.assertEqual(response.json()['results'][0]['name'], 'Product 1')
+
+    def test_analytics_series(self):
+        self.add_sales(6)
+        with self.assertMaxQueries(3):
+            response = self.client.get(reverse('analytics_series'), {'top': 2})
+        data = response.json()
+        self.assertEqual(len(data['series']), 30)
+        self.assertEqual(data['series'][-1]['sales'], '90.00')
+        self.assertEqual(data['totals']['units'], 6)
+        self.assertEqual(data['change']['sales'], {'delta': '90.00', 'percent': None})
+        self.assertEqual([p['name'] for p in data['top_products']], ['Product 0', 'Product 1'])
+
+        response = self.client.get(reverse('analytics_series'), {'bucket': 'hour', 'split': 'customer'})
+        self.assertEqual(response.json()['series'][0]['label'], 'Budget Customer')
+        self.assertEqual(self.client.get(reverse('analytics_series'), {'bucket': 'year'}).status_code, 400)
+
+    def test_reorder_list(self):
+        self.add_sales(10)
+        Product.objects.filter(pk=self.products[0].pk).update(stock_quantity=0)
+        reorder.refresh()
+        with self.assertMaxQueries(1):
+            response = self.client.get(reverse('reorder_list'))
+        self.assertEqual([s.product for s in response.context['suggestions']], [self.products[0]])
+        self.assertGreater(response.context['suggestions'][0].suggested_quantity, 0)
+
+
+class SaleTests(PosTestCase):
+    """Selling never takes stock below zero, and a basket sells all its lines or none."""
+
+    def stock(self, product):
+        return (
+            Product.objects.get(pk=product.pk).stock_quantity,
+            BranchStock.objects.get(branch_id=MAIN_BRANCH, product=product).quantity,
+        )
+
+    def test_oversell_is_rejected(self):
+        product = self.products[0]
+        with self.assertRaises(InsufficientStock):
+            record_sale(product, self.customer, 101, Decimal('15.00'), 'CASH', Decimal('1515.00'))
+        response = self.client.post(reverse('sale_create'), {
+            'product': product.pk, 'quantity': 101, 'selling_price': '15.00',
+            'payment_mode': 'CASH', 'paid_amount': '1515.00',
+        })
+        self.assertRedirects(response, reverse('sale_create'))
+        self.assertEqual(self.stock(product), (100, 100))
+        self.assertFalse(Sale.objects.exists())
+        self.assertFalse(StockMovement.objects.filter(kind='SALE').exists())
+
+    def test_stock_never_goes_negative(self):
+        product = self.products[0]
+        # Another till sold all but one unit since ``product`` was read; its
+        # stale stock_quantity of 100 must not matter.
+        Product.objects.filter(pk=product.pk).update(stock_quantity=1)
+        BranchStock.objects.filter(product=product).update(quantity=1)
+        with self.assertRaises(InsufficientStock):
+            record_sale(product, self.customer, 2, Decimal('15.00'), 'CASH', Decimal('30.00'))
+        record_sale(product, self.customer, 1, Decimal('15.00'), 'CASH', Decimal('15.00'))
+        with self.assertRaises(InsufficientStock):
+            record_sale(product, self.customer, 1, Decimal('15.00'), 'CASH', Decimal('15.00'))
+        self.assertEqual(self.stock(product), (0, 0))
+        self.assertEqual(Sale.objects.count(), 1)
+
+    def test_checkout_is_all_or_nothing(self):
+        Product.objects.filter(pk=self.products[2].pk).update(stock_quantity=1)
+        BranchStock.objects.filter(product=self.products[2]).update(quantity=1)
+        self.checkout(self.products, quantity=2)
+        self.assertFalse(Sale.objects.exists())
+        self.assertEqual(
+            sorted(Product.objects.values_list('stock_quantity', flat=True)), [1, 100, 100, 100, 100]
+        )
+        self.assertEqual(
+            sorted(BranchStock.objects.values_list('quantity', flat=True)), [1, 100, 100, 100, 100]
+        )
+
+
+class SalesListTests(PosTestCase):
+    """The sales list's keyset pages and filters, and the exports that share the filters."""
+
+    def setUp(self):
+        super().setUp()
+        self.add_sales(60)
+        self.other = Customer.objects.create(name='Other Customer')
+        self.credit = record_sale(self.products[1], self.other, 2, Decimal('15.00'), 'CREDIT', Decimal('0.00'))
+
+    def ids(self, **params):
+        return [sale.pk for sale in self.client.get(reverse('sales_list'), params).context['sales']]
+
+    def test_pages_follow_the_cursor(self):
+        newest_first = list(Sale.objects.order_by('-date', '-id').values_list('pk', flat=True))
+        first = self.client.get(reverse('sales_list'))
+        second = self.client.get(f"{reverse('sales_list')}?{first.context['next_query']}")
+        self.assertEqual(
+            [sale.pk for sale in first.context['sales']] + [sale.pk for sale in second.context['sales']], newest_first
+        )
+        self.assertEqual(second.context['next_query'], '')
+        self.assertEqual(self.client.get(reverse('sales_list'), {'after': 'yesterday'}).status_code, 404)
+
+    def test_filters(self):
+        response = self.client.get(reverse('sales_list'), {'customer': self.other.pk})
+        self.assertEqual([sale.pk for sale in response.context['sales']], [self.credit.pk])
+        self.assertEqual(response.context['customer_name'], 'Other Customer')
+        self.assertEqual(self.ids(payment_mode='CREDIT'), [self.credit.pk])
+        self.assertEqual(self.ids(status='PENDING_PAYMENT'), [self.credit.pk])
+        self.assertEqual(self.ids(customer=self.customer.pk, payment_mode='CREDIT'), [])
+        today = timezone.localdate()
+        self.assertEqual(len(self.ids(start=today.isoformat(), end=today.isoformat())), 50)
+        self.assertEqual(self.ids(start=(today + timedelta(days=1)).isoformat()), [])
+        self.assertEqual(self.client.get(reverse('sales_list'), {'start': '2020-13-01'}).status_code, 404)
+
+    def test_exports(self):
+        response = self.client.get(reverse('sales_export'))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(lines[0].split(','), EXPORT_FIELDS)
+        self.assertEqual(len(lines), 62)
+
+        response = self.client.get(reverse('sales_export'), {'format': 'ndjson', 'customer': self.other.pk})
+        [row] = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(
+            (row['id'], row['customer__name'], row['remaining_amount'], row['status']),
+            (self.credit.pk, 'Other Customer', '30.00', 'PENDING_PAYMENT')
+        )
+
+
+class RollupTests(PosTestCase):
+    """The daily rollups kept by each write agree with a rebuild from the sales."""
+
+    def rollups(self):
+        return (
+            list(DailySalesSummary.objects.order_by('day', 'product_id', 'payment_mode', 'branch_id').values_list(
+                'day', 'product_id', 'payment_mode', 'branch_id', *rollup.COLUMNS)),
+            list(DailyTotalSummary.objects.order_by('day', 'payment_mode', 'branch_id').values_list(
+                'day', 'payment_mode', 'branch_id', *rollup.COLUMNS)),
+        )
+
+    def test_incremental_rollup_matches_rebuild(self):
+        self.add_sales(7)
+        record_sale(self.products[1], self.customer, 3, Decimal('15.00'), 'CREDIT', Decimal('5.00'))
+        self.checkout(self.products[2:], quantity=2)
+        allocate_payment(self.customer, Decimal('25.00'), 'MPESA')
+        backdated = (timezone.now() - timedelta(days=2)).isoformat()
+        results, _ = sync_sales([
+            {'key': 'late-1', 'product': self.products[0].pk, 'quantity': 2, 'paid_amount': '30.00',
+             'recorded_at': backdated},
+            {'key': 'late-2', 'product': self.products[3].pk, 'quantity': 1, 'paid_amount': '0.00',
+             'payment_mode': 'CREDIT', 'recorded_at': backdated},
+        ], '')
+        self.assertEqual([result['status'] for result in results], ['created', 'created'])
+        self.assertEqual(Sale.objects.count(), 13)
+
+        incremental = self.rollups()
+        self.assertEqual(len({row[0] for row in incremental[1]}), 2)
+        rollup.rebuild()
+        self.assertEqual(self.rollups(), incremental)
+
+
+class CatalogTests(PosTestCase):
+    """The sale paths read prices from the catalog and see every product write."""
+
+    def test_sale_reads_products_from_catalog(self):
+        sale = {
+            'product': self.products[0].pk, 'quantity': 1, 'selling_price': '15.00',
+            'payment_mode': 'CASH', 'paid_amount': '15.00',
+        }
+        self.client.post(reverse('sale_create'), sale)
+        with CaptureQueriesContext(connection) as captured:
+            self.client.post(reverse('sale_create'), sale)
+        self.assertFalse([q for q in captured.captured_queries if 'FROM "pos_product"' in q['sql']])
+
+        # The generation lives in the database, so no cache (or on-commit hook) carries the write.
+        receive_stock(self.products[0].pk, 5, Decimal('20.00'), Decimal('30.00'))
+        self.assertEqual(catalog.get(self.products[0].pk).selling_price, Decimal('30.00'))
+        # Without its generation row the catalog reads through instead of serving stale prices.
+        CatalogGeneration.objects.all().delete()
+        Product.objects.filter(pk=self.products[0].pk).update(selling_price=Decimal('35.00'))
+        self.assertEqual(catalog.get(self.products[0].pk).selling_price, Decimal('35.00'))
+
+
+class StockImportTests(PosTestCase):
+    """Delivery rows from a CSV or XLSX upload."""
+
+    def test_import_stock_rows(self):
+        Product.objects.filter(pk=self.products[0].pk).update(sku='P0')
+        Product.objects.create(name='Product 1', buying_price=Decimal('9.00'), selling_price=Decimal('14.00'))
+        prices = {'buying_price': '11.00', 'selling_price': '16.00'}
+        rows = [
+            (2, {'sku': 'P0', 'quantity': '4', **prices}),
+            (3, {'sku': 'NEW-1', 'name': 'New Product', 'quantity': '3', **prices}),
+            (4, {'name': 'Product 1', 'quantity': '1', **prices}),
+            (5, {'name': 'Product 2', 'quantity': '2', **prices}),
+        ]
+        ambiguous = (4, "several products are named 'Product 1'; give the sku")
+        self.assertEqual(import_stock(rows), (2, [(3, "unknown product 'NEW-1'"), ambiguous]))
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock_quantity, 104)
+        self.assertEqual(Product.objects.get(pk=self.products[2].pk).stock_quantity, 102)
+
+        self.assertEqual(import_stock(rows, create_missing=True), (3, [ambiguous]))
+        created = Product.objects.get(sku='NEW-1')
+        self.assertEqual((created.name, created.stock_quantity), ('New Product', 3))
+        self.assertEqual(BranchStock.objects.get(product=created).quantity, 3)
+        self.assertEqual(Product.objects.filter(name='Product 1').count(), 2)
+
+        with self.assertRaisesMessage(CommandError, "No branch with id 99."):
+            call_command('import_stock', 'delivery.csv', branch=99)
+
+
+class PaymentTests(PosTestCase):
+    """Customer payments and debtor aging."""
+
+    def test_payments_settle_oldest_sales_first(self):
+        now = timezone.now()
+        sales = []
+        for age in (90, 45, 0):
+            sale = record_sale(self.products[0], self.customer, 2, Decimal('15.00'), 'CREDIT', Decimal('0.00'))
+            Sale.objects.filter(pk=sale.pk).update(date=now - timedelta(days=age))
+            sales.append(sale.pk)
+        [row] = aged_debtors(now)
+        self.assertEqual(
+            (row['balance'], row['current'], row['days_31_60'], row['over_60']),
+            (Decimal('90.00'), Decimal('30.00'), Decimal('30.00'), Decimal('30.00'))
+        )
+
+        self.assertEqual(allocate_payment(self.customer, Decimal('40.00'), 'CASH'), (Decimal('40.00'), 0))
+        remaining = dict(Sale.objects.values_list('pk', 'remaining_amount'))
+        self.assertEqual([remaining[pk] for pk in sales], [Decimal('0.00'), Decimal('20.00'), Decimal('30.00')])
+        self.assertEqual(Sale.objects.get(pk=sales[0]).status, 'COMPLETED')
+        [row] = aged_debtors(now)
+        self.assertEqual((row['balance'], row['days_31_60'], row['over_60']), (Decimal('50.00'), Decimal('20.00'), 0))
+
+        # An overpayment settles everything and hands back the rest.
+        applied = allocate_payment(self.customer, Decimal('80.00'), 'MPESA')
+        self.assertEqual(applied, (Decimal('50.00'), Decimal('30.00')))
+        self.assertEqual(Customer.objects.get(pk=self.customer.pk).balance, 0)
+        self.assertFalse(Sale.objects.filter(status='PENDING_PAYMENT').exists())
+        self.assertEqual(aged_debtors(now), [])
+
+
+class OfflineSyncTests(PosTestCase):
+    """Batches of sales recorded by tills while offline."""
+
+    @override_settings(POS_SYNC_KEY='till-key')
+    def test_offline_sync(self):
+        PeriodClose.objects.create(month=date(2020, 1, 1))
+        till = Client(enforce_csrf_checks=True)
+        url = reverse('sync_sales')
+        backdated = (timezone.now() - timedelta(days=3)).replace(microsecond=0)
+        entry = {'product': self.products[0].pk, 'quantity': 2, 'selling_price': '15.00', 'paid_amount': '30.00'}
+        batch = {'sales': [
+            {**entry, 'key': 'a', 'recorded_at': backdated.isoformat()},
+            {**entry, 'key': 'a'},
+            {**entry, 'key': 'b', 'quantity': 99},
+            {**entry, 'key': 'c', 'recorded_at': '2020-01-15T10:00:00+00:00'},
+            {**entry, 'key': 'd', 'paid_amount': '-5.00'},
+        ]}
+
+        self.assertEqual(till.post(url, batch, content_type='application/json').status_code, 401)
+        response = till.post(url, batch, content_type='application/json', HTTP_AUTHORIZATION='Bearer till-key')
+        results = response.json()['results']
+        sale = Sale.objects.get(client_key='a')
+        self.assertEqual(sale.date, backdated)
+        self.assertEqual([(r['status'], r.get('sale'), r.get('error')) for r in results], [
+            ('created', sale.pk, None),
+            ('duplicate', sale.pk, None),
+            ('rejected', None, 'insufficient stock'),
+            ('rejected', None, 'recorded_at is in a closed period'),
+            ('rejected', None, 'paid_amount cannot be negative'),
+        ])
+        self.assertEqual(response.json()['stock'], {str(self.products[0].pk): 98})
+
+        # A resend is acknowledged without selling again.
+        response = till.post(url, {'sales': batch['sales'][:1]}, content_type='application/json',
+                             HTTP_AUTHORIZATION='Bearer till-key')
+        self.assertEqual(response.json()['results'], [{'key': 'a', 'status': 'duplicate', 'sale': sale.pk}])
+        self.assertEqual(Sale.objects.count(), 1)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock_quantity, 98)
+
+
+class CostingTests(PosTestCase):
+    """Cost of goods from FIFO layers or the average cost."""
+
+    def test_cost_layers_and_replay(self):
+        product = Product.objects.create(name='Layered', buying_price=Decimal('10.00'), selling_price=Decimal('20.00'))
+        receive_stock(product.pk, 5, Decimal('10.00'), Decimal('20.00'))
+        StockIn.objects.filter(product=product).update(date=timezone.now() - timedelta(days=3))
+        receive_stock(product.pk, 5, Decimal('14.00'), Decimal('20.00'))
+        product.refresh_from_db()
+        self.assertEqual(product.average_cost, Decimal('12.0000'))
+        layers = StockIn.objects.filter(product=product).order_by('date')
+
+        # FIFO: three units from the first delivery, then a backdated till
+        # sale takes the rest of it and spills into the second.
+        live = record_sale(product, None, 3, Decimal('20.00'), 'CASH', Decimal('60.00'))
+        self.assertEqual(live.cost_of_goods, Decimal('30.00'))
+        [result], _ = sync_sales([{
+            'key': 'late', 'product': product.pk, 'quantity': 4, 'paid_amount': '80.00',
+            'recorded_at': (timezone.now() - timedelta(days=2)).isoformat(),
+        }], '')
+        backdated = Sale.objects.get(pk=result['sale'])
+        self.assertEqual(backdated.cost_of_goods, Decimal('48.00'))
+        self.assertEqual(list(layers.values_list('remaining_quantity', flat=True)), [0, 3])
+
+        def costs():
+            return [Sale.objects.get(pk=sale.pk).cost_of_goods for sale in (backdated, live)]
+
+        # Replayed in date order the backdated sale had the first delivery to
+        # itself; the two sales swap costs but the totals and layers stand.
+        self.assertEqual(costing.replay(costing.FIFO), (2, 2))
+        self.assertEqual(costs(), [Decimal('40.00'), Decimal('38.00')])
+        self.assertEqual(list(layers.values_list('remaining_quantity', flat=True)), [0, 3])
+
+        # AVERAGE prices the live sale at (1 x 10 + 5 x 14) / 6 instead.
+        self.assertEqual(costing.replay(costing.AVERAGE), (2, 1))
+        self.assertEqual(costs(), [Decimal('40.00'), Decimal('40.00')])
+
+
+class MetricsTests(PosTestCase):
+    """Per-request timings and their Prometheus export."""
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('product_list'))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+    def test_prometheus_needs_staff_or_token(self):
+        url = reverse('metrics_prometheus')
+        self.client.get(reverse('product_list'))
+        with override_settings(POS_METRICS_PROMETHEUS=True, POS_METRICS_TOKEN='scrape-secret'):
+            self.assertEqual(self.client.get(url).status_code, 403)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            response = self.client.get(url, HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertContains(response, 'pos_request_template_seconds{view="product_list"')
+
+
+class FragmentTests(PosTestCase):
+    """Cached table rows follow the writes that change them."""
+
+    def test_cached_rows_follow_writes(self):
+        self.add_sales(1)
+        self.client.get(reverse('product_list'))
+        self.client.get(reverse('sales_list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            receive_stock(self.products[0].pk, 7, Decimal('10.00'), Decimal('15.00'))
+            product = Product.objects.get(pk=self.products[0].pk)
+            product.name = 'Renamed'
+            product.save()
+        self.assertContains(self.client.get(reverse('product_list')), '<td>106</td>')
+        self.assertContains(self.client.get(reverse('sales_list')), 'Renamed')
+
+
+class CachingTests(PosTestCase):
+    """Writes drop exactly the cached entries they change; one worker recomputes an expired entry."""
+
+    def setUp(self):
+        super().setUp()
+        today = timezone.localdate()
+        self.period_keys = [caching.period_key(period, today) for period in caching.PERIODS]
+        # Periods that do not contain today: yesterday's day and week, last year.
+        self.other_keys = [
+            caching.period_key('daily', today - timedelta(days=1)),
+            caching.period_key('weekly', today - timedelta(days=1)),
+            caching.period_key('yearly', today.replace(year=today.year - 1)),
+        ]
+        self.row_keys = [
+            fragments._version_key('product'), fragments._version_key('sale'),
+            *[fragments._version_key('product', product.pk) for product in self.products[:2]],
+        ]
+        self.key = self.period_keys[0]
+        self.computed = 0
+
+    @contextmanager
+    def dropped(self):
+        """Collect the cache entries and row versions retired by the block's writes."""
+        keys = [*self.period_keys, *self.other_keys, caching.LOW_STOCK_KEY]
+        caches['default'].set_many({key: 'cached' for key in keys})
+        caches['fragments'].set_many({key: 'cached' for key in self.row_keys})
+        retired = set()
+        with self.captureOnCommitCallbacks(execute=True):
+            yield retired
+        kept = caches['default'].get_many(keys)
+        tokens = caches['fragments'].get_many(self.row_keys)
+        retired.update(key for key in keys if key not in kept)
+        retired.update(key for key in self.row_keys if tokens[key] != 'cached')
+
+    def test_sale_drops_its_periods_and_stock(self):
+        with self.dropped() as retired:
+            self.add_sales(1)
+        self.assertEqual(retired, {
+            *self.period_keys, caching.LOW_STOCK_KEY, fragments._version_key('product', self.products[0].pk),
+        })
+
+    def test_stock_in_drops_stock_only(self):
+        with self.dropped() as retired:
+            receive_stock(self.products[1].pk, 5, Decimal('10.00'), Decimal('15.00'))
+        self.assertEqual(retired, {caching.LOW_STOCK_KEY, fragments._version_key('product', self.products[1].pk)})
+
+    def test_product_edit_drops_its_row_and_sale_rows(self):
+        product = self.products[1]
+        with self.dropped() as retired:
+            self.client.post(reverse('product_edit', args=[product.pk]), {
+                'name': 'Renamed', 'buying_price': '10.00', 'selling_price': '15.00', 'reorder_level': 50,
+            })
+        self.assertEqual(retired, {
+            caching.LOW_STOCK_KEY, fragments._version_key('sale'), fragments._version_key('product', product.pk),
+        })
+
+    def compute(self):
+        self.computed += 1
+        return {self.key: 'fresh'}
+
+    def test_lock_winner_computes_once(self):
+        self.assertEqual(caching._get_or_compute([self.key], self.compute), {self.key: 'fresh'})
+        self.assertEqual(caching._get_or_compute([self.key], self.compute), {self.key: 'fresh'})
+        self.assertEqual(self.computed, 1)
+        self.assertIsNone(caches['default'].get(f'{self.key}:lock'))
+
+    def test_waiters_take_the_winners_result(self):
+        caches['default'].add(f'{self.key}:lock', 1)
+
+        def winner_publishes(seconds):
+            caches['default'].set(self.key, 'published')
+
+        with mock.patch.object(caching.time, 'sleep', side_effect=winner_publishes):
+            self.assertEqual(caching._get_or_compute([self.key], self.compute), {self.key: 'published'})
+        self.assertEqual(self.computed, 0)
+
+    def test_waiters_compute_when_the_winner_is_slow(self):
+        caches['default'].add(f'{self.key}:lock', 1)
+        with mock.patch.object(caching, 'LOCK_WAIT', 0.1):
+            self.assertEqual(caching._get_or_compute([self.key], self.compute), {self.key: 'fresh'})
+        self.assertEqual(self.computed, 1)
+        # Only the lock holder stores its result and releases the lock.
+        self.assertIsNone(caches['default'].get(self.key))
+        self.assertEqual(caches['default'].get(f'{self.key}:lock'), 1)
+
+
+class DeploymentCheckTests(PosTestCase):
+    """Several processes need caches they share."""
+
+    def test_worker_and_production_need_shared_caches(self):
+        self.assertEqual(checks.shared_caches(None), [])
+        with self.assertRaises(CommandError):
+            call_command('run_pos_worker', burst=True)
+        with override_settings(POS_DB_PROFILE='production'):
+            self.assertEqual([error.id for error in checks.shared_caches(None)], ['pos.E001', 'pos.E001'])
+            shared = {alias: {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': alias}
+                      for alias in ('default', 'fragments')}
+            with override_settings(CACHES=shared):
+                self.assertEqual(checks.shared_caches(None), [])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class JobQueueTests(TransactionTestCase):
+    """Jobs from ``enqueue()`` to their outcome, run the way run_pos_worker runs them."""
+    # execute() manages its own connection, so the jobs must really commit.
+    serialized_rollback = True
+
+    def setUp(self):
+        self.attempts = 0
+
+        def flaky(fail=0):
+            self.attempts += 1
+            if self.attempts <= fail:
+                raise RuntimeError(f'attempt {self.attempts} failed')
+            return {'attempts': self.attempts}
+
+        jobs.task('test_flaky', max_attempts=2)(flaky)
+        self.addCleanup(jobs.TASKS.pop, 'test_flaky')
+
+    def run_due(self):
+        return [jobs.execute(pk) for pk in jobs.claim(10, 'test-worker')]
+
+    def test_job_succeeds(self):
+        job = jobs.enqueue('test_flaky')
+        self.assertEqual(self.run_due(), ['SUCCEEDED'])
+        self.assertEqual(self.run_due(), [])
+        status = self.client.get(reverse('job_status', args=[job.pk])).json()
+        self.assertEqual((status['status'], status['attempts'], status['result']), ('SUCCEEDED', 1, {'attempts': 1}))
+        self.assertEqual(self.client.get(reverse('job_status', args=[job.pk + 1])).status_code, 404)
+
+    def test_job_retries_then_fails(self):
+        job = jobs.enqueue('test_flaky', fail=5)
+        self.assertEqual(self.run_due(), [f'failed, retrying in {jobs.RETRY_BACKOFF}s'])
+        # Not due again until the backoff has passed.
+        self.assertEqual(self.run_due(), [])
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        self.assertEqual(self.run_due(), ['FAILED'])
+        status = self.client.get(reverse('job_status', args=[job.pk])).json()
+        self.assertEqual((status['status'], status['attempts']), ('FAILED', 2))
+        self.assertEqual(status['error'], 'RuntimeError: attempt 2 failed')
+
+    def test_stale_jobs(self):
+        retry = jobs.enqueue('test_flaky')
+        once = jobs.enqueue('test_flaky', max_attempts=1)
+        self.assertEqual(len(jobs.claim(10, 'stopped-worker')), 2)
+        self.assertEqual(jobs.requeue_stale(), (0, 0))
+        Job.objects.update(started_at=timezone.now() - timedelta(seconds=jobs.STALE_AFTER + 1))
+        # The job out of attempts fails rather than running a second time.
+        self.assertEqual(jobs.requeue_stale(), (1, 1))
+        self.assertEqual(dict(Job.objects.values_list('pk', 'status')), {retry.pk: 'QUEUED', once.pk: 'FAILED'})
+        self.assertEqual(self.run_due(), ['SUCCEEDED'])
+        self.assertEqual(self.attempts, 1)
+
+
+class SeedingTests(PosTestCase):
+    """Generated demo history."""
+
+    def test_seeded_history_is_consistent(self):
+        counts = seeding.seed(products=5, customers=3, sales=200, days=30, seed=1)
+        self.assertEqual(counts['sales'], 200)
+        self.assertEqual(movements.reconcile(), [])
+        self.assertFalse(Product.objects.filter(stock_quantity__lt=0).exists())
+        owed = Sale.objects.filter(status='PENDING_PAYMENT').aggregate(total=Sum('remaining_amount'))['total']
+        self.assertEqual(Customer.objects.aggregate(total=Sum('balance'))['total'], owed or 0)
+
+
+class DocumentTests(PosTestCase):
+    """Receipts, invoices and statements rendered to files."""
+
+    def test_documents_are_content_addressed(self):
+        sale = record_sale(self.products[0], self.customer, 2, Decimal('15.00'), 'CREDIT', Decimal('10.00'))
+        url = reverse('sale_receipt', args=[sale.pk])
+        with tempfile.TemporaryDirectory() as root, override_settings(POS_DOCUMENT_DIR=root):
+            # Not rendered yet: queued for the worker instead of rendered inline.
+            self.assertRedirects(self.client.get(url), reverse('job_detail', args=[Job.objects.get().pk]))
+            self.assertRedirects(self.client.get(url), reverse('job_detail', args=[Job.objects.get().pk]))
+            self.client.get(f'{url}?format=escpos')
+            self.assertEqual(Job.objects.count(), 2)
+            path, created = documents.render('receipt', sale.pk)
+            self.assertTrue(created)
+            self.assertEqual(documents.render('receipt', sale.pk), (path, False))
+            response = self.client.get(url)
+            self.assertIn(b'Product 0', b''.join(response.streaming_content))
+            self.assertTrue(documents.render('invoice', sale.pk, 'escpos')[0].endswith('.escpos'))
+
+            allocate_payment(self.customer, Decimal('10.00'), 'CASH')
+            self.assertNotEqual(documents.render('receipt', sale.pk)[0], path)
+            self.assertEqual(documents.render_statements(workers=1), (1, 1))
+
+
+class PeriodCloseTests(PosTestCase):
+    """Closing months and archiving their settled rows."""
+
+    def test_closed_period_is_archived(self):
+        seeding.seed(products=5, customers=3, sales=300, days=90, seed=2)
+        sales = Sale.objects.count()
+        total = DailyTotalSummary.objects.aggregate(total=Sum('total_sales'))['total']
+        last_month = timezone.localdate().replace(day=1) - timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            closes = periods.close(last_month)
+        closed = periods.boundary_start()
+
+        moved = archive.archive(chunk_size=40)
+        self.assertGreater(moved['sales'], 40)
+        self.assertFalse(Sale.objects.filter(status='COMPLETED', date__lt=closed).exists())
+        self.assertEqual(Sale.objects.count() + ArchivedSale.objects.count(), sales)
+        # Closed months keep their rollups through a rebuild and match their close totals.
+        rollup.rebuild()
+        summaries = DailyTotalSummary.objects.aggregate(total=Sum('total_sales'))['total']
+        self.assertAlmostEqual(summaries, total, places=2)
+        self.assertAlmostEqual(sum(close.total_sales for close in closes), DailyTotalSummary.objects.filter(
+            day__lt=periods.boundary()).aggregate(total=Sum('total_sales'))['total'], places=2)
+
+        rows = list(export_rows({}))
+        self.assertEqual(len(rows), sales)
+        self.assertEqual(rows, sorted(rows, key=lambda row: (row[1], row[0]), reverse=True))
+        response = self.client.get(reverse('sales_list'), {'end': last_month.isoformat()})
+        archived = [row[0] for row in rows if row[1] < closed]
+        self.assertEqual([sale.pk for sale in response.context['sales']], archived[:50])
+
+    def test_boundary_follows_closes_made_elsewhere(self):
+        self.assertIsNone(periods.boundary())
+        # close_period writes only the database; nothing has to reach this process's cache.
+        PeriodClose.objects.create(month=date(2020, 1, 1))
+        self.assertEqual(periods.boundary(), date(2020, 2, 1))
+        [result], _ = sync_sales([{
+            'key': 'late', 'product': self.products[0].pk, 'quantity': 1, 'paid_amount': '15.00',
+            'recorded_at': '2020-01-15T10:00:00+00:00',
+        }], '')
+        self.assertEqual(result['error'], 'recorded_at is in a closed period')
+        with self.assertRaises(CommandError):
+            call_command('close_period', month='2020-02')
+
+
+class ChangeFeedTests(PosTestCase):
+    """The change feed and its consumers."""
+
+    @override_settings(POS_FEED_KEY='feed-key')
+    def test_change_feed_offsets(self):
+        events.register('ledger')
+        sale = record_sale(self.products[0], self.customer, 2, Decimal('15.00'), 'CREDIT', Decimal('10.00'))
+        allocate_payment(self.customer, Decimal('20.00'), 'CASH')
+
+        # A consumer is a program: no session or CSRF token, just the feed key.
+        consumer = Client(enforce_csrf_checks=True, HTTP_AUTHORIZATION='Bearer feed-key')
+        url = reverse('event_feed', args=['ledger'])
+        self.assertEqual(self.client.get(url).status_code, 401)
+        feed = consumer.get(url, {'limit': 2}).json()
+        self.assertEqual([(e['kind'], e['object_id']) for e in feed['events']], [('SALE', sale.pk), ('PAYMENT', 1)])
+        # Nothing moves until the consumer acknowledges.
+        self.assertEqual(consumer.get(url, {'limit': 2}).json()['events'], feed['events'])
+        ack = reverse('event_ack', args=['ledger'])
+        body = {'position': feed['next'], 'expected': feed['position']}
+        self.assertEqual(self.client.post(ack, body, content_type='application/json').status_code, 401)
+        self.assertEqual(consumer.post(ack, body, content_type='application/json').status_code, 200)
+        self.assertEqual(consumer.post(ack, body, content_type='application/json').status_code, 409)
+        self.assertEqual([e['payload']['amount'] for e in consumer.get(url).json()['events']], ['20.00'])
+
+        seen = []
+        self.assertEqual(events.consume('ledger', seen.extend), 1)
+        self.assertEqual(events.consume('ledger', seen.extend), 0)
+        # A consumer from the start also sees the five fixture products; it holds compaction back.
+        events.register('late', from_start=True)
+        self.assertEqual(events.compact(), 0)
+        self.assertEqual(events.consume('late', lambda batch: None, batch_size=3), 8)
+        self.assertEqual(events.compact(chunk_size=2), 8)
+        self.assertFalse(ChangeEvent.objects.exists())
+
+
+class StockLedgerTests(PosTestCase):
+    """The stock movement ledger, its snapshots and reconciliation."""
+
+    def test_stock_snapshots_and_reconcile(self):
+        moving, idle = self.products[:2]
+        now = timezone.now()
+        days = [now - timedelta(days=n) for n in (4, 3, 2, 1)]
+        # Each fixture product opened its ledger with its 100 units.
+        StockMovement.objects.filter(kind='OPENING').update(date=days[0])
+        movements.record([StockMovement(product=moving, kind='SALE', quantity=-10, date=days[1])])
+        self.assertEqual(movements.take_snapshots(days[1] - timedelta(hours=1)), len(self.products))
+        # Only the product that moved since its snapshot gets a new one; a rerun writes nothing.
+        self.assertEqual(movements.take_snapshots(days[2]), 1)
+        self.assertEqual(movements.take_snapshots(days[2]), 0)
+        self.assertEqual(StockSnapshot.objects.filter(product=idle).count(), 1)
+        movements.record([StockMovement(product=moving, kind='STOCK_IN', quantity=5, date=days[3])])
+
+        pair = Product.objects.filter(pk__in=[moving.pk, idle.pk])
+        for when in [days[0], days[1], days[2] - timedelta(hours=1), days[2], days[3], now]:
+            ledger = dict(
+                StockMovement.objects.filter(product__in=pair, date__lte=when).values('product')
+                .annotate(total=Sum('quantity')).values_list('product', 'total')
+            )
+            as_of = dict(movements.stock_as_of(when, pair).values_list('pk', 'as_of_stock'))
+            self.assertEqual(as_of, {moving.pk: ledger.get(moving.pk, 0), idle.pk: ledger.get(idle.pk, 0)}, when)
+
+        # The movements above never touched BranchStock, and the product
+        # total drifts further; a recount at a second branch disagrees too.
+        Product.objects.filter(pk=moving.pk).update(stock_quantity=120)
+        with self.captureOnCommitCallbacks(execute=True):
+            town = branches.create('Town', 'TWN').pk
+        BranchStock.objects.create(branch_id=town, product=idle, quantity=4)
+        Product.objects.filter(pk=idle.pk).update(stock_quantity=104)
+        with self.assertRaises(CommandError):
+            call_command('reconcile_stock', stdout=StringIO())
+        call_command('reconcile_stock', fix=True, stdout=StringIO())
+        adjustments = StockMovement.objects.filter(note='Reconciliation with stock_quantity').order_by('pk')
+        self.assertEqual(
+            list(adjustments.values_list('product', 'branch', 'kind', 'quantity')),
+            [(moving.pk, MAIN_BRANCH, 'ADJUSTMENT', 5), (idle.pk, town, 'ADJUSTMENT', 4),
+             (moving.pk, MAIN_BRANCH, 'ADJUSTMENT', 20)]
+        )
+        self.assertEqual(BranchStock.objects.get(branch_id=MAIN_BRANCH, product=moving).quantity, 120)
+        self.assertEqual(movements.reconcile(), [])
+        self.assertEqual(movements.reconcile_branch(MAIN_BRANCH), [])
+        self.assertEqual(movements.reconcile_branch(town), [])
+        call_command('reconcile_stock', stdout=StringIO())
+
+
+class BranchTests(PosTestCase):
+    """Stock held per branch and the per-branch dashboard."""
+
+    def test_branch_stock_and_dashboard(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            town = branches.create('Town', 'TWN').pk
+        product = self.products[0]
+        transfer_stock(product.pk, MAIN_BRANCH, town, 30)
+        with self.assertRaises(InsufficientStock):
+            transfer_stock(product.pk, town, MAIN_BRANCH, 31)
+
+        self.client.post(reverse('sale_create'), {
+            'product': product.pk, 'quantity': 5, 'selling_price': '15.00',
+            'payment_mode': 'CASH', 'paid_amount': '75.00', 'branch': town,
+        })
+        self.add_sales(1)
+        stock = dict(BranchStock.objects.filter(product=product).values_list('branch_id', 'quantity'))
+        self.assertEqual(stock, {MAIN_BRANCH: 69, town: 25})
+        product.refresh_from_db()
+        self.assertEqual(product.stock_quantity, 94)
+        self.assertEqual(movements.reconcile_branch(town), [])
+        self.assertEqual(Sale.objects.get(branch_id=town).quantity, 5)
+
+        response = self.client.get(reverse('analytics'))
+        self.assertEqual(response.context['daily']['total_sales'], Decimal('90'))
+        self.assertEqual(
+            [(row['name'], row['daily']['total_sales']) for row in response.context['branches']],
+            [('Main', Decimal('15')), ('Town', Decimal('75'))]
+        )
+        series = self.client.get(reverse('analytics_series'), {'branch': town}).json()
+        self.assertEqual(series['totals']['units'], 5)
+
+    def test_search_shows_the_branchs_stock(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            town = branches.create('Town', 'TWN').pk
+        product = self.products[0]
+        transfer_stock(product.pk, MAIN_BRANCH, town, 30)
+        self.client.cookies[BRANCH_COOKIE] = str(town)
+        for term in ('Product 0', 'Pr'):
+            results = self.client.get(reverse('product_search'), {'q': term}).json()['results']
+            stock = {row['id']: row['stock'] for row in results}
+            self.assertEqual(stock[product.pk], 30)
+            self.assertEqual(stock.get(self.products[1].pk, 0), 0)
+        self.client.cookies[BRANCH_COOKIE] = str(MAIN_BRANCH)
+        results = self.client.get(reverse('product_search'), {'q': 'Product 0'}).json()['results']
+        self.assertEqual(results[0]['stock'], 70)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AsyncViewTests(TestCase):
+    """The async read views must answer like their sync counterparts."""
+
+    def setUp(self):
+        clear_caches()
+        customer = Customer.objects.create(name='Async Customer')
+        product = Product.objects.create(
+            name='Async Product', buying_price=Decimal('10.00'),
+            selling_price=Decimal('15.00'), stock_quantity=3,
+        )
+        record_sale(product, customer, 2, Decimal('15.00'), 'CASH', Decimal('30.00'))
+
+    async def test_analytics_async(self):
+        response = await self.async_client.get(reverse('analytics_async'))
+        self.assertEqual(response.context['daily']['total_sales'], Decimal('30'))
+        self.assertEqual(response.context['low_stock'], 1)
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+    async def test_product_list_async(self):
+        response = await self.async_client.get(reverse('product_list_async'))
+        self.assertEqual([p.name for p in response.context['products']], ['Async Product'])
+
+    async def test_low_stock_feed_async(self):
+        sync = await self.async_client.get(reverse('low_stock_feed'))
+        response = await self.async_client.get(reverse('low_stock_feed_async'))
+        self.assertEqual(response.json(), sync.json())
+        self.assertEqual(response.json()['count'], 1)
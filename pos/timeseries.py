@@ -0,0 +1,278 @@
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from itertools import chain
+
+from django.db.models import DateField, DateTimeField, F, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from . import periods
+from .costing import CENT
+from .models import PAYMENT_CHOICES, ArchivedSale, DailySalesSummary, DailyTotalSummary, Product, Sale
+
+# Sales, profit and units over time. Each series is one grouped query: the
+# bucket is a Trunc* of the indexed day (or sale date) column, and the
+# current and previous periods are conditional sums over the same rows, so
+# the period-over-period change costs no second pass. Day, week and month
+# buckets read the daily rollups; hour buckets and the customer split need
+# the time or customer of each sale and read Sale itself (and ArchivedSale
+# for closed months), so keep those ranges short. With a branch every
+# query is narrowed by the indexes that lead on branch, so one shop's series
+# never reads another's rows.
+
+BUCKETS = {'hour': TruncHour, 'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+SPLITS = {'product': 'product_id', 'customer': 'customer_id', 'payment_mode': 'payment_mode'}
+MAX_BUCKETS = 1500
+TOP_PRODUCTS = 10
+MAX_TOP = 100
+
+SALE_MEASURES = {'sales': 'total_price', 'profit': 'profit', 'units': 'quantity'}
+SUMMARY_MEASURES = {'sales': 'total_sales', 'profit': 'total_profit', 'units': 'quantity'}
+MODE_LABELS = dict(PAYMENT_CHOICES)
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _bucket_starts(start, end, bucket):
+    """Every bucket from the one holding ``start`` to the one holding ``end``."""
+    if bucket == 'hour':
+        moment, stop = _day_start(start), _day_start(end + timedelta(days=1))
+        starts = []
+        while moment < stop and len(starts) <= MAX_BUCKETS:
+            starts.append(timezone.localtime(moment))
+            moment += timedelta(hours=1)
+        return starts
+
+    if bucket == 'week':
+        day, step = start - timedelta(days=start.weekday()), timedelta(weeks=1)
+    elif bucket == 'month':
+        day, step = start.replace(day=1), None
+    else:
+        day, step = start, timedelta(days=1)
+    starts = []
+    while day <= end and len(starts) <= MAX_BUCKETS:
+        starts.append(day)
+        day = day + step if step else (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return starts
+
+
+def _key(value):
+    if isinstance(value, datetime):
+        return timezone.localtime(value).isoformat()
+    return value.isoformat()
+
+
+def _sale_tables(start):
+    """``Sale``, and ``ArchivedSale`` too when ``start`` falls in a closed month."""
+    closed = periods.boundary()
+    return [Sale, ArchivedSale] if closed and start < closed else [Sale]
+
+
+def _rows(model, branch):
+    """``model``'s rows, only ``branch``'s when given."""
+    return model.objects.filter(branch_id=branch) if branch else model.objects.all()
+
+
+def _source(bucket, split, start, branch=None):
+    """``(querysets, date column, measure columns)`` for the cheapest tables that can answer from ``start``."""
+    if bucket == 'hour' or split == 'customer':
+        return [_rows(model, branch) for model in _sale_tables(start)], 'date', SALE_MEASURES
+    model = DailySalesSummary if split == 'product' else DailyTotalSummary
+    return [_rows(model, branch)], 'day', SUMMARY_MEASURES
+
+
+def _window(rows, column, start, end):
+    """``rows`` on ``start``..``end`` (inclusive days) of ``column``."""
+    if column == 'day':
+        return rows.filter(day__gte=start, day__lte=end)
+    return rows.filter(date__gte=_day_start(start), date__lt=_day_start(end + timedelta(days=1)))
+
+
+def _sums(measures, current):
+    """Current and previous period sums of each measure, as conditional aggregates."""
+    aggregates = {}
+    for name, field in measures.items():
+        aggregates[f'current_{name}'] = Sum(field, filter=current, default=0)
+        aggregates[f'previous_{name}'] = Sum(field, filter=~current, default=0)
+    return aggregates
+
+
+def _zero():
+    return {'sales': Decimal('0.00'), 'profit': Decimal('0.00'), 'units': 0}
+
+
+def _rounded(values):
+    """``values`` with money to the cent; SQLite sums decimals as floats."""
+    return {
+        name: value.quantize(CENT) if isinstance(value, Decimal) else value
+        for name, value in values.items()
+    }
+
+
+def _change(current, previous):
+    change = {}
+    for name in current:
+        delta = current[name] - previous[name]
+        change[name] = {
+            'delta': delta,
+            'percent': round(float(delta) / float(previous[name]) * 100, 1) if previous[name] else None,
+        }
+    return change
+
+
+def top_products(start, end, limit=TOP_PRODUCTS, branch=None):
+    """The ``limit`` best-selling products on ``start``..``end`` by sales value, at ``branch`` if given."""
+    if not limit:
+        return []
+    # Grouped on the covering index alone; names are looked up for the winners only.
+    rows = list(
+        _rows(DailySalesSummary, branch).filter(day__gte=start, day__lte=end)
+        .values('product_id')
+        .annotate(**{f'current_{name}': Sum(field) for name, field in SUMMARY_MEASURES.items()})
+        .order_by('-current_sales', 'product_id')[:limit]
+    )
+    names = dict(Product.objects.filter(pk__in=[row['product_id'] for row in rows]).values_list('pk', 'name'))
+    return [
+        {'id': row['product_id'], 'name': names[row['product_id']],
+         **_rounded({name: row[f'current_{name}'] for name in SUMMARY_MEASURES})}
+        for row in rows
+    ]
+
+
+def _top_customers(start, end, limit, branch=None):
+    totals = defaultdict(Decimal)
+    for model in _sale_tables(start):
+        rows = (
+            _window(_rows(model, branch).filter(customer__isnull=False), 'date', start, end)
+            .values('customer_id')
+            .annotate(total=Sum('total_price'))
+            .order_by()
+        )
+        for row in rows:
+            totals[row['customer_id']] += row['total']
+    return sorted(totals, key=lambda pk: (-totals[pk], pk))[:limit]
+
+
+def _totals(start, previous_start, end, branch=None):
+    """Current and previous period totals from the per-day rollup, in one aggregate."""
+    sums = _rows(DailyTotalSummary, branch).filter(day__gte=previous_start, day__lte=end).aggregate(
+        **_sums(SUMMARY_MEASURES, Q(day__gte=start))
+    )
+    return (
+        {name: sums[f'current_{name}'] for name in SUMMARY_MEASURES},
+        {name: sums[f'previous_{name}'] for name in SUMMARY_MEASURES},
+    )
+
+
+def series(start, end, bucket='day', split=None, top=TOP_PRODUCTS, branch=None):
+    """Sales, profit and units per ``bucket`` on ``start``..``end`` (inclusive dates).
+
+    The previous period is the same number of days just before ``start``.
+    With ``split`` each product, customer or payment mode gets its own
+    series; products and customers are limited to the ``top`` best sellers.
+    With ``branch`` only that branch's sales count.
+    Raises ValueError for an unknown bucket or split, a reversed range or
+    more than MAX_BUCKETS buckets.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}.")
+    if split is not None and split not in SPLITS:
+        raise ValueError(f"split must be one of {', '.join(SPLITS)}.")
+    if end < start:
+        raise ValueError("end is before start.")
+    if not 0 <= top <= MAX_TOP:
+        raise ValueError(f"top must be between 0 and {MAX_TOP}.")
+    if split in ('product', 'customer') and not top:
+        raise ValueError(f"split={split} needs top of at least 1.")
+    starts = _bucket_starts(start, end, bucket)
+    if len(starts) > MAX_BUCKETS:
+        raise ValueError(f"At most {MAX_BUCKETS} {bucket} buckets per request.")
+
+    length = end - start + timedelta(days=1)
+    previous_start, previous_end = start - length, start - timedelta(days=1)
+    leaders = top_products(start, end, top, branch)
+
+    sources, column, measures = _source(bucket, split, previous_start, branch)
+    sources = [_window(rows, column, previous_start, end) for rows in sources]
+    if column == 'day' and bucket == 'day':
+        # The rollup is already one row per day; no truncation needed.
+        bucketed = F('day')
+    else:
+        output = DateTimeField() if bucket == 'hour' else DateField()
+        bucketed = BUCKETS[bucket](column, output_field=output)
+    current = Q(day__gte=start) if column == 'day' else Q(date__gte=_day_start(start))
+
+    group = ['bucket']
+    labels = {}
+    if split:
+        group.append(SPLITS[split])
+    if split == 'product':
+        order = [product['id'] for product in leaders]
+        labels = {product['id']: product['name'] for product in leaders}
+        sources = [rows.filter(product_id__in=order) for rows in sources]
+    elif split == 'customer':
+        order = _top_customers(start, end, top, branch)
+        sources = [rows.filter(customer_id__in=order) for rows in sources]
+        group.append('customer__name')
+    elif split == 'payment_mode':
+        order = [mode for mode, _ in PAYMENT_CHOICES]
+        labels = MODE_LABELS
+    else:
+        order = [None]
+    # Live and archived rows of a bucket add up in the loop below.
+    grouped = chain.from_iterable(
+        rows.annotate(bucket=bucketed).values(*group).annotate(**_sums(measures, current)).order_by()
+        for rows in sources
+    )
+
+    first = _key(starts[0])
+    points = {}
+    totals, previous = _zero(), _zero()
+    for row in grouped:
+        for name in measures:
+            totals[name] += row[f'current_{name}']
+            previous[name] += row[f'previous_{name}']
+        # Rows from the previous period only count towards its totals.
+        if _key(row['bucket']) >= first:
+            key = row[SPLITS[split]] if split else None
+            if split == 'customer':
+                labels[key] = row['customer__name']
+            point = points.setdefault((key, _key(row['bucket'])), _zero())
+            for name in measures:
+                point[name] += row[f'current_{name}']
+
+    if split in ('product', 'customer'):
+        # The split covers the leaders only; overall totals come from the rollup.
+        totals, previous = _totals(start, previous_start, end, branch)
+    totals, previous = _rounded(totals), _rounded(previous)
+    found = {key for key, _ in points}
+    lines = []
+    for key in order:
+        if split and key not in found:
+            continue
+        line = [{'bucket': _key(s), **_rounded(points.get((key, _key(s)), _zero()))} for s in starts]
+        lines.append({'key': key, 'label': labels[key], 'points': line} if split else line)
+
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'bucket': bucket,
+        'split': split,
+        'branch': branch,
+        'series': lines if split else lines[0],
+        'totals': totals,
+        'previous': {'start': previous_start.isoformat(), 'end': previous_end.isoformat(), **previous},
+        'change': _change(totals, previous),
+        'top_products': leaders,
+    }
+
+
+def parse_range(start, end, today=None):
+    """``(start, end)`` dates from ISO strings; the last 30 days by default. Raises ValueError."""
+    today = today or timezone.localdate()
+    end = date.fromisoformat(end) if end else today
+    start = date.fromisoformat(start) if start else end - timedelta(days=29)
+    return start, end
@@ -4,11 +4,45 @@ from . import views
 urlpatterns = [
     path('', views.product_list, name='product_list'),
     path('products/', views.product_list, name='product_list'),
+    path('async/products/', views.product_list_async, name='product_list_async'),
     path('stock-in/', views.stock_in, name='stock_in'),
+    path('stock-in/import/', views.stock_import, name='stock_import'),
+    path('stock-in/adjust/', views.stock_adjust, name='stock_adjust'),
+    path('stock-in/transfer/', views.stock_transfer, name='stock_transfer'),
+    path('branches/', views.branch_list, name='branch_list'),
+    path('branches/<int:pk>/use/', views.branch_use, name='branch_use'),
+    path('branches/<int:pk>/stock/', views.branch_stock, name='branch_stock'),
     path('sales/create/', views.sale_create, name='sale_create'),
     path('sales/', views.sales_list, name='sales_list'),
+    path('sales/export/', views.sales_export, name='sales_export'),
+    path('sales/export/job/', views.sales_export_job, name='sales_export_job'),
     path('sale/', views.sale_create, name='sale_create'),
+    path('sales/checkout/', views.checkout, name='checkout'),
+    path('customers/debtors/', views.debtors, name='debtors'),
+    path('customers/<int:pk>/pay/', views.customer_payment, name='customer_payment'),
+    path('customers/<int:pk>/statement/', views.document, {'kind': 'statement'}, name='customer_statement'),
+    path('customers/statements/', views.statements_job, name='statements_job'),
+    path('sales/<int:pk>/receipt/', views.document, {'kind': 'receipt'}, name='sale_receipt'),
+    path('sales/<int:pk>/invoice/', views.document, {'kind': 'invoice'}, name='sale_invoice'),
+    path('api/sync/sales/', views.sync_sales_api, name='sync_sales'),
+    path('api/events/<slug:consumer>/', views.event_feed, name='event_feed'),
+    path('api/events/<slug:consumer>/ack/', views.event_ack, name='event_ack'),
+    path('api/products/search/', views.product_search, name='product_search'),
+    path('api/customers/search/', views.customer_search, name='customer_search'),
+    path('api/products/low-stock/', views.low_stock_feed, name='low_stock_feed'),
+    path('async/api/products/low-stock/', views.low_stock_feed_async, name='low_stock_feed_async'),
+    path('reorder/', views.reorder_list, name='reorder_list'),
+    path('reorder/refresh/', views.reorder_refresh, name='reorder_refresh'),
     path('analytics/', views.analytics, name='analytics'),
+    path('async/analytics/', views.analytics_async, name='analytics_async'),
+    path('analytics/cache-stats/', views.analytics_cache_stats, name='analytics_cache_stats'),
+    path('api/analytics/series/', views.analytics_series, name='analytics_series'),
+    path('analytics/rebuild/', views.analytics_rebuild, name='analytics_rebuild'),
+    path('jobs/<int:pk>/', views.job_detail, name='job_detail'),
+    path('jobs/<int:pk>/download/', views.job_download, name='job_download'),
+    path('api/jobs/<int:pk>/', views.job_status, name='job_status'),
+    path('metrics/', views.metrics_dashboard, name='metrics_dashboard'),
+    path('metrics/prometheus/', views.metrics_prometheus, name='metrics_prometheus'),
     path('products/add/', views.product_create, name='product_create'),
     path('products/create/', views.product_create, name='product_create'),
     path('products/<int:pk>/edit/', views.product_edit, name='product_edit'),  # <- make sure this exists
@@ -1,19 +1,115 @@
+import asyncio
+import hmac
+import json
+from functools import wraps
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
+from django.conf import settings
 from django.contrib import messages
-from .models import Product, StockIn, Sale, Customer, Payment
-from django.db.models import Sum, F
+from django.contrib.admin.views.decorators import staff_member_required
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from .models import (
+    Product, Sale, ArchivedSale, Branch, BranchStock, Customer, Payment, Job, MAIN_BRANCH, PAYMENT_CHOICES,
+    STATUS_CHOICES
+)
+from . import branches, caching, catalog, documents, events, fragments, jobs, metrics, periods, reorder, timeseries
+from .forms import ProductForm
+from .exports import FILTER_KEYS, csv_lines, export_rows, filter_sales, ndjson_lines
+from .search import search_customers, search_products
+from .ledger import aged_debtors
+from .movements import start_of_day, stock_as_of
+from .services import (
+    record_sale, receive_stock, adjust_stock, checkout as checkout_receipt, allocate_payment, sync_sales,
+    transfer_stock, InsufficientStock, ProductNotFound, StaleStock
+)
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, datetime, timedelta
 from decimal import Decimal
+from urllib.parse import urlencode
+import os
+import uuid
 
 # Create your views here.
 
 ADMIN_PIN = "1234"
+SYNC_BATCH_LIMIT = 1000
+# Set on a till by "Use this branch"; the till's writes then go to that branch.
+BRANCH_COOKIE = 'pos_branch'
+BRANCH_COOKIE_AGE = 365 * 24 * 60 * 60
+
+
+def _as_branch(value):
+    """``value`` as the id of an existing branch; Http404 otherwise."""
+    try:
+        pk = int(value)
+    except (TypeError, ValueError):
+        pk = None
+    if pk not in branches.names():
+        raise Http404("No Branch matches the given query.")
+    return pk
+
+
+def _branch_id(request):
+    """The branch a write belongs to: the form's, else the till's, else the main branch."""
+    value = request.POST.get('branch') or request.COOKIES.get(BRANCH_COOKIE)
+    return _as_branch(value) if value else MAIN_BRANCH
+
+
+def _bearer_matches(request, expected):
+    """Whether the request sends ``Authorization: Bearer <expected>``; never true for an empty ``expected``."""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return bool(expected) and scheme.lower() == 'bearer' and hmac.compare_digest(
+        token.strip().encode(), expected.encode()
+    )
+
+
+def api_key_required(setting):
+    """For endpoints called by programs, not browsers: no CSRF check, a bearer key instead.
+
+    The key is ``settings.<setting>``; while it is empty the endpoint turns
+    every request away.
+    """
+    def decorate(view):
+        @csrf_exempt
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if not _bearer_matches(request, getattr(settings, setting)):
+                response = JsonResponse({'error': 'A valid API key is required.'}, status=401)
+                response['WWW-Authenticate'] = 'Bearer'
+                return response
+            return view(request, *args, **kwargs)
+        return wrapped
+    return decorate
 
 # ---------- Product List ----------
-def product_list(request):
+def _product_list_query(request):
     products = Product.objects.all()
-    return render(request, 'pos/product_list.html', {'products': products})
+    # ?as_of=YYYY-MM-DD adds the stock on hand at the end of that day.
+    as_of = None
+    try:
+        as_of = date.fromisoformat(request.GET.get('as_of', ''))
+    except ValueError:
+        pass
+    if as_of:
+        products = stock_as_of(start_of_day(as_of + timedelta(days=1)), products)
+    return products, as_of
+
+
+def _product_list_context(products, as_of):
+    return {
+        'products': products,
+        'as_of': as_of,
+        'rows': fragments.render_rows('product', 'pos/rows/product_row.html', products, 'product', as_of=as_of),
+    }
+
+
+def product_list(request):
+    products, as_of = _product_list_query(request)
+    return render(request, 'pos/product_list.html', _product_list_context(list(products), as_of))
 
 # ---------- Add Product ----------
 def product_create(request):
@@ -23,13 +119,16 @@ def product_create(request):
         selling_price = float(request.POST.get('selling_price'))
         reorder_level = int(request.POST.get('reorder_level', 5))
 
-        Product.objects.create(
-            name=name,
-            buying_price=buying_price,
-            selling_price=selling_price,
-            stock_quantity=0,
-            reorder_level=reorder_level
-        )
+        # Atomic so the product and its change event commit together.
+        with transaction.atomic():
+            product = Product.objects.create(
+                name=name,
+                buying_price=buying_price,
+                selling_price=selling_price,
+                stock_quantity=0,
+                reorder_level=reorder_level
+            )
+        caching.invalidate_stock([product.pk])
 
         messages.success(request, "Product added successfully")
         return redirect('product_list')
@@ -39,22 +138,14 @@ def product_create(request):
 # ---------- Stock In ----------
 def stock_in(request):
     if request.method == 'POST':
-        product = get_object_or_404(Product, id=request.POST.get('product'))
         quantity = int(request.POST.get('quantity'))
-        buying_price = float(request.POST.get('buying_price'))
-        selling_price = float(request.POST.get('selling_price'))
-
-        StockIn.objects.create(
-            product=product,
-            quantity=quantity,
-            buying_price=buying_price,
-            selling_price=selling_price
-        )
+        buying_price = Decimal(request.POST.get('buying_price'))
+        selling_price = Decimal(request.POST.get('selling_price'))
 
-        product.stock_quantity += quantity
-        product.buying_price = buying_price
-        product.selling_price = selling_price
-        product.save()
+        try:
+            receive_stock(request.POST.get('product'), quantity, buying_price, selling_price, _branch_id(request))
+        except ProductNotFound:
+            raise Http404("No Product matches the given query.")
 
         messages.success(request, "Stock added successfully")
         return redirect('stock_in')
@@ -62,14 +153,71 @@ def stock_in(request):
     products = Product.objects.all()
     return render(request, 'pos/stock_in.html', {'products': products})
 
-# ---------- Create Sale ----------
+# ---------- Stock Adjustment ----------
+def stock_adjust(request):
+    if request.method == 'POST':
+        try:
+            quantity = int(request.POST.get('quantity'))
+        except (TypeError, ValueError):
+            quantity = 0
+        note = request.POST.get('note', '').strip()
+        if not quantity or not note:
+            messages.error(request, "Enter a non-zero quantity and a reason.")
+            return redirect('stock_adjust')
+
+        try:
+            product = adjust_stock(request.POST.get('product'), quantity, note, _branch_id(request))
+        except ProductNotFound:
+            raise Http404("No Product matches the given query.")
+        except InsufficientStock:
+            messages.error(request, "Cannot remove more than is in stock.")
+            return redirect('stock_adjust')
+
+        messages.success(request, f"Adjusted {product.name} by {quantity:+d}.")
+        return redirect('stock_adjust')
 
-def sale_create(request):
     products = Product.objects.all()
-    customers = Customer.objects.all()
+    return render(request, 'pos/stock_adjust.html', {'products': products})
 
+# ---------- Stock Import ----------
+def stock_import(request):
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        if not upload:
+            messages.error(request, "Choose a CSV or XLSX file to import.")
+            return redirect('stock_import')
+
+        # Keep the upload for the worker; the request returns straight away.
+        saved = os.path.join('uploads', f"{uuid.uuid4().hex}{os.path.splitext(upload.name)[1].lower()}")
+        path = os.path.join(settings.POS_JOB_DIR, saved)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as out:
+            for chunk in upload.chunks():
+                out.write(chunk)
+
+        job = jobs.enqueue(
+            'import_stock', upload=saved, filename=upload.name,
+            create_missing=bool(request.POST.get('create_missing')), branch_id=_branch_id(request)
+        )
+        messages.success(request, f"Import of {upload.name} queued.")
+        return redirect('job_detail', pk=job.pk)
+
+    return render(request, 'pos/stock_import.html')
+
+# ---------- Create Sale ----------
+
+def sale_create(request):
     if request.method == "POST":
-        product = get_object_or_404(Product, id=request.POST['product'])
+        if not request.POST.get('product'):
+            messages.error(request, "Pick a product from the search results.")
+            return redirect('sale_create')
+        # Name and prices from the in-process catalog; stock is checked by the write.
+        try:
+            product = catalog.get(request.POST['product'])
+        except ValueError:
+            product = None
+        if product is None:
+            raise Http404("No Product matches the given query.")
         customer_id = request.POST.get('customer')
         customer = get_object_or_404(Customer, id=customer_id) if customer_id else None
 
@@ -79,100 +227,532 @@ def sale_create(request):
         paid = Decimal(request.POST.get('paid_amount', 0))
         pin = request.POST.get('pin')
 
-        # ---------- Stock Check ----------
-        if qty > product.stock_quantity and pin != ADMIN_PIN:
-            messages.error(request, "Insufficient stock. Admin PIN required to proceed.")
-            return redirect('sale_create')
-
         # ---------- Selling Below Buying Price Check ----------
         if sp < product.buying_price and pin != ADMIN_PIN:
             messages.error(request, "Selling below buying price requires Admin PIN.")
             return redirect('sale_create')
 
-        # ---------- Calculate Totals ----------
-        total_price = sp * qty
-        remaining = max(total_price - paid, Decimal('0.00'))
-        profit = (sp - product.buying_price) * qty
-
-        # ---------- Determine Status ----------
-        status = 'COMPLETED' if remaining == 0 else 'PENDING_PAYMENT'
-
-        # ---------- Record Sale ----------
-        sale = Sale.objects.create(
-            product=product,
-            customer=customer,
-            quantity=qty,
-            selling_price=sp,
-            total_price=total_price,
-            paid_amount=paid,
-            remaining_amount=remaining,
-            profit=profit,
-            payment_mode=payment_mode,
-            status=status,
-            approved_by_pin=True if pin == ADMIN_PIN else False
-        )
+        # ---------- Record Sale, Deduct Stock, Record Payment ----------
+        try:
+            sale = record_sale(
+                product, customer, qty, sp, payment_mode, paid,
+                approved=pin == ADMIN_PIN, branch_id=_branch_id(request)
+            )
+        except InsufficientStock:
+            messages.error(request, "Insufficient stock. Admin PIN required to proceed.")
+            return redirect('sale_create')
+
+        messages.success(request, f"Sale recorded! Status: {sale.status}. Remaining: {sale.remaining_amount}")
+        return redirect('sales_list')
+
+    # Products and customers are looked up through the typeahead endpoints.
+    return render(request, 'pos/sale_form.html')
+
+# ---------- Basket Checkout ----------
+def checkout(request):
+    if request.method == "POST":
+        product_ids = request.POST.getlist('product')
+        quantities = request.POST.getlist('quantity')
+        prices = request.POST.getlist('selling_price')
+        customer_id = request.POST.get('customer')
+        payment_mode = request.POST['payment_mode']
+        paid = Decimal(request.POST.get('paid_amount') or 0)
+        pin = request.POST.get('pin')
+
+        # Every product in the basket from the catalog; a query only for misses.
+        products = catalog.get_many([pid for pid in product_ids if pid])
+        customer = get_object_or_404(Customer, id=customer_id) if customer_id else None
+
+        lines = []
+        for pid, qty, sp in zip(product_ids, quantities, prices):
+            if not pid or not qty:
+                continue
+            product = products.get(int(pid))
+            if product is None:
+                raise Http404("No Product matches the given query.")
+            sp = Decimal(sp) if sp else product.selling_price
+            if sp < product.buying_price and pin != ADMIN_PIN:
+                messages.error(request, f"Selling {product.name} below buying price requires Admin PIN.")
+                return redirect('checkout')
+            lines.append((product, int(qty), sp))
 
-        # ---------- Deduct Stock ----------
-        product.stock_quantity -= qty
-        product.save()
+        if not lines:
+            messages.error(request, "The basket is empty.")
+            return redirect('checkout')
 
-        # ---------- Record Payment ----------
-        if paid > 0:
-            Payment.objects.create(
-                sale=sale,
-                amount_paid=paid,
-                payment_mode=payment_mode
+        try:
+            receipt = checkout_receipt(
+                customer, lines, payment_mode, paid,
+                approved=pin == ADMIN_PIN, branch_id=_branch_id(request)
             )
+        except InsufficientStock:
+            messages.error(request, "Insufficient stock for one or more items. Admin PIN required to proceed.")
+            return redirect('checkout')
 
-        messages.success(request, f"Sale recorded! Status: {status}. Remaining: {remaining}")
+        messages.success(
+            request,
+            f"Receipt #{receipt.pk} recorded ({len(lines)} items)! "
+            f"Status: {receipt.status}. Remaining: {receipt.remaining_amount}"
+        )
         return redirect('sales_list')
 
-    return render(request, 'pos/sale_form.html', {
-        'products': products,
-        'customers': customers
+    return render(request, 'pos/checkout.html', {'rows': range(10)})
+
+# ---------- Typeahead ----------
+def product_search(request):
+    return JsonResponse({'results': search_products(request.GET.get('q', ''), _branch_id(request))})
+
+
+def customer_search(request):
+    return JsonResponse({'results': search_customers(request.GET.get('q', ''))})
+
+# ---------- Offline Sync ----------
+@api_key_required('POS_SYNC_KEY')
+@require_POST
+def sync_sales_api(request):
+    try:
+        body = json.loads(request.body)
+        entries = body['sales']
+        if not isinstance(entries, list) or not all(isinstance(e, dict) for e in entries):
+            raise ValueError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected {"sales": [...]} JSON.'}, status=400)
+    if len(entries) > SYNC_BATCH_LIMIT:
+        return JsonResponse({'error': f'At most {SYNC_BATCH_LIMIT} sales per batch.'}, status=400)
+    # A till sends its branch with the batch; batches from older tills go to the main branch.
+    try:
+        branch_id = _as_branch(body['branch']) if body.get('branch') else MAIN_BRANCH
+    except Http404:
+        return JsonResponse({'error': 'Unknown branch.'}, status=400)
+
+    try:
+        results, stock = sync_sales(entries, ADMIN_PIN, branch_id)
+    except StaleStock:
+        return JsonResponse({'error': 'Stock kept changing; resend the batch.'}, status=409)
+    return JsonResponse({'results': results, 'stock': stock})
+
+# ---------- Change Feed ----------
+# A consumer reads the events after its stored position, applies them,
+# then acknowledges the last id it applied. Until then the same batch is
+# served again, so a consumer that crashes mid-batch loses nothing.
+# Consumers are programs: they authenticate with POS_FEED_KEY, not CSRF.
+
+@api_key_required('POS_FEED_KEY')
+def event_feed(request, consumer):
+    try:
+        limit = min(int(request.GET.get('limit', events.BATCH_SIZE)), events.BATCH_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a number.'}, status=400)
+    position = events.register(consumer, from_start=request.GET.get('from') == 'start').position
+    batch = events.read(position, max(limit, 1))
+    return JsonResponse({
+        'consumer': consumer,
+        'position': position,
+        'next': batch[-1].pk if batch else position,
+        'events': [
+            {'id': e.pk, 'kind': e.kind, 'object_id': e.object_id, 'payload': e.payload, 'created_at': e.created_at}
+            for e in batch
+        ],
     })
+
+
+@api_key_required('POS_FEED_KEY')
+@require_POST
+def event_ack(request, consumer):
+    try:
+        body = json.loads(request.body)
+        position = int(body['position'])
+        expected = body.get('expected')
+        expected = None if expected is None else int(expected)
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected {"position": <event id>} JSON.'}, status=400)
+    if position > events.head():
+        return JsonResponse({'error': 'position is past the newest event.'}, status=400)
+    current = events.register(consumer).position
+    try:
+        events.ack(consumer, position, expected)
+    except events.ConsumerConflict:
+        return JsonResponse({'error': 'The consumer moved on; read the feed again.'}, status=409)
+    # Positions never move backwards; acknowledging an older id is a no-op.
+    return JsonResponse({'consumer': consumer, 'position': max(position, current)})
+
 # ---------- Sales List ----------
+SALES_PAGE_SIZE = 50
+
+
+def _filter_sales(request):
+    filters = {key: request.GET.get(key, '') for key in FILTER_KEYS}
+    try:
+        return filter_sales(filters), filters
+    except ValueError:
+        raise Http404("Invalid date filter.")
+
+
 def sales_list(request):
-    sales = Sale.objects.select_related('product', 'customer').order_by('-date')
-    return render(request, 'pos/sales_list.html', {'sales': sales})
+    sales, filters = _filter_sales(request)
+    sales = sales.select_related('product', 'customer').order_by('-date', '-id')
 
-# ---------- Analytics ----------
-def analytics(request):
-    today = timezone.now().date()
+    # Keyset pagination: continue strictly after the (date, id) of the last
+    # row shown, so every page costs the same however deep it is.
+    cursor = request.GET.get('after')
+    after = Q()
+    if cursor:
+        try:
+            after_date, after_id = cursor.rsplit('_', 1)
+            after_date = datetime.fromisoformat(after_date)
+            after_id = int(after_id)
+        except ValueError:
+            raise Http404("Invalid page cursor.")
+        after = Q(date__lt=after_date) | Q(date=after_date, id__lt=after_id)
 
-    # Sales & profits
-    daily = Sale.objects.filter(date__date=today).aggregate(
-        total_sales=Sum('total_price'), total_profit=Sum('profit')
-    )
-    weekly = Sale.objects.filter(date__gte=today - timedelta(days=7)).aggregate(
-        total_sales=Sum('total_price'), total_profit=Sum('profit')
-    )
-    monthly = Sale.objects.filter(date__month=today.month, date__year=today.year).aggregate(
-        total_sales=Sum('total_price'), total_profit=Sum('profit')
+    page = list(sales.filter(after)[:SALES_PAGE_SIZE + 1])
+    # Archived sales all predate this month, so a full page of this month's
+    # sales never needs the archive. Otherwise its rows may belong on the page.
+    month_start = start_of_day(timezone.localdate().replace(day=1))
+    if len(page) <= SALES_PAGE_SIZE or page[-1].date < month_start:
+        closed = periods.boundary_start()
+        if closed and (len(page) <= SALES_PAGE_SIZE or page[-1].date < closed):
+            archived = filter_sales(filters, ArchivedSale).select_related('product', 'customer')
+            page += archived.filter(after).order_by('-date', '-id')[:SALES_PAGE_SIZE + 1]
+            page = sorted(page, key=lambda sale: (sale.date, sale.id), reverse=True)[:SALES_PAGE_SIZE + 1]
+    next_cursor = None
+    if len(page) > SALES_PAGE_SIZE:
+        page = page[:SALES_PAGE_SIZE]
+        last = page[-1]
+        next_cursor = f"{last.date.isoformat()}_{last.id}"
+
+    # The customer filter is a typeahead like the sale form's; only the chosen customer is read.
+    customer_name = ''
+    if filters['customer']:
+        customer_name = Customer.objects.filter(pk=filters['customer']).values_list('name', flat=True).first() or ''
+
+    query = {key: value for key, value in filters.items() if value}
+    return render(request, 'pos/sales_list.html', {
+        'sales': page,
+        'rows': fragments.render_rows('sale', 'pos/rows/sale_row.html', page, 'sale'),
+        'filters': filters,
+        'filter_query': urlencode(query),
+        'next_query': urlencode({**query, 'after': next_cursor}) if next_cursor else '',
+        'customer_name': customer_name,
+        'branches': branches.names(),
+        'payment_choices': PAYMENT_CHOICES,
+        'status_choices': STATUS_CHOICES,
+    })
+
+
+def sales_export(request):
+    _, filters = _filter_sales(request)
+    rows = export_rows(filters)
+
+    if request.GET.get('format') == 'ndjson':
+        response = StreamingHttpResponse(ndjson_lines(rows), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="sales.ndjson"'
+        return response
+
+    response = StreamingHttpResponse(csv_lines(rows), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="sales.csv"'
+    return response
+
+
+@require_POST
+def sales_export_job(request):
+    filters = {key: request.POST.get(key, '') for key in FILTER_KEYS}
+    try:
+        filter_sales(filters)
+    except ValueError:
+        raise Http404("Invalid date filter.")
+    file_format = 'ndjson' if request.POST.get('format') == 'ndjson' else 'csv'
+    job = jobs.enqueue('export_sales', filters=filters, file_format=file_format)
+    messages.success(request, "Sales export queued.")
+    return redirect('job_detail', pk=job.pk)
+
+# ---------- Branches ----------
+def branch_list(request):
+    if request.method == 'POST':
+        name = request.POST.get('name', '').strip()
+        code = request.POST.get('code', '').strip().upper()
+        if not name or not code:
+            messages.error(request, "Enter a name and a short code.")
+        elif Branch.objects.filter(Q(name=name) | Q(code=code)).exists():
+            messages.error(request, "A branch with that name or code already exists.")
+        else:
+            branches.create(name, code)
+            messages.success(request, f"Branch {name} added.")
+        return redirect('branch_list')
+
+    current = request.COOKIES.get(BRANCH_COOKIE) or str(MAIN_BRANCH)
+    return render(request, 'pos/branch_list.html', {
+        'branches': Branch.objects.order_by('name'),
+        'current': current,
+    })
+
+
+@require_POST
+def branch_use(request, pk):
+    pk = _as_branch(pk)
+    response = redirect('branch_list')
+    response.set_cookie(BRANCH_COOKIE, str(pk), max_age=BRANCH_COOKIE_AGE, samesite='Lax')
+    messages.success(request, f"This till now records to {branches.names()[pk]}.")
+    return response
+
+
+def branch_stock(request, pk):
+    # Served by the (branch, product) unique index; other branches' rows are never read.
+    branch = get_object_or_404(Branch, pk=pk)
+    stock = BranchStock.objects.filter(branch=branch, quantity__gt=0).select_related('product').order_by(
+        'product__name'
     )
-    yearly = Sale.objects.filter(date__year=today.year).aggregate(
-        total_sales=Sum('total_price'), total_profit=Sum('profit')
+    return render(request, 'pos/branch_stock.html', {'branch': branch, 'stock': stock})
+
+
+def stock_transfer(request):
+    if request.method == 'POST':
+        try:
+            quantity = int(request.POST.get('quantity'))
+        except (TypeError, ValueError):
+            quantity = 0
+        if quantity <= 0:
+            messages.error(request, "Enter a positive quantity.")
+            return redirect('stock_transfer')
+        from_branch = _as_branch(request.POST.get('from_branch'))
+        to_branch = _as_branch(request.POST.get('to_branch'))
+        product = get_object_or_404(Product, pk=request.POST.get('product'))
+        try:
+            transfer_stock(product.pk, from_branch, to_branch, quantity, request.POST.get('note', '').strip())
+        except ValueError as exc:
+            messages.error(request, str(exc))
+            return redirect('stock_transfer')
+        except InsufficientStock:
+            messages.error(request, f"{branches.names()[from_branch]} has fewer than {quantity} {product.name}.")
+            return redirect('stock_transfer')
+        messages.success(request, f"Moved {quantity} {product.name} to {branches.names()[to_branch]}.")
+        return redirect('stock_transfer')
+
+    return render(request, 'pos/stock_transfer.html', {
+        'products': Product.objects.only('id', 'name'),
+        'branches': branches.names(),
+    })
+
+# ---------- Receivables ----------
+def debtors(request):
+    return render(request, 'pos/debtors.html', {'debtors': aged_debtors()})
+
+
+def customer_payment(request, pk):
+    customer = get_object_or_404(Customer, pk=pk)
+    if request.method == 'POST':
+        amount = Decimal(request.POST.get('amount') or 0)
+        payment_mode = request.POST.get('payment_mode', 'CASH')
+        if amount <= 0:
+            messages.error(request, "Enter an amount to pay.")
+            return redirect('customer_payment', pk=pk)
+
+        applied, unapplied = allocate_payment(customer, amount, payment_mode)
+        messages.success(request, f"Applied {applied} to {customer.name}'s open sales.")
+        if unapplied:
+            messages.warning(request, f"{unapplied} was more than the outstanding balance and was not applied.")
+        return redirect('debtors')
+
+    open_sales = Sale.objects.filter(
+        customer=customer, status='PENDING_PAYMENT'
+    ).select_related('product').order_by('date', 'id')[:50]
+    return render(request, 'pos/customer_payment.html', {
+        'customer': customer,
+        'open_sales': open_sales,
+        'payment_choices': PAYMENT_CHOICES,
+    })
+
+# ---------- Reorder ----------
+REORDER_PAGE_SIZE = 50
+
+
+def reorder_list(request):
+    suggestions = reorder.needed().select_related('product')
+
+    # Keyset pagination on (days_of_cover, product_id), like the sales list.
+    cursor = request.GET.get('after')
+    if cursor:
+        try:
+            after_cover, after_id = cursor.rsplit('_', 1)
+            after_cover = float(after_cover)
+            after_id = int(after_id)
+        except ValueError:
+            raise Http404("Invalid page cursor.")
+        suggestions = suggestions.filter(
+            Q(days_of_cover__gt=after_cover) | Q(days_of_cover=after_cover, product_id__gt=after_id)
+        )
+
+    page = list(suggestions[:REORDER_PAGE_SIZE + 1])
+    next_cursor = None
+    if len(page) > REORDER_PAGE_SIZE:
+        page = page[:REORDER_PAGE_SIZE]
+        last = page[-1]
+        next_cursor = f"{last.days_of_cover!r}_{last.product_id}"
+
+    return render(request, 'pos/reorder_list.html', {
+        'suggestions': page,
+        'no_demand_cover': reorder.NO_DEMAND_COVER,
+        'next_query': urlencode({'after': next_cursor}) if next_cursor else '',
+    })
+
+
+@require_POST
+def reorder_refresh(request):
+    job = jobs.enqueue('refresh_reorder', full=bool(request.POST.get('full')))
+    messages.success(request, "Reorder suggestions refresh queued.")
+    return redirect('job_detail', pk=job.pk)
+
+# ---------- Documents ----------
+def document(request, kind, pk):
+    file_format = request.GET.get('format', 'html')
+    if file_format not in documents.FORMATS:
+        raise Http404("Unknown document format.")
+    try:
+        path = documents.path_for(kind, documents.gather(kind, pk), file_format)
+    except documents.DocumentNotFound as exc:
+        raise Http404(str(exc))
+    if not os.path.exists(path):
+        # Rendered off the request path; the job page links back here once done.
+        # Reloading the page while it renders joins the job already queued.
+        job = jobs.enqueue_once('render_document', kind=kind, pk=pk, file_format=file_format)
+        messages.info(request, f"The {kind} is being prepared.")
+        return redirect('job_detail', pk=job.pk)
+    extension, content_type = documents.FORMATS[file_format]
+    return FileResponse(
+        open(path, 'rb'), content_type=content_type,
+        as_attachment=file_format != 'html', filename=f"{kind}-{pk}.{extension}",
     )
 
-    # Low stock products
-    low_stock = Product.objects.filter(stock_quantity__lte=F('reorder_level')).count()
 
-    context = {
-        'daily': daily,
-        'weekly': weekly,
-        'monthly': monthly,
-        'yearly': yearly,
-        'low_stock': low_stock,
-    }
+@require_POST
+def statements_job(request):
+    file_format = 'escpos' if request.POST.get('format') == 'escpos' else 'html'
+    job = jobs.enqueue('render_statements', file_format=file_format)
+    messages.success(request, "Statements for every debtor queued.")
+    return redirect('job_detail', pk=job.pk)
 
+# ---------- Analytics ----------
+def analytics(request):
+    # Sales & profits from the daily rollup, low stock count; both cached
+    # until a sale, stock-in or product edit changes them.
+    context = caching.dashboard()
+    context['cache_stats'] = caching.stats()
     return render(request, 'pos/analytics.html', context)
 
+
+def analytics_cache_stats(request):
+    return JsonResponse(caching.stats())
+
+
+def analytics_series(request):
+    try:
+        start, end = timeseries.parse_range(request.GET.get('start'), request.GET.get('end'))
+        data = timeseries.series(
+            start, end,
+            bucket=request.GET.get('bucket', 'day'),
+            split=request.GET.get('split') or None,
+            top=int(request.GET.get('top', timeseries.TOP_PRODUCTS)),
+            branch=_as_branch(request.GET['branch']) if request.GET.get('branch') else None,
+        )
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse(data)
+
+
+@require_POST
+def analytics_rebuild(request):
+    job = jobs.enqueue('revalue' if request.POST.get('revalue') else 'rebuild_sales_summary')
+    messages.success(request, "Analytics recompute queued.")
+    return redirect('job_detail', pk=job.pk)
+
+# ---------- Background Jobs ----------
+def job_detail(request, pk):
+    job = get_object_or_404(Job, pk=pk)
+    return render(request, 'pos/job_detail.html', {'job': job, 'status': jobs.status(job)})
+
+
+def job_status(request, pk):
+    return JsonResponse(jobs.status(get_object_or_404(Job, pk=pk)))
+
+
+def job_download(request, pk):
+    job = get_object_or_404(Job, pk=pk, status='SUCCEEDED')
+    name = (job.result or {}).get('file')
+    if not name:
+        raise Http404("This job has no file.")
+    root = os.path.realpath(settings.POS_JOB_DIR)
+    path = os.path.realpath(os.path.join(root, name))
+    if not path.startswith(root + os.sep) or not os.path.exists(path):
+        raise Http404("The job file is gone.")
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=os.path.basename(path))
+
+# ---------- Low Stock Feed ----------
+LOW_STOCK_FEED_LIMIT = 100
+
+
+def _low_stock_rows():
+    return caching.low_stock_products().order_by('name').values(
+        'id', 'name', 'sku', 'stock_quantity', 'reorder_level'
+    )[:LOW_STOCK_FEED_LIMIT]
+
+
+def low_stock_feed(request):
+    return JsonResponse({
+        'count': caching.low_stock_products().count(),
+        'results': list(_low_stock_rows()),
+    })
+
+# ---------- Async Read Views ----------
+# The same pages for an ASGI server (uvicorn): database waits go through the
+# async ORM, so the event loop keeps serving other requests meanwhile.
+
+async def product_list_async(request):
+    products, as_of = _product_list_query(request)
+    products = [product async for product in products]
+    # Rendering the rows reads and writes the fragment cache.
+    context = await sync_to_async(_product_list_context)(products, as_of)
+    return render(request, 'pos/product_list.html', context)
+
+
+async def analytics_async(request):
+    context, cache_stats = await asyncio.gather(caching.adashboard(), caching.astats())
+    context['cache_stats'] = cache_stats
+    return render(request, 'pos/analytics.html', context)
+
+
+async def low_stock_feed_async(request):
+    count, rows = await asyncio.gather(
+        caching.low_stock_products().acount(),
+        _alist(_low_stock_rows()),
+    )
+    return JsonResponse({'count': count, 'results': rows})
+
+
+async def _alist(queryset):
+    return [row async for row in queryset]
+
+# ---------- Request Metrics ----------
+@staff_member_required
+def metrics_dashboard(request):
+    return render(request, 'pos/metrics.html', {'views': metrics.registry.summary()})
+
+
+def metrics_prometheus(request):
+    if not settings.POS_METRICS_PROMETHEUS:
+        raise Http404("Prometheus export is disabled.")
+    if not (request.user.is_staff or _bearer_matches(request, settings.POS_METRICS_TOKEN)):
+        return HttpResponse("Staff login or the scrape token required.\n", status=403, content_type='text/plain')
+    return HttpResponse(metrics.prometheus_text(), content_type='text/plain; version=0.0.4')
+
 def product_edit(request, pk):
     product = get_object_or_404(Product, pk=pk)
     if request.method == 'POST':
         form = ProductForm(request.POST, instance=product)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                form.save()
+            caching.invalidate_stock([product.pk])
+            messages.success(request, "Product updated successfully")
             return redirect('product_list')
     else:
         form = ProductForm(instance=product)